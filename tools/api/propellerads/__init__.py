@@ -1,6 +1,7 @@
 import logging
 from datetime import timedelta, datetime
 import json
+from multiprocessing.pool import ThreadPool
 import requests
 
 
@@ -134,16 +135,20 @@ class PropellerAds(object):
         while page < total_pages:
             page = page + 1
 
-            target_url = "%s%s?%s&page=%s" % (self.REST_URL, urlpath, query, page)
-            self.log.debug("Request: %s", target_url)
-
-            items, page, total_pages = self._list_error_or_result(requests.request("GET", target_url, headers=headers))
-
-            self.log.info("..page #%s", page)
+            items, page, total_pages = self._list_page(urlpath, headers, query, page)
 
             for item in items:
                 yield item
 
+    def _list_page(self, urlpath, headers, query, page):
+        target_url = "%s%s?%s&page=%s" % (self.REST_URL, urlpath, query, page)
+        self.log.debug("Request: %s", target_url)
+
+        items, page, total_pages = self._list_error_or_result(requests.request("GET", target_url, headers=headers))
+
+        self.log.info("..page #%s", page)
+        return items, page, total_pages
+
     def campaigns_all(self, name="campaigns", urlpath='/adv/campaigns', querystring="", per_page=50):
         return self.list_query(name=name,
                                urlpath=urlpath,
@@ -217,3 +222,37 @@ class PropellerAds(object):
                                headers=self._auth_headers(),
                                querystring=querystring,
                                per_page=per_page)
+
+
+class ConcurrentPropellerAds(PropellerAds):
+    '''
+    PropellerAds client that fetches pages of lists concurrently.
+
+    The first page is requested alone to get `total_pages`, then the remaining pages
+    are requested by at most `concurrency` threads at once. Items are still yielded in page order.
+    '''
+    def __init__(self, username, password, logger=logging.getLogger('propellerads'), concurrency=8):
+        super(ConcurrentPropellerAds, self).__init__(username, password, logger=logger)
+        self.concurrency = concurrency
+
+    def list_query(self, name, urlpath, headers, querystring="", per_page=50):
+        self.log.info("Requesting list of %s", name)
+
+        query = "%s%s%s" % (querystring, ("" if querystring == "" else "&"), "page_size=%s" % per_page)
+
+        items, page, total_pages = self._list_page(urlpath, headers, query, 1)
+        for item in items:
+            yield item
+
+        if total_pages <= 1:
+            return
+
+        self.log.info("Requesting %s more pages of %s by %s threads", total_pages - 1, name, self.concurrency)
+
+        pool = ThreadPool(min(self.concurrency, total_pages - 1))
+        try:
+            for items, page, _ in pool.imap(lambda page: self._list_page(urlpath, headers, query, page), xrange(2, total_pages + 1)):
+                for item in items:
+                    yield item
+        finally:
+            pool.terminate()
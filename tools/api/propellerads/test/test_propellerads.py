@@ -0,0 +1,130 @@
+import unittest
+import json
+import time
+import threading
+from datetime import datetime
+from urlparse import urlparse, parse_qs
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from api.propellerads import PropellerAds, ConcurrentPropellerAds
+
+
+TOTAL_ITEMS = 21
+PAGE_SIZE = 3
+TOTAL_PAGES = TOTAL_ITEMS / PAGE_SIZE
+
+
+class FakeSSPHandler(BaseHTTPRequestHandler):
+    ''' Local fake of PropellerAds SSP API: authorization and paginated statistics '''
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.respond({'api_token': 'token', 'expires_in': 3600})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        args = parse_qs(url.query)
+
+        if self.headers.get('Authorization') != 'Bearer token':
+            return self.respond({'message': 'Unauthorized', 'errors': ['Invalid token']})
+
+        page, page_size = int(args['page'][0]), int(args['page_size'][0])
+        total_pages = (TOTAL_ITEMS + page_size - 1) / page_size
+        self.server.track(page)
+
+        # first pages are the slowest ones, so they're finished last when fetched concurrently
+        time.sleep(0.01 * (total_pages - page))
+
+        items = [{'zone_id': n} for n in range((page - 1) * page_size, min(page * page_size, TOTAL_ITEMS))]
+        self.respond({'result': items,
+                      'meta': {'total_items': TOTAL_ITEMS,
+                               'total_pages': total_pages,
+                               'page_size': page_size,
+                               'page': page}})
+
+    def respond(self, obj):
+        body = json.dumps(obj)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeSSPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, *args):
+        HTTPServer.__init__(self, *args)
+        self._lock = threading.Lock()
+        self.in_flight = self.max_in_flight = 0
+        self.pages = []
+
+    def track(self, page):
+        with self._lock:
+            self.pages.append(page)
+
+
+class TrackingHandler(FakeSSPHandler):
+    def do_GET(self):
+        with self.server._lock:
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+        try:
+            FakeSSPHandler.do_GET(self)
+        finally:
+            with self.server._lock:
+                self.server.in_flight -= 1
+
+
+class PropellerAdsPaginationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeSSPServer(('127.0.0.1', 0), TrackingHandler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.rest_url = 'http://127.0.0.1:%s' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def create_api(self, cls, **kwargs):
+        api = cls('user', 'password', **kwargs)
+        api.REST_URL = self.rest_url
+        return api.authorized()
+
+    def statistics(self, api):
+        return list(api.get_statistics(date_from=datetime(2019, 3, 1), date_to=datetime(2019, 3, 30),
+                                       group_by=(PropellerAds.GroupBy.ZONE_ID,), per_page=PAGE_SIZE))
+
+    def test_serial_pagination(self):
+        items = self.statistics(self.create_api(PropellerAds))
+        self.assertEqual(map(lambda item: item['zone_id'], items), range(TOTAL_ITEMS))
+        self.assertEqual(self.server.max_in_flight, 1)
+
+    def test_concurrent_pagination_keeps_order(self):
+        items = self.statistics(self.create_api(ConcurrentPropellerAds, concurrency=3))
+        self.assertEqual(map(lambda item: item['zone_id'], items), range(TOTAL_ITEMS))
+        self.assertEqual(sorted(self.server.pages), range(1, TOTAL_PAGES + 1), "should request every page once")
+        self.assertEqual(self.server.pages[0], 1, "should request the first page alone")
+        self.assertTrue(1 < self.server.max_in_flight <= 3, "should respect concurrency limit")
+
+    def test_concurrent_single_page(self):
+        api = self.create_api(ConcurrentPropellerAds, concurrency=3)
+        items = list(api.list_query(name='single page', urlpath='/adv/statistics', headers=api._auth_headers(),
+                                    per_page=TOTAL_ITEMS))
+        self.assertEqual(len(items), TOTAL_ITEMS)
+        self.assertEqual(self.server.pages, [1])
+
+    def test_concurrent_pagination_raises_api_errors(self):
+        api = self.create_api(ConcurrentPropellerAds)
+        with self.assertRaises(Exception):
+            list(api.list_query(name='statistics', urlpath='/adv/statistics', headers={'Authorization': 'Bearer wrong'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+'''
+Compares memory and time needed to hold hits read as `DataObject`s and as compact records.
+
+Hits are parsed from JSON the same way `Connection.multiread` does, so Redis isn't needed.
+Every mode is measured in a fresh process by the growth of its peak resident memory.
+
+Usage example: python -m benchmarks.compact
+
+Number of hits could be changed with BENCH_HITS environmental variable.
+'''
+import os
+import sys
+import json
+import time
+import resource
+from multiprocessing import Pool
+
+from prettytable import PrettyTable
+
+from data.framework.base import compact_class
+from data.model import Hit
+
+from benchmarks.multiread import SAMPLE_HIT
+
+
+HITS = int(os.environ.get('BENCH_HITS', 1000000))
+
+
+def make_hit_json(i):
+    # unique values per hit, as in real data
+    return SAMPLE_HIT.replace('121507283048865792', str(121507283048865792 + i)).replace('"c05s"', '"c%s"' % i)
+
+
+def read_hits(compact):
+    factory = compact_class(Hit) if compact else Hit
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.time()
+    hits = [factory(None, "Hits:[%s]" % i, **json.loads(make_hit_json(i))) for i in xrange(HITS)]
+    elapsed = time.time() - started
+
+    # touching the fields used by import
+    for hit in hits:
+        hit.cost, hit.time, hit.dimensions['zone']
+
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return (rss_after - rss_before) / 1024.0, elapsed
+
+
+if __name__ == '__main__':
+    t = PrettyTable()
+    t.field_names = ['Hits', 'Mode', 'Memory, MB', 'Bytes/hit', 'Seconds']
+
+    for compact in (False, True):
+        pool = Pool(processes=1)
+        memory, elapsed = pool.apply(read_hits, (compact,))
+        pool.close()
+        pool.join()
+
+        mode = 'compact records' if compact else 'DataObject'
+        sys.stderr.write("%s hits, %s: %.1f MB, %.3f sec\n" % (HITS, mode, memory, elapsed))
+        t.add_row([HITS, mode, '%.1f' % memory, '%.0f' % (memory * 1024 * 1024 / HITS), '%.3f' % elapsed])
+
+    print t
@@ -0,0 +1,83 @@
+'''
+Compares `MultiDimensionDistribution` (tree of dicts) with `ArrayDistribution` (flat arrays)
+trained on vectors like those of offer models: zone, connection type, language and conversion.
+
+Every model is measured in a fresh process by the growth of its peak resident memory.
+
+Usage example: python -m benchmarks.distribution
+
+Number of vectors, zones and sampled vectors could be changed with BENCH_VECTORS, BENCH_ZONES
+and BENCH_SAMPLES environmental variables.
+'''
+import os
+import sys
+import time
+import random
+import resource
+from multiprocessing import Pool
+
+from prettytable import PrettyTable
+
+from testtools.models import MultiDimensionDistribution, ArrayDistribution
+
+
+VECTORS = int(os.environ.get('BENCH_VECTORS', 200000))
+ZONES = int(os.environ.get('BENCH_ZONES', 30000))
+SAMPLES = int(os.environ.get('BENCH_SAMPLES', 20000))
+
+
+def make_vectors(count, seed=0):
+    rng = random.Random(seed)
+    zones = [str(800000 + i) for i in xrange(ZONES)]
+    for i in xrange(count):
+        yield [rng.choice(zones),
+               rng.choice(('BROADBAND', 'MOBILE')),
+               rng.choice(('en-GB', 'en-US', 'ru-RU', 'el-GR', 'de-DE')),
+               'conv' if rng.random() < 0.01 else 'noconv']
+
+
+def timed(func):
+    started = time.time()
+    result = func()
+    return result, time.time() - started
+
+
+def measure(array_backed):
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if array_backed:
+        model = ArrayDistribution()
+        _, eat_elapsed = timed(lambda: model.eat_many(make_vectors(VECTORS)))
+    else:
+        model = MultiDimensionDistribution()
+        _, eat_elapsed = timed(lambda: [model.eat(vec) for vec in make_vectors(VECTORS)])
+
+    memory = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024.0
+
+    _, sample_elapsed = timed(lambda: [model.random_vec() for i in xrange(SAMPLES)])
+
+    queries = list(make_vectors(SAMPLES, seed=1))
+    if array_backed:
+        _, probability_elapsed = timed(lambda: model.probabilities(queries))
+    else:
+        _, probability_elapsed = timed(lambda: [model.probability(vec) for vec in queries])
+
+    return memory, eat_elapsed, sample_elapsed, probability_elapsed
+
+
+if __name__ == '__main__':
+    t = PrettyTable()
+    t.field_names = ['Model', 'Memory, MB', 'Eat, sec', 'Random vectors, sec', 'Probabilities, sec']
+
+    for array_backed in (False, True):
+        pool = Pool(processes=1)
+        memory, eat_elapsed, sample_elapsed, probability_elapsed = pool.apply(measure, (array_backed,))
+        pool.close()
+        pool.join()
+
+        mode = 'ArrayDistribution' if array_backed else 'MultiDimensionDistribution'
+        sys.stderr.write("%s vectors, %s zones, %s: %.1f MB, eat %.3f sec, %s random vectors %.3f sec\n" % (
+            VECTORS, ZONES, mode, memory, eat_elapsed, SAMPLES, sample_elapsed))
+        t.add_row([mode, '%.1f' % memory, '%.3f' % eat_elapsed, '%.3f' % sample_elapsed, '%.3f' % probability_elapsed])
+
+    print t
@@ -0,0 +1,112 @@
+'''
+Compares slice report queries over hits with plain `String` and typed (`LowCardinality`) dimensions.
+
+The same generated hits are written into two tables of the `bench` database,
+then a slice report is run against each of them.
+
+Usage example: BENCH_CLICKHOUSE_URL=http://localhost:8123/ python -m benchmarks.low_cardinality
+
+Number of hits and queries could be changed with BENCH_ROWS and BENCH_QUERIES environmental variables.
+
+WARNING: the `bench` database on BENCH_CLICKHOUSE_URL is dropped!
+'''
+import os
+import sys
+import time
+import random
+from datetime import datetime
+from decimal import Decimal
+
+from prettytable import PrettyTable
+
+from data.framework.reporting import Database
+from data.framework.types import Type
+from data.model import Hit
+
+
+ROWS = int(os.environ.get('BENCH_ROWS', 5000000))
+QUERIES = int(os.environ.get('BENCH_QUERIES', 10))
+
+STATIC_COLUMNS = (('id', Type.Int64()),
+                  ('date_added', Type.Date()),
+                  ('campaign', Type.Int64()),
+                  ('destination', Type.Int64()),
+                  ('click_id', Type.String()),
+                  ('cost', Type.Decimal64(5)),
+                  ('time', Type.DateTime()))
+
+DIMENSIONS = {
+    'useragent': ['Mozilla/5.0 (Linux; Android %s.0.0; SM-A%s) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/72.0.3626.%s Mobile Safari/537.36' % (v, m, b)
+                  for v in (6, 7, 8, 9) for m in range(700, 760) for b in (105, 121)],
+    'os': ['Android', 'iOS', 'Windows', 'Mac OS X', 'Linux'],
+    'os_version': ['6.0.1', '7.0', '8.0.0', '8.1.0', '9', '12.1.4'],
+    'connection_type': ['BROADBAND', 'MOBILE'],
+    'langcode': ['en-GB', 'en-US', 'ru-RU', 'el-GR', 'de-DE', 'pt-BR', 'es-ES'],
+    'ua_name': ['Chrome', 'Safari', 'Firefox', 'Opera', 'Samsung Browser'],
+    'zone': [str(847358 + i) for i in xrange(3000)],
+}
+
+SLICE_REPORT = '''
+SELECT dim_zone, dim_connection_type, dim_os, count() AS Clicks, sum(cost) AS Cost
+FROM bench.{table}
+WHERE dim_useragent != 'ApacheBench/2.3'
+GROUP BY dim_zone, dim_connection_type, dim_os
+ORDER BY Clicks DESC
+LIMIT 100
+'''
+
+
+def columns(typed):
+    dimension_type = Hit.dimension_type if typed else lambda dimension: Type.String()
+    return STATIC_COLUMNS + tuple(("dim_%s" % d, dimension_type(d)) for d in sorted(DIMENSIONS.keys()))
+
+
+def make_rows(count):
+    now = datetime(2019, 2, 18, 23, 38, 32)
+    dimensions = sorted(DIMENSIONS.keys())
+    rng = random.Random(0)
+    for i in xrange(count):
+        yield [i, now, 0, i % 12, str(121507283048865792 + i), Decimal('0.00085'), now] + \
+              [rng.choice(DIMENSIONS[d]) for d in dimensions]
+
+
+def timed(func):
+    started = time.time()
+    result = func()
+    return result, time.time() - started
+
+
+if __name__ == '__main__':
+    clickhouse_url = os.environ.get('BENCH_CLICKHOUSE_URL', None)
+    if not clickhouse_url:
+        raise Exception("\n\nSet the 'BENCH_CLICKHOUSE_URL' environmental variable to the URL of local Clickhouse instance. Example: http://127.0.0.1:8123/\n")
+        sys.exit(1)
+
+    db = Database(url=clickhouse_url, db='bench', data_read_timeout=600).connected()
+
+    t = PrettyTable()
+    t.field_names = ['Dimensions', 'Insert, sec', 'Stored, MB', 'Slice report, rows', 'Slice report, sec (best)', 'Slice report, sec (mean)']
+
+    for typed, table in ((False, 'hits_string'), (True, 'hits_low_cardinality')):
+        table_columns = columns(typed)
+        db.write(db.sql.create_table(table=table, date_column='date_added', index=('id',), columns=table_columns))
+
+        result, insert_elapsed = timed(lambda: db.write_stream(table=table, values=make_rows(ROWS), columns=table_columns))
+        db.write("OPTIMIZE TABLE bench.{table} FINAL;".format(table=table))
+
+        stored_bytes = db.read_columns(sql="SELECT sum(data_compressed_bytes) AS stored FROM system.parts "
+                                           "WHERE active AND database = 'bench' AND table = '{table}'".format(table=table))['stored'][0]
+
+        timings = []
+        for _ in xrange(QUERIES):
+            report, elapsed = timed(lambda: db.read_columns(sql=SLICE_REPORT.format(table=table)))
+            timings.append(elapsed)
+        report_rows = len(report['Clicks'])
+
+        mode = 'LowCardinality' if typed else 'String'
+        sys.stderr.write("%s hits, %s dimensions: insert %.3f sec, slice report %.3f sec\n" % (ROWS, mode, insert_elapsed, min(timings)))
+        t.add_row([mode, '%.3f' % insert_elapsed, '%.1f' % (stored_bytes / 1024.0 / 1024.0), report_rows,
+                   '%.3f' % min(timings), '%.3f' % (sum(timings) / len(timings))])
+
+    db.drop()
+    print t
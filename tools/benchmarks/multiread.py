@@ -0,0 +1,63 @@
+'''
+Compares per-key and batched reads of `Connection.multiread` against local `redis-server`.
+
+Usage example: BENCH_REDIS_URL=redis://localhost:6379/15 python -m benchmarks.multiread
+
+WARNING: the database selected by BENCH_REDIS_URL is flushed!
+'''
+import os
+import sys
+import time
+from itertools import repeat
+
+from redis import Redis
+from prettytable import PrettyTable
+
+from data.framework.bus import Connection
+from data.model import ENTITIES
+
+
+SIZES = (10000, 100000, 1000000)
+BATCH_SIZES = (100, 1000, 10000)
+
+SAMPLE_HIT = '{"time":{"secs_since_epoch":1550533112,"nanos_since_epoch":207362916},"campaign_id":"Campaign:[0]","destination_id":"Offer:[2]","click_id":"121507283048865792","cost":{"value":85,"currency":"USD"},"dimensions":{"useragent":"Mozilla/5.0 (Linux; Android 8.0.0; SM-A750FN) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/72.0.3626.105 Mobile Safari/537.36","ua_category":"smartphone","external_id":"c05s","os":"Android","os_version":"8.0.0","connection_type":"BROADBAND","langcode":"en-GB","ua_type":"browser","keywords":"","language":"en-GB,en-US;q=0.9,en;q=0.8","ua_vendor":"Google","zone":"847358","ip":"127.0.0.1","creative_id":"","ua_name":"Chrome","ua_version":"72.0.3626.105"}}'
+
+
+def seed_hits(redis, count, chunk=10000):
+    redis.flushdb()
+    with Connection(redis=redis, entities_meta=ENTITIES).bulk_writer(batch_size=chunk) as writer:
+        writer.extend('Hits', repeat(SAMPLE_HIT, count))
+
+
+def timed_read(bus, batch_size=None):
+    started = time.time()
+    count = 0
+    for hit in bus.multiread('Hits', start=0, batch_size=batch_size):
+        count += 1
+    return count, time.time() - started
+
+
+if __name__ == '__main__':
+    redis_url = os.environ.get('BENCH_REDIS_URL', None)
+    if not redis_url:
+        raise Exception("\n\nSet the 'BENCH_REDIS_URL' environmental variable to the URL of local Redis instance. Example: redis://127.0.0.1:6379/15\n")
+        sys.exit(1)
+
+    redis = Redis.from_url(redis_url)
+    bus = Connection(redis=redis, entities_meta=ENTITIES)
+
+    t = PrettyTable()
+    t.field_names = ['Hits', 'Mode', 'Seconds', 'Hits/sec']
+
+    for size in SIZES:
+        seed_hits(redis, size)
+
+        for batch_size in (None,) + BATCH_SIZES:
+            count, elapsed = timed_read(bus, batch_size=batch_size)
+            assert count == size
+            mode = 'GET per key' if batch_size is None else 'MGET x %s' % batch_size
+            sys.stderr.write("%s hits, %s: %.3f sec\n" % (size, mode, elapsed))
+            t.add_row([size, mode, '%.3f' % elapsed, '%.0f' % (count / elapsed)])
+
+    redis.flushdb()
+    print t
@@ -0,0 +1,94 @@
+'''
+Compares many small queries issued by `Database` with and without kept alive connections.
+
+Queries are sent to a local HTTP/1.1 stand-in that answers like Clickhouse does to `SELECT 1`,
+so only the connection handling is measured.
+
+Usage example: python -m benchmarks.pooling
+
+Number of queries could be changed with BENCH_QUERIES environmental variable.
+'''
+import os
+import sys
+import time
+import threading
+from multiprocessing.pool import ThreadPool
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+from prettytable import PrettyTable
+
+from data.framework.reporting import Database
+
+
+QUERIES = int(os.environ.get('BENCH_QUERIES', 5000))
+THREADS = (1, 8)
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1  # send response with a single write, as real servers do
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        body = '1\n'
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/tab-separated-values; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_stand_in():
+    server = StandInServer(('127.0.0.1', 0), StandInHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def timed_queries(db, threads):
+    query = lambda i: db.read(sql="SELECT 1;", simple=True)
+
+    started = time.time()
+    if threads == 1:
+        map(query, xrange(QUERIES))
+    else:
+        pool = ThreadPool(threads)
+        pool.map(query, xrange(QUERIES))
+        pool.close()
+    return time.time() - started
+
+
+if __name__ == '__main__':
+    server = start_stand_in()
+    url = 'http://127.0.0.1:%s/' % server.server_port
+
+    t = PrettyTable()
+    t.field_names = ['Queries', 'Threads', 'Mode', 'Seconds', 'Queries/sec']
+
+    for threads in THREADS:
+        for keep_alive in (False, True):
+            db = Database(url=url, db='bench', keep_alive=keep_alive, pool_size=max(THREADS))
+            elapsed = timed_queries(db, threads)
+            db.close()
+
+            mode = 'pooled keep-alive' if keep_alive else 'connection per query'
+            sys.stderr.write("%s queries, %s threads, %s: %.3f sec\n" % (QUERIES, threads, mode, elapsed))
+            t.add_row([QUERIES, threads, mode, '%.3f' % elapsed, '%.0f' % (QUERIES / elapsed)])
+
+    server.shutdown()
+    print t
@@ -0,0 +1,78 @@
+'''
+Compares encoding of `Hit` objects into db values with and without the row encoder cache.
+Linked campaign and offer are read from local `redis-server`.
+
+Usage example: BENCH_REDIS_URL=redis://localhost:6379/15 python -m benchmarks.row_encoder
+
+Number of encoded hits could be changed with BENCH_HITS environmental variable.
+
+WARNING: the database selected by BENCH_REDIS_URL is flushed!
+'''
+import os
+import sys
+import json
+import time
+
+from redis import Redis
+from prettytable import PrettyTable
+
+from data.framework.bus import Connection
+from data.model import ENTITIES, Hit, safe_dynamic_fields
+from benchmarks.multiread import SAMPLE_HIT
+
+
+HITS = int(os.environ.get('BENCH_HITS', 1000000))
+
+SAMPLE_CAMPAIGN = '{"name":"Test campaign","alias":"testalias","offers":["Offer:[0]"],"paused_offers":[],"optimize":false,"optimization_paused":false,"hit_limit_for_optimization":50,"slicing_attrs":[]}'
+SAMPLE_OFFER = '{"name":"Test offer","url_template":"https://example.com/?pci={external_id}&ppi={zone}"}'
+
+
+def seed_linked(redis):
+    redis.flushdb()
+    redis.set("Campaign:[0]", SAMPLE_CAMPAIGN)
+    redis.set("Campaign:_counter", 1)
+    for i in xrange(3):
+        redis.set("Offer:[%s]" % i, SAMPLE_OFFER)
+    redis.set("Offer:_counter", 3)
+
+
+def make_hits(bus, count):
+    hit_fields = json.loads(SAMPLE_HIT)
+    return (Hit(bus, "Hits:[%s]" % i, **hit_fields) for i in xrange(count))
+
+
+def timed_encoding(hits, columns, cached=True):
+    started = time.time()
+    if cached:
+        for hit in hits:
+            hit.into_db_values(columns)
+    else:
+        for hit in hits:
+            hit.into_db_values_by_row(columns)
+    return time.time() - started
+
+
+if __name__ == '__main__':
+    redis_url = os.environ.get('BENCH_REDIS_URL', None)
+    if not redis_url:
+        raise Exception("\n\nSet the 'BENCH_REDIS_URL' environmental variable to the URL of local Redis instance. Example: redis://127.0.0.1:6379/15\n")
+        sys.exit(1)
+
+    redis = Redis.from_url(redis_url)
+    bus = Connection(redis=redis, entities_meta=ENTITIES)
+    seed_linked(redis)
+
+    sample = next(make_hits(bus, 1))
+    columns = safe_dynamic_fields(sample.into_db_columns())
+
+    t = PrettyTable()
+    t.field_names = ['Hits', 'Mode', 'Seconds', 'Hits/sec']
+
+    for cached in (False, True):
+        elapsed = timed_encoding(make_hits(bus, HITS), columns, cached=cached)
+        mode = 'row encoder cache' if cached else 'row by row'
+        sys.stderr.write("%s hits, %s: %.3f sec\n" % (HITS, mode, elapsed))
+        t.add_row([HITS, mode, '%.3f' % elapsed, '%.0f' % (HITS / elapsed)])
+
+    redis.flushdb()
+    print t
@@ -0,0 +1,110 @@
+'''
+Compares throughput of TabSeparated and RowBinary formats for a hits-like schema.
+
+Encoding and decoding are measured locally. If BENCH_CLICKHOUSE_URL is set,
+rows are also written into and read back from Clickhouse in both formats.
+
+Usage example: BENCH_CLICKHOUSE_URL=http://localhost:8123/ python -m benchmarks.rowbinary
+
+Number of rows could be changed with BENCH_ROWS environmental variable.
+
+WARNING: the `bench` database on BENCH_CLICKHOUSE_URL is dropped!
+'''
+import os
+import sys
+import time
+from datetime import datetime
+from decimal import Decimal
+
+from prettytable import PrettyTable
+
+from data.framework.reporting import Database, SQLGenerator, TAB_SEPARATED, ROW_BINARY
+from data.framework.rowbinary import RowBinary
+from data.framework.types import Type, ColumnsDef
+
+
+ROWS = int(os.environ.get('BENCH_ROWS', 1000000))
+
+COLUMNS = (('id', Type.Int64()),
+           ('date_added', Type.Date()),
+           ('campaign', Type.Int64()),
+           ('destination', Type.Int64()),
+           ('click_id', Type.String()),
+           ('cost', Type.Decimal64(5)),
+           ('time', Type.DateTime()),
+           ('dim_useragent', Type.String()),
+           ('dim_zone', Type.String()))
+
+
+def make_rows(count):
+    now = datetime(2019, 2, 18, 23, 38, 32)
+    useragent = 'Mozilla/5.0 (Linux; Android 8.0.0; SM-A750FN) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/72.0.3626.105 Mobile Safari/537.36'
+    return ([i, now, 0, i % 12, '121507283048865792', Decimal('0.00085'), now, useragent, str(i % 1000)] for i in xrange(count))
+
+
+def timed(func):
+    started = time.time()
+    result = func()
+    return result, time.time() - started
+
+
+def encode_tab_separated():
+    return list(SQLGenerator('bench').insert_values_stream(make_rows(ROWS), COLUMNS))
+
+def encode_row_binary():
+    return list(RowBinary(COLUMNS).encode_rows(make_rows(ROWS)))
+
+def decode_tab_separated(lines):
+    factories = ColumnsDef.column_type_factories(COLUMNS)
+    count = 0
+    for line in lines:
+        values = [f.from_db_value(v) for f, v in zip(factories, line.decode('utf-8').rstrip('\n').split('\t'))]
+        count += 1
+    return count
+
+def decode_row_binary(rows):
+    count = 0
+    for values in RowBinary(COLUMNS).decode_rows(rows):
+        count += 1
+    return count
+
+
+def bench_clickhouse(url, t):
+    for data_format in (TAB_SEPARATED, ROW_BINARY):
+        db = Database(url=url, db='bench', data_format=data_format, data_read_timeout=600).connected()
+        db.write(db.sql.create_table(table='hits', date_column='date_added', index=('id',), columns=COLUMNS))
+
+        result, elapsed = timed(lambda: db.write_stream(table='hits', values=make_rows(ROWS), columns=COLUMNS))
+        sys.stderr.write("Clickhouse insert, %s: %.3f sec\n" % (data_format, elapsed))
+        t.add_row(['Clickhouse insert', data_format, '%.3f' % elapsed, '%.0f' % (ROWS / elapsed)])
+
+        count, elapsed = timed(lambda: sum(1 for row in db.read(sql="SELECT * FROM bench.hits", columns=COLUMNS, stream=True)))
+        assert count == ROWS
+        sys.stderr.write("Clickhouse select, %s: %.3f sec\n" % (data_format, elapsed))
+        t.add_row(['Clickhouse select', data_format, '%.3f' % elapsed, '%.0f' % (ROWS / elapsed)])
+
+        db.drop()
+
+
+if __name__ == '__main__':
+    t = PrettyTable()
+    t.field_names = ['Operation', 'Format', 'Seconds', 'Rows/sec']
+
+    for data_format, encode, decode in ((TAB_SEPARATED, encode_tab_separated, decode_tab_separated),
+                                        (ROW_BINARY, encode_row_binary, decode_row_binary)):
+        encoded, elapsed = timed(encode)
+        sys.stderr.write("Encoding, %s: %.3f sec\n" % (data_format, elapsed))
+        t.add_row(['Encoding', data_format, '%.3f' % elapsed, '%.0f' % (ROWS / elapsed)])
+
+        count, elapsed = timed(lambda: decode(encoded))
+        assert count == ROWS
+        sys.stderr.write("Decoding, %s: %.3f sec\n" % (data_format, elapsed))
+        t.add_row(['Decoding', data_format, '%.3f' % elapsed, '%.0f' % (ROWS / elapsed)])
+
+        del encoded
+
+    clickhouse_url = os.environ.get('BENCH_CLICKHOUSE_URL', None)
+    if clickhouse_url:
+        bench_clickhouse(clickhouse_url, t)
+
+    print t
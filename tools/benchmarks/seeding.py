@@ -0,0 +1,69 @@
+'''
+Compares seeding of synthetic hits into local `redis-server` with `SET` per key and with `BulkWriter`.
+
+Usage example: BENCH_REDIS_URL=redis://localhost:6379/15 python -m benchmarks.seeding
+
+Number of hits could be changed with BENCH_HITS environmental variable, `SET` per key is
+measured on at most BENCH_PER_KEY_HITS of them.
+
+WARNING: the database selected by BENCH_REDIS_URL is flushed!
+'''
+import os
+import sys
+import time
+
+from redis import Redis
+from prettytable import PrettyTable
+
+from data.framework.bus import Connection
+from data.model import ENTITIES
+from testtools.seeding import Seed, synthetic_hits
+
+
+HITS = int(os.environ.get('BENCH_HITS', 1000000))
+PER_KEY_HITS = int(os.environ.get('BENCH_PER_KEY_HITS', 100000))
+
+
+def seed_by_key(redis, hits):
+    count = 0
+    for i, hit in enumerate(hits):
+        redis.set("Hits:[%s]" % i, hit)
+        count += 1
+    redis.set("Hits:_counter", count)
+
+
+def seed_bulk(bus, hits):
+    with Seed(bus.bulk_writer()) as seed:
+        seed.create_hits(hits)
+
+
+def timed(func):
+    started = time.time()
+    func()
+    return time.time() - started
+
+
+if __name__ == '__main__':
+    redis_url = os.environ.get('BENCH_REDIS_URL', None)
+    if not redis_url:
+        raise Exception("\n\nSet the 'BENCH_REDIS_URL' environmental variable to the URL of local Redis instance. Example: redis://127.0.0.1:6379/15\n")
+        sys.exit(1)
+
+    redis = Redis.from_url(redis_url)
+    bus = Connection(redis=redis, entities_meta=ENTITIES)
+
+    t = PrettyTable()
+    t.field_names = ['Hits', 'Mode', 'Seconds', 'Hits/sec']
+
+    for mode, count, seed in (('SET per key', min(HITS, PER_KEY_HITS), lambda hits: seed_by_key(redis, hits)),
+                              ('BulkWriter', HITS, lambda hits: seed_bulk(bus, hits))):
+        redis.flushdb()
+        hits = list(synthetic_hits(count))  # generation of hits isn't measured
+        elapsed = timed(lambda: seed(hits))
+        assert bus.count('Hits') == count
+
+        sys.stderr.write("%s hits, %s: %.3f sec\n" % (count, mode, elapsed))
+        t.add_row([count, mode, '%.3f' % elapsed, '%.0f' % (count / elapsed)])
+
+    redis.flushdb()
+    print t
@@ -16,11 +16,10 @@ def execute(ch_url, info, campaign, roi, clicks):
     slice_blacklist = SliceBlacklist(campaign_id=long(campaign), min_clicks=int(clicks), acceptable_roi=int(roi))
     final_sql = slice_blacklist.final_sql()
 
-    columns = d.describe_query(final_sql)
+    # names and types of columns are read from the header of response
+    items = d.read_columns(sql=final_sql)
 
-    items = d.read(sql=final_sql, columns=columns)
-
-    print "\n".join(map(lambda (o, i, l): o['Site'], items))
+    print "\n".join(items['Site'])
 
 if __name__ == '__main__':
     execute()
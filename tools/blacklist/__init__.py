@@ -1,8 +1,11 @@
 #-*- coding: utf-8 -*-
 import sys
 import os
+import time
 import logging
 import textwrap
+import threading
+from multiprocessing.pool import ThreadPool
 import click
 
 CURRENT_DIR = os.path.dirname(__file__)
@@ -21,7 +24,7 @@ class SliceBlacklist(object):
         self.logger = logger
 
 
-        if not isinstance(campaign_id, (int, long)):
+        if not self._is_valid_campaign_id(campaign_id):
             value_error = ValueError('should be set campaign_id')
             self.logger.exception(value_error)
             raise value_error
@@ -30,12 +33,21 @@ class SliceBlacklist(object):
 
         super(SliceBlacklist, self).__init__()
 
-        self.logger.info(textwrap.dedent("""Created slice_blacklist algo for
-                                            campaign_id - %d
+        self.logger.info(textwrap.dedent("""Created %s algo for
+                                            campaign_id - %s
                                             min_clicks - %d
                                             acceptable_roi - %d """),
-                            self.campaign_id, self.min_clicks, \
-                            self.acceptable_roi)
+                            self.__class__.__name__, self.campaign_id, \
+                            self.min_clicks, self.acceptable_roi)
+
+    def _is_valid_campaign_id(self, campaign_id):
+        return isinstance(campaign_id, (int, long))
+
+    def _campaign_sql(self):
+        ''' Parts of SQL template filtering the report by campaign '''
+        return dict(campaign_column='', campaign_alias='', campaign_key='',
+                    hits_filter='\n        AND campaign = %d' % self.campaign_id,
+                    conversions_filter='\n    WHERE campaign = %d' % self.campaign_id)
 
     def final_sql(self):
         template = None
@@ -43,4 +55,145 @@ class SliceBlacklist(object):
             template = f.read()
         return template.format(zoneid='{zoneid}', min_clicks=self.min_clicks, \
                                 acceptable_roi=self.acceptable_roi, \
-                                campaign_id=self.campaign_id)
+                                **self._campaign_sql())
+
+
+class BatchBlacklist(SliceBlacklist):
+    '''
+    Blacklists of all campaigns with traffic, decided by the same rules as `SliceBlacklist`,
+    but computed by a single query grouped by campaign.
+    '''
+    def __init__(self, logger=logging.getLogger('blacklist'), \
+                       min_clicks = DEFAULT_MIN_CLICKS, \
+                       acceptable_roi = DEFAULT_ACCEPTABLE_ROI):
+        super(BatchBlacklist, self).__init__(None, logger=logger, min_clicks=min_clicks, \
+                                             acceptable_roi=acceptable_roi)
+
+    def _is_valid_campaign_id(self, campaign_id):
+        return campaign_id is None
+
+    def _campaign_sql(self):
+        return dict(campaign_column='Campaign, ', campaign_alias='    campaign as Campaign,\n',
+                    campaign_key='campaign, ', hits_filter='', conversions_filter='')
+
+    def blacklists(self, db):
+        ''' Returns dict of campaign id to set of zones to block '''
+        items = db.read_columns(sql=self.final_sql())
+        blacklists = blacklists_from_rows(zip(items['Campaign'], items['Site']))
+
+        self.logger.info("Blacklisted %d zones of %d campaigns", len(items['Site']), len(blacklists))
+        return blacklists
+
+
+def blacklists_from_rows(rows):
+    blacklists = {}
+    for campaign_id, zone in rows:
+        blacklists.setdefault(campaign_id, set()).add(zone)
+    return blacklists
+
+
+def load_campaign_map(lines):
+    '''
+    Parses lines of `<campaign id> <PropellerAds campaign id>` pairs into dict.
+    Empty lines and lines starting with `#` are skipped.
+    '''
+    campaign_map = {}
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        campaign_id, propeller_campaign_id = line.split()
+        campaign_map[long(campaign_id)] = long(propeller_campaign_id)
+    return campaign_map
+
+
+class RateLimiter(object):
+    ''' Lets at most `rate` calls of `wait` per second through, shared by threads '''
+    def __init__(self, rate, clock=time.time, sleep=time.sleep):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.clock = clock
+        self.sleep = sleep
+        self._next_at = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = self.clock()
+            at = max(now, self._next_at)
+            self._next_at = at + self.interval
+        if at > now:
+            self.sleep(at - now)
+
+
+class ExcludeZonesPush(object):
+    '''
+    Adds blacklisted zones of campaigns into exclude zones targeting of PropellerAds campaigns.
+
+    `campaign_map` maps campaign ids to PropellerAds campaign ids, campaigns without
+    mapping are skipped. Campaigns are pushed by at most `concurrency` threads, API requests
+    are limited to `rate` per second. Targeting is updated only if there are zones
+    which aren't excluded yet, in `dry_run` mode it's never updated.
+
+    `api` is authorized once before campaigns are pushed and again only by one thread
+    if its token expires, so threads never log in concurrently.
+    '''
+    def __init__(self, api, campaign_map, concurrency=4, rate=5.0, dry_run=False, logger=logging.getLogger('blacklist')):
+        self.api = api
+        self.campaign_map = campaign_map
+        self.concurrency = concurrency
+        self.rate_limiter = RateLimiter(rate)
+        self.dry_run = dry_run
+        self.logger = logger
+        self._authorization_lock = threading.Lock()
+
+    def push(self, blacklists):
+        '''
+        Returns list of results, dicts with `campaign`, `propeller_campaign`, `blacklisted`
+        and `added` (sorted new zones) keys, and `error` which is None for succeeded campaigns.
+        '''
+        tasks = []
+        for campaign_id, zones in sorted(blacklists.items()):
+            propeller_campaign_id = self.campaign_map.get(campaign_id, None)
+            if propeller_campaign_id is None:
+                self.logger.info("Campaign %s has no PropellerAds campaign. Skipping.", campaign_id)
+                continue
+            tasks.append((campaign_id, propeller_campaign_id, zones))
+
+        if not tasks:
+            return []
+
+        self._authorized()
+        pool = ThreadPool(min(self.concurrency, len(tasks)))
+        try:
+            return pool.map(self._push_campaign, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _push_campaign(self, task):
+        campaign_id, propeller_campaign_id, zones = task
+        result = {'campaign': campaign_id, 'propeller_campaign': propeller_campaign_id,
+                  'blacklisted': len(zones), 'added': [], 'error': None}
+        try:
+            self.rate_limiter.wait()
+            excluded = set(map(str, self._authorized().campaign_get_exclude_zones(campaign_id=propeller_campaign_id)))
+
+            result['added'] = added = sorted(set(map(str, zones)) - excluded)
+            if not added:
+                self.logger.info("Campaign %s: all %d zones are already excluded", propeller_campaign_id, len(zones))
+            elif self.dry_run:
+                self.logger.info("Campaign %s: would exclude %d new zones (dry run)", propeller_campaign_id, len(added))
+            else:
+                self.rate_limiter.wait()
+                self._authorized().campaign_set_exclude_zones(propeller_campaign_id, sorted(excluded) + added)
+                self.logger.info("Campaign %s: excluded %d new zones", propeller_campaign_id, len(added))
+        except Exception as e:
+            self.logger.exception("Campaign %s: unable to update exclude zones", propeller_campaign_id)
+            result['error'] = e
+        return result
+
+    def _authorized(self):
+        with self._authorization_lock:
+            if not self.api.is_authorized():
+                self.rate_limiter.wait()  # login is an API request too
+            return self.api.authorized()
@@ -1,40 +1,45 @@
 import unittest
 import logging
+import threading
+import time
 
 from blacklist import *
 
 sql_template = """select Site, Min(Clicks), MAX(ROI_ALL) FROM
 (select
-    dim_zone as Site,
-    dim_connection_type as Connection_Type,
-    name as Offer,
-    count(Site) as Clicks,
-    countIf(hits_conversions.external_id, hits_conversions.external_id != '') as Conversions,
+    zone as Site,
+    connection_type as Connection_Type,
+    destination as Offer,
+    Clicks,
+    Conversions,
     if(toFloat64(Clicks) > toFloat64(0.0), toFloat64(Conversions) / toFloat64(Clicks) * 100.0, -100.0) as CR,
-    sum(cost) as Cost,
-    sum(revenue) as Revenue_all,
+    Cost,
+    Revenue_all,
     Revenue_all - Cost as Profit_Loss_All,
     if(toFloat64(Cost) > toFloat64(0.0), toFloat64(Profit_Loss_All) / toFloat64(Cost) * 100.0, -100.0) as ROI_ALL,
     (Revenue_all - Cost) / Clicks * 1000 as RPM
-from majorka.offers as offers
-inner join
+from
     (
-    select *
-    from
-    majorka.hits AS hits
-    left join majorka.conversions AS leads
-    ON hits.dim_external_id == leads.external_id
+    select zone, connection_type, destination, sum(clicks) as Clicks, sum(cost) as Cost
+    from majorka.hits_daily
     WHERE
-        dim_zone != 'AB_TEST'
+        zone != 'AB_TEST'
         AND
-        dim_zone != '{zoneid}'
-        AND dim_zone !=''
+        zone != '{zoneid}'
+        AND zone !=''
         AND campaign = {campaign_id}
-        AND dim_useragent != 'ApacheBench/2.3'
+    group by zone, connection_type, destination
     )
-as hits_conversions
-ON hits_conversions.destination == offers.id
-GROUP BY Site, Connection_Type, Offer
+as clicks
+any left join
+    (
+    select zone, connection_type, destination, sum(conversions) as Conversions, sum(revenue) as Revenue_all
+    from majorka.conversions_daily
+    WHERE campaign = {campaign_id}
+    group by zone, connection_type, destination
+    )
+as leads
+using zone, connection_type, destination
 ) as report
 GROUP BY Site
 HAVING MIN(Clicks) >= {min_clicks} AND MAX(ROI_ALL) <= {acceptable_roi}
@@ -110,3 +115,108 @@ class BlacklistTest(unittest.TestCase):
         actual_sql = slice_blacklist.final_sql()
         self.assertEquals(expected_rendered_template_with_another_params, \
                             actual_sql)
+
+
+class FakeExcludeZonesApi(object):
+    ''' In-memory fake of exclude zones targeting of PropellerAds campaigns '''
+    def __init__(self, excluded, failing=()):
+        self.excluded = dict((campaign_id, list(zones)) for campaign_id, zones in excluded.items())
+        self.failing = failing
+        self.updates = []
+        self.logins = 0
+        self._lock = threading.Lock()
+
+    def is_authorized(self):
+        return self.logins > 0
+
+    def authorized(self):
+        if not self.is_authorized():
+            time.sleep(0.01)  # other threads would log in meanwhile without a lock
+            self.logins += 1
+        return self
+
+    def campaign_get_exclude_zones(self, campaign_id):
+        if campaign_id in self.failing:
+            raise Exception("'Error': ['Campaign not found']")
+        return self.excluded.get(campaign_id, [])
+
+    def campaign_set_exclude_zones(self, campaign_id, zones):
+        with self._lock:
+            self.updates.append(campaign_id)
+            self.excluded[campaign_id] = zones
+
+
+class BatchBlacklistTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.logger = logging.getLogger('blacklist.batch.test')
+        cls.logger.addHandler(logging.NullHandler())
+
+    def test_should_render_sql_template_for_all_campaigns(self):
+        actual_sql = BatchBlacklist(min_clicks=65, acceptable_roi=20).final_sql()
+
+        self.assertTrue("HAVING MIN(Clicks) >= 65 AND MAX(ROI_ALL) <= 20" in actual_sql)
+        self.assertTrue("zone != '{zoneid}'" in actual_sql)
+        self.assertTrue("GROUP BY Campaign, Site" in actual_sql)
+        self.assertTrue("using campaign, zone, connection_type, destination" in actual_sql)
+        self.assertFalse("campaign = " in actual_sql)
+
+    def test_should_share_thresholds_with_slice_blacklist(self):
+        batch_blacklist = BatchBlacklist(logger=self.logger)
+        self.assertEqual((batch_blacklist.min_clicks, batch_blacklist.acceptable_roi), (30, 15))
+        self.assertIsNone(batch_blacklist.campaign_id)
+
+    def test_blacklists_from_rows(self):
+        blacklists = blacklists_from_rows([(1L, '847358'), (1L, '847359'), (3L, '847358')])
+        self.assertEqual(blacklists, {1L: set(['847358', '847359']), 3L: set(['847358'])})
+
+    def test_load_campaign_map(self):
+        campaign_map = load_campaign_map(["# campaign propeller_campaign\n", "1 1791408\n", "\n", "3\t1791410\n"])
+        self.assertEqual(campaign_map, {1L: 1791408L, 3L: 1791410L})
+
+    def test_rate_limiter(self):
+        clock = [100.0]
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+
+        limiter = RateLimiter(rate=4, clock=lambda: clock[0], sleep=sleep)
+        for _ in range(3):
+            limiter.wait()
+        self.assertEqual(sleeps, [0.25, 0.5])
+
+        clock[0] = 101.0  # limit isn't reached anymore
+        limiter.wait()
+        self.assertEqual(len(sleeps), 2)
+
+    def test_push_only_new_zones(self):
+        api = FakeExcludeZonesApi({1791408: [847358, 847359], 1791410: ['847358']})
+        push = ExcludeZonesPush(api=api, campaign_map={1L: 1791408, 3L: 1791410}, rate=0)
+
+        results = push.push({1L: set(['847358', '847360']), 3L: set(['847358']), 5L: set(['847361'])})
+
+        self.assertEqual([(r['campaign'], r['propeller_campaign'], r['added'], r['error']) for r in results],
+                         [(1L, 1791408, ['847360'], None), (3L, 1791410, [], None)])
+        # campaign without new zones isn't updated
+        self.assertEqual(api.updates, [1791408])
+        self.assertEqual(api.excluded[1791408], ['847358', '847359', '847360'])
+
+    def test_push_dry_run(self):
+        api = FakeExcludeZonesApi({1791408: ['847358']})
+        push = ExcludeZonesPush(api=api, campaign_map={1L: 1791408}, rate=0, dry_run=True)
+
+        results = push.push({1L: set(['847358', '847360'])})
+        self.assertEqual(results[0]['added'], ['847360'])
+        self.assertEqual(api.updates, [])
+        self.assertEqual(api.excluded[1791408], ['847358'])
+
+    def test_push_failed_campaign_does_not_stop_others(self):
+        api = FakeExcludeZonesApi({}, failing=(1791408,))
+        push = ExcludeZonesPush(api=api, campaign_map=dict((n, 1791408 + n) for n in range(10)), rate=0,
+                                logger=self.logger)
+
+        results = push.push(dict((n, set(['847358'])) for n in range(10)))
+        self.assertEqual([r['campaign'] for r in results if r['error']], [0])
+        self.assertEqual(sorted(api.updates), range(1791409, 1791418))
+        self.assertEqual(api.logins, 1)
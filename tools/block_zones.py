@@ -0,0 +1,48 @@
+import sys
+import logging
+import click
+
+from prettytable import PrettyTable
+
+from blacklist import BatchBlacklist, ExcludeZonesPush, load_campaign_map, DEFAULT_MIN_CLICKS, DEFAULT_ACCEPTABLE_ROI
+
+
+@click.command()
+@click.option('--ch-url', envvar='CH_URL', required=True, help='Clickhouse URL, i.e. http://192.168.9.39:8123/. You can use CH_URL environmental variable to set this parameter.')
+@click.option('--campaign-map', type=click.File(), required=True, help='File with `<campaign id> <PropellerAds campaign id>` pair on every line')
+@click.option('--roi', default=DEFAULT_ACCEPTABLE_ROI, type=click.IntRange(min=-100, max=100000), help='minimum ROI for particular slice ( zoneid -> connection_type -> offer)')
+@click.option('--clicks', default=DEFAULT_MIN_CLICKS, type=click.IntRange(min=0, max=10000000000L), help='minimum clicks for every slice required to decide that zone will be included in blacklist')
+@click.option('--concurrency', default=4, type=click.IntRange(min=1, max=64), help='Number of campaigns updated at once')
+@click.option('--rate', default=5.0, type=float, help='Maximum number of PropellerAds API requests per second')
+@click.option('--dry-run', is_flag=True, help='Only print zones which would be blocked')
+def execute(ch_url, campaign_map, roi, clicks, concurrency, rate, dry_run):
+    """Blocks blacklisted zones of all campaigns in PropellerAds"""
+    from data.framework.reporting import Database
+    from api.propellerads import PropellerAds
+    from credentials import credentials
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logger = logging.getLogger('blacklist')
+    logger.setLevel(logging.INFO)
+
+    d = Database(url=ch_url, db='majorka')
+    blacklists = BatchBlacklist(min_clicks=int(clicks), acceptable_roi=int(roi), logger=logger).blacklists(d)
+
+    api = PropellerAds(credentials['username'], credentials['password'], logger=logger)
+    push = ExcludeZonesPush(api=api, campaign_map=load_campaign_map(campaign_map), concurrency=concurrency,
+                            rate=rate, dry_run=dry_run, logger=logger)
+    results = push.push(blacklists)
+
+    t = PrettyTable()
+    t.field_names = ['Campaign', 'PropellerAds campaign', 'Blacklisted', 'New zones', 'Status']
+    for result in results:
+        status = 'error: %s' % result['error'] if result['error'] else ('dry run' if dry_run else 'ok')
+        t.add_row([result['campaign'], result['propeller_campaign'], result['blacklisted'], len(result['added']), status])
+    print t
+
+    if any(result['error'] for result in results):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    execute()
@@ -0,0 +1,152 @@
+import os
+import re
+import json
+import time
+import zlib
+import hashlib
+import tempfile
+import cPickle as pickle
+from urlparse import urlparse
+
+
+DEFAULT_DIRECTORY = os.path.expanduser('~/.cache/majorka/queries')
+
+VERSIONS_FILE = 'tables.json'
+ENTRY_SUFFIX = '.result'
+
+TABLE_RE = re.compile(r'\b(?:FROM|JOIN)\s+(?:`?\w+`?\.)?`?(\w+)`?', re.IGNORECASE)
+
+
+def tables_of(sql):
+    ''' Names of tables (without database) which are read by `sql` '''
+    return sorted(set(TABLE_RE.findall(sql)))
+
+
+def server_of(url):
+    ''' `host:port` of Clickhouse `url`, results of different servers are cached separately '''
+    parsed = urlparse(url)
+    return '%s:%s' % (parsed.hostname, parsed.port or (443 if parsed.scheme == 'https' else 80))
+
+
+class QueryCache(object):
+    '''
+    On-disk cache of query results of Clickhouse `server` (see `server_of`) keyed by the hash of server and final SQL.
+
+    Every table of the server has a version kept in `tables.json` of the cache directory.
+    A result is stored together with versions of tables read by the query and is
+    not returned anymore when one of them is invalidated (see `DataImport.invalidate_queries`),
+    when it's older than `ttl` seconds or when it's evicted: results which were
+    used least recently are removed as soon as the cache grows over `max_size` bytes.
+    '''
+    def __init__(self, directory=DEFAULT_DIRECTORY, server='', ttl=300, max_size=256 * 1024 * 1024):
+        self.directory = directory
+        self.server = server
+        self.ttl = ttl
+        self.max_size = max_size
+
+    def get(self, sql):
+        ''' Returns (column names, rows) of cached result of `sql` or None '''
+        path = self._entry_path(sql)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.loads(zlib.decompress(f.read()))
+        except (IOError, OSError):
+            return None
+        except Exception:  # broken entry
+            self._remove(path)
+            return None
+
+        if entry['sql'] != sql or entry.get('server', None) != self.server or time.time() - entry['created'] > self.ttl or \
+                entry['versions'] != self.snapshot(sql):
+            self._remove(path)
+            return None
+
+        os.utime(path, None)  # entries are evicted in order of last use
+        return entry['columns'], entry['rows']
+
+    def snapshot(self, sql):
+        '''
+        Versions of tables read by `sql`. Take it before the query is sent
+        to pass it to `put`, so the result of a query which races with import is never stored as fresh.
+        '''
+        versions = self._load_versions().get(self.server, {})
+        return dict((table, versions.get(table, 0)) for table in tables_of(sql))
+
+    def put(self, sql, columns, rows, snapshot):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        entry = {'sql': sql, 'server': self.server, 'created': time.time(), 'versions': snapshot, 'columns': list(columns), 'rows': list(rows)}
+        _write_atomically(self._entry_path(sql), zlib.compress(pickle.dumps(entry, pickle.HIGHEST_PROTOCOL)))
+        self.evict()
+
+    def invalidate(self, tables):
+        ''' Makes cached results of queries which read any of `tables` stale '''
+        if not os.path.isdir(self.directory):
+            return  # nothing is cached yet
+
+        all_versions = self._load_versions()
+        versions = all_versions.setdefault(self.server, {})
+        for table in tables:
+            versions[table] = versions.get(table, 0) + 1
+        _write_atomically(os.path.join(self.directory, VERSIONS_FILE), json.dumps(all_versions, indent=2, sort_keys=True))
+
+    def evict(self):
+        ''' Removes expired entries and then least recently used ones until the cache fits into `max_size` '''
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(ENTRY_SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        now = time.time()
+        size = sum([entry_size for mtime, entry_size, path in entries])
+        for mtime, entry_size, path in entries:
+            # mtime is never older than time of creation, so such entries are surely expired
+            if size <= self.max_size and now - mtime <= self.ttl:
+                continue
+            self._remove(path)
+            size -= entry_size
+
+    def clear(self):
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(ENTRY_SUFFIX):
+                self._remove(os.path.join(self.directory, name))
+
+    def _entry_path(self, sql):
+        return os.path.join(self.directory, hashlib.sha1('%s\n%s' % (self.server, sql)).hexdigest() + ENTRY_SUFFIX)
+
+    def _load_versions(self):
+        ''' Versions of tables by server '''
+        try:
+            with open(os.path.join(self.directory, VERSIONS_FILE), 'r') as f:
+                versions = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+        # versions of the previous layout weren't kept per server
+        return dict((server, tables) for server, tables in versions.items() if isinstance(tables, dict))
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _write_atomically(path, data):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+        raise
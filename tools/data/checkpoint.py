@@ -0,0 +1,54 @@
+import os
+import json
+import tempfile
+
+
+class ImportCheckpoint(object):
+    '''
+    Persistent state of data import kept in a small local JSON file.
+
+    For every entity it stores the reporting table, index of the latest imported
+    object and number of imported objects. The file is replaced atomically
+    (written into temporary file and renamed), so a crash never leaves it half-written.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self._state = self._load()
+
+    def get(self, name):
+        ''' Returns (last_idx, count) saved for entity `name` or None '''
+        state = self._state.get(name, None)
+        if state is None:
+            return None
+        return state['last_idx'], state['count']
+
+    def commit(self, name, table, last_idx, count):
+        state = dict(self._state)
+        state[name] = {'table': table, 'last_idx': last_idx, 'count': count}
+        self._save(state)
+
+    def reset(self, name):
+        if name in self._state:
+            state = dict(self._state)
+            del state[name]
+            self._save(state)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def _save(self, state):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.checkpoint-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(state, f, indent=2, sort_keys=True)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(tmp_path, self.path)
+        except:
+            os.remove(tmp_path)
+            raise
+        self._state = state
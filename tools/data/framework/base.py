@@ -38,7 +38,38 @@ class ReportingObject(object):
 
         return dict(db_row)
 
+    @classmethod
+    def encoder_columns(cls):
+        ''' Columns declared by every object of the class, see `row_encoder` '''
+        return cls.into_db_columns()
+
+    @classmethod
+    def row_encoder(cls, columns):
+        '''
+        Returns encoder of objects into rows of db values for `columns`.
+        Encoders are built once per class and schema, then reused.
+        '''
+        key = (cls, schema_key(columns))
+        encoder = _ROW_ENCODERS.get(key, None)
+        if encoder is None:
+            try:
+                declared_columns = cls.encoder_columns()
+            except TypeError:
+                # `into_db_columns` is defined per object, so there is no schema to compile
+                return None
+            encoder = _ROW_ENCODERS[key] = RowEncoder(columns, declared_columns)
+        return encoder
+
     def into_db_values(self, columns):
+        encoder = None
+        if type(columns[0]) is list or type(columns[0]) is tuple:
+            encoder = self.row_encoder(columns)
+
+        if encoder is None:
+            return self.into_db_values_by_row(columns)
+        return encoder(self)
+
+    def into_db_values_by_row(self, columns):
         if type(columns[0]) is list or type(columns[0]) is tuple:
             column_names = zip(*columns)[0]
         else:
@@ -55,6 +86,54 @@ class ReportingObject(object):
         self.__dict__.update(**kwargs)
 
 
+_ROW_ENCODERS = {}
+
+def schema_key(columns):
+    return tuple((name, type(factory), factory.into_db_type()) for name, factory in columns)
+
+def _value_getter(name):
+    def getter(obj):
+        # mimics `hasattr` semantics: any failure means there is no value
+        try:
+            return getattr(obj, name)
+        except Exception:
+            return None
+    return getter
+
+def _declared_column_encoder(name, factory):
+    get_value, into_db_value = _value_getter(name), factory.into_db_value
+    return lambda obj: into_db_value(context=obj, py_value=get_value(obj), column_name=name)
+
+def _default_column_encoder(name, factory):
+    default_py_value, into_db_value = factory.default_py_value, factory.into_db_value
+    return lambda obj: into_db_value(context=obj, py_value=default_py_value(), column_name=name)
+
+
+class RowEncoder(object):
+    '''
+    Encodes objects into rows of db values for the given `columns`.
+    Values of columns declared by the class are converted with declared type,
+    all the others are filled with default value of the type from `columns`.
+    '''
+    def __init__(self, columns, declared_columns):
+        declared = dict(declared_columns)
+        self._encoders = [_declared_column_encoder(name, declared[name]) if name in declared
+                          else _default_column_encoder(name, factory)
+                          for name, factory in columns]
+
+    def __call__(self, obj):
+        return [encode(obj) for encode in self._encoders]
+
+
+def linked_properties(cls):
+    ''' Returns names of properties of `cls` decorated with `linked` '''
+    return sorted(name for name in dir(cls)
+                  if isinstance(getattr(cls, name, None), property) and hasattr(getattr(cls, name).fget, 'linked_field'))
+
+
+_REQUIRED = object()  # marker of missing default value
+
+
 class DataObject(object):
     MONEY_DECIMAL_SHIFT = 100000  # see core/src/campaigns/currency/mod.rs
 
@@ -71,15 +150,185 @@ class DataObject(object):
         self._entity = id.split(':')[0]
         self._idx = self.id = self._entity_id_to_idx(id)
 
+    def _raw(self, field, default=_REQUIRED):
+        ''' Returns value of `field` as it has been read from storage '''
+        if default is _REQUIRED:
+            return self.__dict__[field]
+        return self.__dict__.get(field, default)
+
+    def _raw_money(self, field):
+        raw = self.__dict__[field]
+        return raw['value'], raw['currency']
+
+    def _raw_secs(self, field):
+        return self.__dict__[field]['secs_since_epoch']
+
+
+_SCHEMAS = {}
+_COMPACT_CLASSES = {}
+
+
+def _intern_key(key):
+    try:
+        return intern(str(key))
+    except UnicodeEncodeError:
+        return key
+
+def _compact_string(value):
+    # ascii text takes a byte per character as `str` instead of 4 bytes as `unicode`
+    try:
+        return value.encode('ascii')
+    except UnicodeEncodeError:
+        return value
+
+
+class _Schema(object):
+    ''' Keys of compact records, shared by all records of the same layout '''
+    __slots__ = ('keys', 'index')
+
+    def __init__(self, keys):
+        self.keys = tuple(map(_intern_key, keys))
+        self.index = dict((k, i) for i, k in enumerate(self.keys))
+
+def _schema(keys):
+    schema = _SCHEMAS.get(keys, None)
+    if schema is None:
+        schema = _SCHEMAS[keys] = _Schema(keys)
+    return schema
+
+
+class CompactDict(object):
+    ''' Read-only mapping which keeps only values, keys are shared with other mappings of the same layout '''
+    __slots__ = ('_schema', '_values')
+
+    def __init__(self, d):
+        self._schema = _schema(tuple(d.keys()))
+        self._values = tuple(_compact_string(v) if v.__class__ is unicode else v for v in d.values())
+
+    def __getitem__(self, key):
+        return self._values[self._schema.index[key]]
+
+    def get(self, key, default=None):
+        i = self._schema.index.get(key, None)
+        return default if i is None else self._values[i]
+
+    def __contains__(self, key):
+        return key in self._schema.index
+
+    def __iter__(self):
+        return iter(self._schema.keys)
+
+    def __len__(self):
+        return len(self._values)
+
+    def keys(self):
+        return list(self._schema.keys)
+
+    def values(self):
+        return list(self._values)
+
+    def items(self):
+        return zip(self._schema.keys, self._values)
+
+
+class CompactRecord(object):
+    '''
+    Memory-efficient read-only counterpart of `DataObject`, see `compact_class`.
+
+    Fields are kept in a tuple and their keys are shared by records of the same layout.
+    Money and time fields are flattened into `(value, currency)` and seconds since epoch,
+    nested objects are kept as `CompactDict`, lists as tuples and ascii text as `str`.
+    '''
+    __slots__ = ('_entity', '_idx', 'id', '_connection', '_schema', '_values')
+
+    _money_fields = frozenset()
+    _time_fields = frozenset()
+
+    def __init__(self, bus, id, **kwargs):
+        self._entity = intern(str(id.split(':')[0]))
+        self._idx = self.id = int(id.split('[')[1].split(']')[0])
+        self._connection = bus
+        self._schema = _schema(tuple(kwargs.keys()))
+        self._values = tuple(self._flatten(k, v) for k, v in kwargs.iteritems())
+
+    def _flatten(self, key, value):
+        if value.__class__ is dict:
+            if key in self._money_fields:
+                return value['value'], intern(str(value['currency']))
+            if key in self._time_fields:
+                return value['secs_since_epoch']
+            return CompactDict(value)
+        elif value.__class__ is list:
+            return tuple(value)
+        elif value.__class__ is unicode:
+            return _compact_string(value)
+        return value
+
+    @property
+    def _id(self):
+        return "%s:[%s]" % (self._entity, self._idx)
+
+    def _raw(self, field, default=_REQUIRED):
+        i = self._schema.index.get(field, None)
+        if i is None:
+            if default is _REQUIRED:
+                raise KeyError(field)
+            return default
+        return self._values[i]
+
+    _raw_money = _raw_secs = _raw
+
+    def __getattr__(self, name):
+        # fields of record are available as attributes, just like in `DataObject`
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._raw(name)
+        except KeyError:
+            raise AttributeError(name)
+
+
+def compact_class(cls):
+    '''
+    Returns class of compact records for `DataObject` subclass `cls`.
+    Records have the same properties and methods as `cls` objects, but no `__dict__`.
+    '''
+    compact = _COMPACT_CLASSES.get(cls, None)
+    if compact is None:
+        compact = _COMPACT_CLASSES[cls] = _make_compact_class(cls)
+    return compact
+
+def _delegated_classmethod(cls, name):
+    return classmethod(lambda compact_cls, *args, **kwargs: getattr(cls, name)(*args, **kwargs))
+
+def _make_compact_class(cls):
+    attrs = {}
+    for klass in reversed(cls.__mro__[:-1]):
+        attrs.update(klass.__dict__)
+    for name in CompactRecord.__dict__.keys() + ['__dict__', '__weakref__']:
+        attrs.pop(name, None)
+
+    for name, value in attrs.items():
+        # class-level introspection (e.g. default `into_db_columns`) is done on the original class
+        if isinstance(value, classmethod):
+            attrs[name] = _delegated_classmethod(cls, name)
+
+    fields = lambda marker: frozenset(getattr(p.fget, marker) for p in attrs.values()
+                                      if isinstance(p, property) and hasattr(p.fget, marker))
+    attrs['_money_fields'] = fields('money_field')
+    attrs['_time_fields'] = fields('time_field')
+    attrs['__slots__'] = ()
+    return type('Compact%s' % cls.__name__, (CompactRecord,), attrs)
+
 
 def money(field):
     def wrapper(f):
         @wraps(f)
         def wrapped(self):
-            value = Decimal(self.__dict__[field]['value']) / Decimal(self.MONEY_DECIMAL_SHIFT)
-            currency = self.__dict__[field]['currency']
+            value, currency = self._raw_money(field)
+            return (Decimal(value) / Decimal(self.MONEY_DECIMAL_SHIFT), currency)
 
-            return (value, currency)
+        wrapped.money_field = field
         return wrapped
     return wrapper
 
@@ -87,7 +336,9 @@ def time(field):
     def wrapper(f):
         @wraps(f)
         def wrapped(self):
-            return datetime.utcfromtimestamp(int(self.__dict__[field]['secs_since_epoch']))
+            return datetime.utcfromtimestamp(int(self._raw_secs(field)))
+
+        wrapped.time_field = field
         return wrapped
     return wrapper
 
@@ -96,8 +347,8 @@ def linked(ids_field):
         @wraps(f)
         def wrapped(self):
             pipe = self._connection.readonly()
-            id_or_ids = self.__dict__[ids_field]
-            if id_or_ids.__class__ is list:
+            id_or_ids = self._raw(ids_field)
+            if id_or_ids.__class__ in (list, tuple):
                 for linked_obj_id in id_or_ids:
                     pipe.by_id(linked_obj_id)
                 return pipe.execute()
@@ -106,5 +357,6 @@ def linked(ids_field):
                 pipe.by_id(some_id)
                 return pipe.execute()[0]
 
+        wrapped.linked_field = ids_field
         return wrapped
     return wrapper
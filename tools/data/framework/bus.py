@@ -1,7 +1,15 @@
 import sys
 import json
+from collections import OrderedDict
+from contextlib import contextmanager
 from redis import Redis
 
+from base import compact_class
+
+
+DEFAULT_CACHE_SIZE = 10000
+DEFAULT_BULK_BATCH_SIZE = 10000
+
 
 class ConnectionError(Exception): pass
 class DataException(Exception): pass
@@ -51,27 +59,83 @@ def _parse_result(connection, *results):
     return map(lambda (i, o, f): f(connection, i, **json.loads(o)) if str(o).startswith('{') else o, results)
 
 
+_MISSING = object()  # marker of object that isn't cached
+
+
+class IdentityMap(object):
+    ''' Maps ids into objects, evicts least recently used objects when `size` is exceeded '''
+    def __init__(self, size=DEFAULT_CACHE_SIZE):
+        self.size = size
+        self._objects = OrderedDict()
+
+    def get(self, id, default=None):
+        obj = self._objects.pop(id, _MISSING)
+        if obj is _MISSING:
+            return default
+        self._objects[id] = obj
+        return obj
+
+    def put(self, id, obj):
+        self._objects.pop(id, None)
+        self._objects[id] = obj
+        while len(self._objects) > self.size:
+            self._objects.popitem(last=False)
+
+    def clear(self):
+        self._objects.clear()
+
+    def __contains__(self, id):
+        return id in self._objects
+
+    def __len__(self):
+        return len(self._objects)
+
+
 class AllowedQueriesPipeline(object):
+    '''
+    Reads objects by ids in a single round-trip.
+    Inside `Connection.session` objects found in identity map of connection aren't requested again,
+    every distinct id is requested only once.
+    '''
     def __init__(self, connection, redis_pipe, entities_meta):
         self._connection = connection
         self._pipe = redis_pipe
-        self._factories = []
         self._ids = []
         self._entities_meta = entities_meta
 
     @checked_id
     def by_id(self, id):
-        self._pipe.get(id)
-        self._factories.append(self._entities_meta[_get_entity_from_key(id)])
         self._ids.append(id)
         return self
 
     def execute(self):
-        return _parse_result(self._connection, *zip(self._ids, self._pipe.execute(), self._factories))
+        identity_map = self._connection._identity_map if self._connection._sessions else None
+
+        found, missed = {}, []
+        for id in self._ids:
+            if id in found:
+                continue
+            obj = identity_map.get(id, _MISSING) if identity_map is not None else _MISSING
+            if obj is _MISSING:
+                found[id] = None
+                missed.append(id)
+                self._pipe.get(id)
+            else:
+                found[id] = obj
+
+        if missed:
+            factories = [self._entities_meta[_get_entity_from_key(id)] for id in missed]
+            for id, obj in zip(missed, _parse_result(self._connection, *zip(missed, self._pipe.execute(), factories))):
+                found[id] = obj
+                # missing objects aren't cached, they may be created later
+                if identity_map is not None and obj is not None:
+                    identity_map.put(id, obj)
+
+        return [found[id] for id in self._ids]
 
 
 class Connection(object):
-    def __init__(self, entities_meta, url=None, redis=None):
+    def __init__(self, entities_meta, url=None, redis=None, cache_size=DEFAULT_CACHE_SIZE):
         if url:
             self._redis = Redis.from_url(url)
         elif redis:
@@ -79,27 +143,185 @@ class Connection(object):
         else:
             raise ConnectionError("Neither `url` nor `redis` parameters provided.")
         self._entities_meta = entities_meta
+        self._identity_map = IdentityMap(size=cache_size)
+        self._sessions = 0
 
     def readonly(self):
         return AllowedQueriesPipeline(self, self._redis.pipeline(), self._entities_meta)
 
+    def clear(self):
+        ''' Forgets all cached linked objects '''
+        self._identity_map.clear()
+
+    @contextmanager
+    def session(self):
+        '''
+        Caches linked objects read within the `with` block, up to `cache_size` of them.
+        Outside of session every read goes to storage. Nested sessions share the cache of the outermost one.
+        '''
+        if not self._sessions:
+            self.clear()
+        self._sessions += 1
+        try:
+            yield self
+        finally:
+            self._sessions -= 1
+            if not self._sessions:
+                self.clear()
+
+    def prefetch(self, objs, *attrs):
+        '''
+        Resolves linked objects of properties `attrs` (decorated with `linked`)
+        for all `objs` with a single pipeline, so further access within `session` hits the cache.
+        '''
+        pipe = self.readonly()
+        for obj in objs:
+            if obj is None:
+                continue
+            for attr in attrs:
+                ids_field = getattr(getattr(obj.__class__, attr).fget, 'linked_field')
+                id_or_ids = obj._raw(ids_field, None)
+                if id_or_ids is None:
+                    continue
+                for linked_id in (id_or_ids if id_or_ids.__class__ in (list, tuple) else (id_or_ids,)):
+                    pipe.by_id(linked_id)
+        pipe.execute()
+
+    def bulk_writer(self, batch_size=DEFAULT_BULK_BATCH_SIZE):
+        ''' Returns `BulkWriter` to append objects straight into storage of this connection '''
+        return BulkWriter(self._redis, self._entities_meta, batch_size=batch_size)
+
     @checked_entity
-    def multiread(self, entity, start=0, end=None):
+    def count(self, entity):
+        ''' Returns the value of `entity` counter, i.e. the index the next object will be saved at. '''
+        return int(self._redis.get(_key_counter(entity)) or 0)
+
+    @checked_entity
+    def multiread(self, entity, start=0, end=None, batch_size=None, compact=False):
+        '''
+        Lazily reads objects of `entity` with indexes from `start` to `end` (inclusive).
+
+        By default every object is requested with separate `GET`. If `batch_size`
+        is provided, keys are requested in chunks of `batch_size` with a single `MGET`,
+        so reading is bounded by throughput instead of network round-trips.
+
+        If `compact` is set, objects are read as read-only `CompactRecord`s,
+        which take several times less memory for bulk reads.
+        '''
         if start < 0:
             raise Exception("Start index couldn't be less than 0.")
+        if batch_size is not None and batch_size < 1:
+            raise Exception("Batch size couldn't be less than 1.")
 
-        checked_entity = entity
-
-        counter = int(self._redis.get(_key_counter(checked_entity)) or 0)
-        last_idx = counter - 1
+        last_idx = self.count(entity) - 1
 
         if start > last_idx:
             return # there is no objects to read, returning empty iterator
         if end is None or end > last_idx:
             end = last_idx
 
+        factory = self._entities_meta[entity]
+        if compact:
+            factory = compact_class(factory)
+
+        if batch_size is None:
+            objs = self._read_one_by_one(entity, factory, start, end)
+        else:
+            objs = self._read_batched(entity, factory, start, end, batch_size)
+
+        for obj in objs:
+            yield obj
+
+    def _read_one_by_one(self, entity, factory, start, end):
         n = start
         while n <= end:
-            obj = _parse_result(self, (_key_by_index(entity, n), self._redis.get(_key_by_index(entity, n)), self._entities_meta[entity]))[0]
+            obj = _parse_result(self, (_key_by_index(entity, n), self._redis.get(_key_by_index(entity, n)), factory))[0]
             yield obj
             n += 1
+
+    def _read_batched(self, entity, factory, start, end, batch_size):
+        n = start
+        while n <= end:
+            keys = [_key_by_index(entity, i) for i in xrange(n, min(n + batch_size, end + 1))]
+            for obj in _parse_result(self, *zip(keys, self._redis.mget(keys), [factory] * len(keys))):
+                yield obj
+            n += len(keys)
+
+
+class BulkWriter(object):
+    '''
+    Appends objects straight into Redis by the key scheme of Majorka storage: JSON of every object
+    is saved by `Entity:[index]` key after the existing ones and `Entity:_counter` is moved past them.
+
+    Commands are sent with non-transactional pipelines of `batch_size` commands, so seeding of
+    many objects takes a few round-trips. Counters are read on the first object of entity and
+    written on `flush`, so nothing else should append objects of the same entities in between.
+
+    Could be used as a context manager, that flushes at the end of the block.
+    '''
+    def __init__(self, redis, entities_meta, batch_size=DEFAULT_BULK_BATCH_SIZE):
+        if batch_size < 1:
+            raise Exception("Batch size couldn't be less than 1.")
+
+        self._redis = redis
+        self._entities_meta = entities_meta
+        self._batch_size = batch_size
+        self._pipe = redis.pipeline(transaction=False)
+        self._pending = 0
+        self._counters = {}
+        self._dirty_counters = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_val, trace):
+        if exception_type is None:
+            self.flush()
+        return False
+
+    @checked_entity
+    def append(self, entity, obj):
+        '''
+        Queues `obj` (dictionary or JSON string) as the next object of `entity` and returns its index
+        '''
+        index = self._counters.get(entity, None)
+        if index is None:
+            index = int(self._redis.get(_key_counter(entity)) or 0)
+
+        key = _key_by_index(entity, index)
+        self._counters[entity] = index + 1
+        self._dirty_counters.add(entity)
+
+        self.set(key, obj)
+        return index
+
+    def extend(self, entity, objs):
+        ''' Queues all `objs` of `entity`, returns the number of them '''
+        count = 0
+        for obj in objs:
+            self.append(entity, obj)
+            count += 1
+        return count
+
+    @checked_id
+    def set(self, key, value):
+        ''' Queues arbitrary key of storage, like `Campaign:by_alias:<alias>` '''
+        if value.__class__ not in (str, unicode):
+            value = json.dumps(value, separators=(',', ':'))
+
+        self._pipe.set(key, value)
+        self._pending += 1
+        if self._pending >= self._batch_size:
+            self._execute()
+
+    def flush(self):
+        ''' Sends queued objects and counters of their entities '''
+        for entity in self._dirty_counters:
+            self._pipe.set(_key_counter(entity), self._counters[entity])
+        self._dirty_counters.clear()
+        self._counters.clear()
+        self._execute()
+
+    def _execute(self):
+        self._pipe.execute()
+        self._pending = 0
@@ -1,10 +1,26 @@
 import re
+from collections import OrderedDict
+from threading import local
 
 from furl import furl
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 
 from types import *
-from tsv import TabSeparated
+from tsv import TabSeparated, iter_tab_separated
+from rowbinary import RowBinary
+from utils import split_stream, counted
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+TAB_SEPARATED = 'TabSeparated'
+TAB_SEPARATED_WITH_NAMES_AND_TYPES = 'TabSeparatedWithNamesAndTypes'
+ROW_BINARY = 'RowBinary'
+DATA_FORMATS = (TAB_SEPARATED, ROW_BINARY)
+
+RETRIES_BACKOFF_FACTOR = 0.1
+
 
 class ConnectionError(Exception):
     pass
@@ -22,6 +38,35 @@ class DbError(Exception):
         super(DbError, self).__init__(message)
 
 
+class Rollup(object):
+    '''
+    Pre-aggregated table for reports: rows of `source` grouped by `keys`, with `sums` summed up.
+    It's stored in `SummingMergeTree` table, so rows with the same keys are summed up on merges as well.
+
+    `keys` and `sums` are lists of (column name, type factory, SQL expression).
+    `source` is the FROM clause, `{db}` in it is replaced with name of database and
+    `{source_where}` with the WHERE clause of `source_where` argument of `SQLGenerator.rollup_select`,
+    so a joined table could be filtered before the join.
+    '''
+    def __init__(self, table, source, date_column, keys, sums, where=None):
+        self.table = table
+        self.view = '%s_view' % table
+        self.source = source
+        self.date_column = date_column
+        self.keys = list(keys)
+        self.sums = list(sums)
+        self.where = where
+
+    def key_names(self):
+        return [name for name, type_factory, expression in self.keys]
+
+    def sum_names(self):
+        return [name for name, type_factory, expression in self.sums]
+
+    def columns(self):
+        return [(name, type_factory) for name, type_factory, expression in self.keys + self.sums]
+
+
 class SQLGenerator(object):
     def __init__(self, db_name):
         self._db_name = db_name
@@ -40,11 +85,40 @@ class SQLGenerator(object):
             sql_query = sql_query[0:-1]
         return "DESCRIBE ({query});".format(query=sql_query)
 
+    def drop_table(self, table, if_exists=True):
+        return "DROP TABLE {if_exists}{db}.{table};".format(db=self._db_name, table=table,
+                                                            if_exists='IF EXISTS ' if if_exists else '')
+
+    def create_table_as(self, table, source_table):
+        return "CREATE TABLE IF NOT EXISTS {db}.{table} AS {db}.{source};".format(db=self._db_name,
+                                                                                  table=table,
+                                                                                  source=source_table)
+
+    def insert_select(self, table, source_table, column_names):
+        column_names_fmt = ', '.join(column_names)
+        return "INSERT INTO {db}.{table} ({columns}) SELECT {columns} FROM {db}.{source};".format(db=self._db_name,
+                                                                                                  table=table,
+                                                                                                  source=source_table,
+                                                                                                  columns=column_names_fmt)
+
+    def add_column(self, table, column, type_factory, after=None):
+        return "ALTER TABLE {db}.{table} ADD COLUMN {column} {type}{after};".format(db=self._db_name,
+                                                                                   table=table,
+                                                                                   column=column,
+                                                                                   type=type_factory.into_db_type(),
+                                                                                   after=' AFTER %s' % after if after else '')
+
+    def modify_column(self, table, column, type_factory):
+        return "ALTER TABLE {db}.{table} MODIFY COLUMN {column} {type};".format(db=self._db_name,
+                                                                               table=table,
+                                                                               column=column,
+                                                                               type=type_factory.into_db_type())
+
     def create_database(self):
         return "CREATE DATABASE IF NOT EXISTS \"{db}\";".format(db=self._db_name)
 
     def create_table(self, table, date_column, index, columns, granularity=8192,
-                     engine='MergeTree', if_not_exists=True):
+                     engine='MergeTree', if_not_exists=True, sum_columns=None):
 
 
         field_declaration = zip(ColumnsDef.column_names(columns), ColumnsDef.column_type_factories(columns))
@@ -56,15 +130,70 @@ class SQLGenerator(object):
         sql = """
         CREATE TABLE IF NOT EXISTS {db}.{table_name}
         (\n{field_declaration}
-        ) ENGINE = MergeTree({date_column}, ({index}), {granularity})"""\
+        ) ENGINE = {engine}({date_column}, ({index}), {granularity}{sum_columns})"""\
         .format(db=self._db_name,
                 table_name=table,
                 field_declaration=field_declaration_fmt,
+                engine=engine,
                 date_column=date_column,
                 granularity=granularity,
-                index=', '.join(index))
+                index=', '.join(index),
+                sum_columns=', (%s)' % ', '.join(sum_columns) if sum_columns else '')
         return sql
 
+    def create_materialized_view(self, view, table, select_sql):
+        return "CREATE MATERIALIZED VIEW IF NOT EXISTS {db}.{view} TO {db}.{table} AS {select}".format(db=self._db_name,
+                                                                                                    view=view,
+                                                                                                    table=table,
+                                                                                                    select=select_sql)
+
+    def create_log_table(self, table, columns):
+        return "CREATE TABLE IF NOT EXISTS {db}.{table} ({columns}) ENGINE = Log;".format(
+            db=self._db_name,
+            table=table,
+            columns=', '.join("{name} {type}".format(name=name, type=type_factory.into_db_type()) for name, type_factory in columns))
+
+    def replace_partition(self, table, partition, source_table):
+        return "ALTER TABLE {db}.{table} REPLACE PARTITION {partition} FROM {db}.{source};".format(db=self._db_name,
+                                                                                                  table=table,
+                                                                                                  partition=partition,
+                                                                                                  source=source_table)
+
+    def rename_tables(self, renames):
+        return "RENAME TABLE {renames};".format(renames=', '.join("{db}.{source} TO {db}.{target}".format(db=self._db_name,
+                                                                                                       source=source,
+                                                                                                       target=target)
+                                                                  for source, target in renames))
+
+    def list_tables(self):
+        return "SELECT name FROM system.tables WHERE database = '{db}';".format(db=self._db_name)
+
+    def create_rollup_table(self, rollup, table=None):
+        return self.create_table(table=table or rollup.table,
+                                 date_column=rollup.date_column,
+                                 index=rollup.key_names(),
+                                 columns=rollup.columns(),
+                                 engine='SummingMergeTree',
+                                 sum_columns=rollup.sum_names())
+
+    def rollup_select(self, rollup, where=None, source_where=None):
+        conditions = filter(None, (rollup.where, where))
+        return "SELECT {expressions} FROM {source}{where} GROUP BY {keys}".format(
+            expressions=', '.join("{expression} AS {name}".format(expression=expression, name=name)
+                                  for name, type_factory, expression in rollup.keys + rollup.sums),
+            source=rollup.source.format(db=self._db_name, source_where=' WHERE %s' % source_where if source_where else ''),
+            where=' WHERE %s' % ' AND '.join("(%s)" % c for c in conditions) if conditions else '',
+            keys=', '.join(rollup.key_names()))
+
+    def insert_rollup(self, rollup, table=None, where=None, source_where=None):
+        return "INSERT INTO {db}.{table} ({columns}) {select};".format(db=self._db_name,
+                                                                      table=table or rollup.table,
+                                                                      columns=', '.join(rollup.key_names() + rollup.sum_names()),
+                                                                      select=self.rollup_select(rollup, where=where, source_where=source_where))
+
+    def create_rollup_view(self, rollup):
+        return self.create_materialized_view(view=rollup.view, table=rollup.table, select_sql=self.rollup_select(rollup)) + ';'
+
     # todo: extract into importing domain
     def create_table_for_reporting_object(self, reporting_obj):
         default_fields_names = ('id', 'date_added')
@@ -86,6 +215,38 @@ class SQLGenerator(object):
                                      index=reporting_obj.INDEX)
 
 
+    def insert_statement(self, table, column_names, format='TabSeparated'):
+        column_names_fmt = ', '.join(column_names)
+        return u"INSERT INTO {db}.{table_name} ({column_names}) FORMAT {format}".format(db=self._db_name,
+                                                                                     table_name=table,
+                                                                                     column_names=column_names_fmt,
+                                                                                     format=format)
+
+    def with_format(self, sql_query, format):
+        sql_query = sql_query.rstrip()
+        if sql_query.endswith(';'):
+            sql_query = sql_query[0:-1]
+        return "{query}\nFORMAT {format}".format(query=sql_query, format=format)
+
+    def insert_values_stream(self, values, columns):
+        '''
+        Lazily encodes every row of `values` into utf-8 TabSeparated line,
+        suitable as a body of the statement made by `insert_statement`.
+        '''
+        column_names = ColumnsDef.column_names(columns)
+        column_factories = ColumnsDef.column_type_factories(columns)
+        typing = zip(column_names, column_factories)
+
+        def db_typed_rows():
+            for row_values in values:
+                # check dimensions
+                if len(row_values) != len(typing):
+                    raise Exception("Dimensions of `values` and `columns` definition should match.")
+                yield [f.into_db_value(py_value=v, column_name=c) for (c, f), v in zip(typing, row_values)]
+
+        for line in iter_tab_separated(db_typed_rows()):
+            yield line.encode('utf-8')
+
     def insert_values(self, table, values, columns):
         # check dimensions
         if len(values[0]) != len(columns):
@@ -112,26 +273,49 @@ class SQLGenerator(object):
 
 
 class Database(object):
-    def __init__(self, url, db, sqlgen=None, connection_timeout=2, data_read_timeout=2):
+    '''
+    HTTP connection to Clickhouse.
+
+    Connections are kept alive and pooled, up to `pool_size` per host. The pool is shared
+    between threads, every thread gets its own session, so the object is safe to use
+    from several threads. Idempotent (GET) queries are retried up to `retries` times.
+    '''
+    def __init__(self, url, db, sqlgen=None, connection_timeout=2, data_read_timeout=2, data_format=TAB_SEPARATED,
+                 pool_size=10, keep_alive=True, retries=0):
+        if data_format not in DATA_FORMATS:
+            raise Exception("Unsupported data format `{f}`. Expected one of: {known}".format(f=data_format, known=', '.join(DATA_FORMATS)))
         self._url = furl(url)
         self._db = db
+        self.data_format = data_format
         self._db_is_created = None  # Unknown
         if sqlgen is None:
             sqlgen = SQLGenerator(db)
         self.sql = sqlgen
         self.connection_timeout, self.data_read_timeout = connection_timeout, data_read_timeout
+        self.keep_alive = keep_alive
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                                    max_retries=Retry(total=retries, backoff_factor=RETRIES_BACKOFF_FACTOR))
+        self._local = local()
         self.ping()
 
     @property
     def name(self):
         return self._db
 
+    @property
+    def url(self):
+        return self._url.url
+
     def ping(self):
         try:
             self.read(sql=self.sql.hello(), simple=True)
         except DbError:
             raise ConnectionError("Connection is not available.")
 
+    def close(self):
+        ''' Closes all pooled connections '''
+        self._adapter.close()
+
     def connected(self):
         self._create_database()
         return self
@@ -143,13 +327,15 @@ class Database(object):
     def describe(self, table, db=None):
         db = db or self._db
         result = self.read(sql=self.sql.describe(table, from_db=db),
-                         columns=(('name', Type.String()), ('type', Type.String())))
+                         columns=(('name', Type.String()), ('type', Type.String())),
+                         data_format=TAB_SEPARATED)
 
         return map(lambda (o, i, l): (o['name'], factory_from_db_type(o['type'])), result)
 
     def describe_query(self, sql):
         result = self.read(sql=self.sql.describe_query(sql),
-                            columns=(('name', Type.String()), ('type', Type.String())))
+                            columns=(('name', Type.String()), ('type', Type.String())),
+                            data_format=TAB_SEPARATED)
 
         columns = map(lambda (o, i, l): (o['name'], factory_from_db_type(o['type'])), result)
         return columns
@@ -157,29 +343,176 @@ class Database(object):
 
 
     # todo: type checker that checks that response contains same set of columns as provided
-    def read(self, sql, columns=(), simple=False):
-        head_foot = self._divide(sql)
+    def read(self, sql, columns=(), simple=False, stream=False, data_format=None):
+        '''
+        Executes `sql` and returns iterator of (row, index, total) tuples.
 
-        if len(head_foot) == 2: # if SQL is multiline
-            head, foot = head_foot
-            response = requests.request("GET", self._query_url(head), data=foot, timeout=(self.connection_timeout, self.data_read_timeout))
-        else:
-            response = requests.request("GET", self._query_url(head_foot), timeout=(self.connection_timeout, self.data_read_timeout))
+        With `stream=True` rows are parsed as soon as they arrive from the database,
+        so the response is never held in memory completely. `total` is unknown
+        in advance and is always None in this mode.
+
+        `data_format` overrides the format of database, `RowBinary` is used
+        only for typed reads and requires `columns` to match result types exactly.
+        '''
+        if self._is_row_binary(data_format) and columns and not simple:
+            return self._read_row_binary(sql, columns, stream=stream)
+
+        response = self._read_response(sql, stream=stream)
 
         if simple:
             return self._parsed_result_simple(sql, response)
+        elif stream:
+            return self._streamed_result(sql, response, columns)
         else:
             return self._parsed_result(sql, response, columns)
 
+    def read_typed(self, sql, stream=False):
+        '''
+        Executes `sql` and returns (columns, iterator of (row, index, total) tuples).
+
+        Names and types of columns are taken from the header of `TabSeparatedWithNamesAndTypes`
+        response, so a typed result needs no `describe_query` round trip.
+        '''
+        columns, response, rows = self._read_with_header(sql)
+
+        if stream:
+            return columns, self._closing(response, self._typed_dict_from_result(rows, columns_def=columns, total=None))
+
+        rows = list(rows)
+        response.close()
+        return columns, self._typed_dict_from_result(rows, columns_def=columns, total=len(rows))
+
+    def read_columns(self, sql, columns=None, data_format=None):
+        '''
+        Executes `sql` and returns result in columnar form: ordered dict of column name
+        to `array.array` for numeric types or list for the others.
+        Type factories are resolved once per query and no per row objects are kept.
+
+        Without `columns` they are taken from the header of response (see `read_typed`).
+        '''
+        if not columns:
+            columns, response, rows = self._read_with_header(sql)
+            return self._columns_from_lines(columns, self._closing(response, rows))
+
+        if self._is_row_binary(data_format):
+            result, parsers = self._new_columns(columns)
+            for row, i, total in self._read_row_binary(sql, columns, stream=True, as_dict=False):
+                for (append, from_db_value), value in zip(parsers, row):
+                    append(value)
+            return result
+
+        response = self._read_response(sql, stream=True)
+        if response.status_code != 200:
+            raise DbError(sql, response.text)
+        return self._columns_from_lines(columns, self._closing(response, self._decoded_lines(response)))
+
+    def _new_columns(self, columns):
+        ''' Returns empty result of `read_columns` and (append, from_db_value) pair for every column '''
+        column_names = ColumnsDef.column_names(columns)
+        column_factories = ColumnsDef.column_type_factories(columns)
+
+        result = OrderedDict((name, new_column(factory)) for name, factory in zip(column_names, column_factories))
+        parsers = [(result[name].append, factory.from_db_value) for name, factory in zip(column_names, column_factories)]
+        return result, parsers
+
+    def _columns_from_lines(self, columns, lines):
+        result, parsers = self._new_columns(columns)
+        for line in lines:
+            for (append, from_db_value), db_value in zip(parsers, line.split('\t')):
+                append(from_db_value(db_value))
+        return result
+
+    def _read_with_header(self, sql):
+        ''' Sends `sql` in `TabSeparatedWithNamesAndTypes` format, returns (columns, response, iterator of data lines) '''
+        query = self.sql.with_format(sql, TAB_SEPARATED_WITH_NAMES_AND_TYPES)
+
+        response = self._read_response(query, stream=True)
+        if response.status_code != 200:
+            raise DbError(query, response.text)
+
+        lines = self._decoded_lines(response)
+        try:
+            names, types = next(lines), next(lines)
+        except StopIteration:
+            response.close()
+            raise DbError(query, "Response has no header with names and types of columns.")
+
+        columns = zip([name.encode('utf-8') for name in names.split('\t')],
+                      [factory_from_db_type(db_type.encode('utf-8')) for db_type in types.split('\t')])
+        return columns, response, lines
+
+    def _decoded_lines(self, response):
+        encoding = response.encoding or 'utf-8'
+        return (line.decode(encoding) for line in response.iter_lines(chunk_size=STREAM_CHUNK_SIZE) if line)
+
+    def _is_row_binary(self, data_format=None):
+        return (data_format or self.data_format) == ROW_BINARY
+
+    def _read_row_binary(self, sql, columns, stream=False, as_dict=True):
+        codec = RowBinary(columns)
+        query = self.sql.with_format(sql, ROW_BINARY)
+
+        response = self._read_response(query, stream=True)
+        if response.status_code != 200:
+            raise DbError(query, response.text)
+
+        rows = codec.decode_rows(response.iter_content(chunk_size=STREAM_CHUNK_SIZE))
+        if as_dict:
+            rows = (dict(zip(codec.column_names, row)) for row in rows)
+
+        if stream:
+            return self._closing(response, ((row, i, None) for i, row in enumerate(rows)))
+
+        rows = list(rows)
+        total = len(rows)
+        return ((row, i, total) for i, row in enumerate(rows))
+
+    def _read_response(self, sql, stream=False):
+        head_foot = self._divide(sql)
+
+        if len(head_foot) == 2: # if SQL is multiline
+            head, foot = head_foot
+            return self._request("GET", self._query_url(head), data=foot, stream=stream)
+        else:
+            return self._request("GET", self._query_url(head_foot), stream=stream)
+
     def write(self, sql):
         head_foot = self._divide(sql)
         if len(head_foot) == 2: # if SQL is multiline
             head, foot = head_foot
-            response = requests.request("POST", self._query_url(head), data=foot, timeout=(self.connection_timeout, self.data_read_timeout))
+            response = self._request("POST", self._query_url(head), data=foot)
         else:
-            response = requests.request("POST", self._query_url(head_foot), timeout=(self.connection_timeout, self.data_read_timeout))
+            response = self._request("POST", self._query_url(head_foot))
 
         return self._parsed_result_simple(sql, response)
+
+    def write_stream(self, table, values, columns, max_rows=None, max_bytes=None, data_format=None, on_chunk=None):
+        '''
+        Inserts `values` into `table` without materializing the whole payload in memory.
+
+        Rows are encoded lazily and sent with chunked transfer encoding. If `max_rows`
+        or `max_bytes` limit is provided, the stream is cut into several consecutive
+        INSERT statements, each of them bounded by the limits. `on_chunk` is called
+        with the number of rows of every INSERT right after it's committed.
+
+        `data_format` overrides the format of database, `RowBinary` requires
+        `columns` with types that match the table.
+        '''
+        if self._is_row_binary(data_format):
+            query = self.sql.insert_statement(table, ColumnsDef.column_names(columns), format=ROW_BINARY)
+            lines = RowBinary(columns).encode_rows(values)
+        else:
+            query = self.sql.insert_statement(table, ColumnsDef.column_names(columns))
+            lines = self.sql.insert_values_stream(values, columns)
+
+        for chunk in split_stream(lines, max_items=max_rows, max_bytes=max_bytes):
+            rows = [0]
+            response = self._request("POST", self._query_url(query), data=counted(chunk, rows))
+            self._parsed_result_simple(query, response)
+            if on_chunk is not None:
+                on_chunk(rows[0])
+
+        return True
     #
     # def get_columns_for_table(self, table, db=None):
     #     db = db or self._db
@@ -213,18 +546,34 @@ class Database(object):
         rows = list(filter(bool, response_strings)) # clean out empty strings
 
         if not columns:
-            return self._list_from_result(rows)
+            return self._list_from_result(rows, total=len(rows))
 
-        return self._typed_dict_from_result(rows, columns_def=columns, query=query)
+        return self._typed_dict_from_result(rows, total=len(rows), columns_def=columns, query=query)
 
-    def _list_from_result(self, row_strings):
-        total = len(row_strings)
+    def _streamed_result(self, query, response, columns=()):
+        if response.status_code != 200:
+            raise DbError(query, response.text)
+
+        rows = self._decoded_lines(response)
+
+        if not columns:
+            return self._closing(response, self._list_from_result(rows, total=None))
+
+        return self._closing(response, self._typed_dict_from_result(rows, columns_def=columns, query=query, total=None))
+
+    def _closing(self, response, items):
+        try:
+            for item in items:
+                yield item
+        finally:
+            response.close()
+
+    def _list_from_result(self, row_strings, total):
         for i, s in enumerate(row_strings):
             fields = s.split('\t')
             yield list(map(str, fields)), i, total
 
-    def _typed_dict_from_result(self, row_strings, columns_def=None, query=None):
-        total = len(row_strings)
+    def _typed_dict_from_result(self, row_strings, total, columns_def=None, query=None):
         for i, s in enumerate(row_strings):
             db_values = s.split('\t')
             yield (ColumnsDef.parse_into_typed_dict(columns_def, *db_values)), i, total
@@ -235,6 +584,19 @@ class Database(object):
             fields = s.split('\t')
             yield dict(zip(field_names, fields)), i, total
 
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            session.mount('http://', self._adapter)
+            session.mount('https://', self._adapter)
+            if not self.keep_alive:
+                session.headers['Connection'] = 'close'
+        return session
+
+    def _request(self, method, url, **kwargs):
+        return self._session().request(method, url, timeout=(self.connection_timeout, self.data_read_timeout), **kwargs)
+
     def _query_url(self, s):
         f = self._url.copy()
         f.args['query'] = s
@@ -0,0 +1,246 @@
+'''
+Codec for Clickhouse `RowBinary` format.
+
+Every value is written in its binary in-memory form, so neither number-to-string
+conversion nor escaping happens on both sides. Reading requires exact types of
+result columns, because rows have no delimiters.
+
+Note: `DateTime` values are treated as UTC, since binary form is a unix timestamp.
+'''
+import struct
+import calendar
+from datetime import datetime, date, timedelta
+from decimal import Decimal, Context
+from uuid import UUID
+from ipaddr import IPAddress
+
+from types import *
+
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_DATE = date(1970, 1, 1)
+
+_UINT64_MASK = (1 << 64) - 1
+_DECIMAL_CONTEXT = Context(prec=80)  # enough for Decimal128 without rounding
+
+_INTEGERS = {
+    (8, False): struct.Struct('<b'),
+    (8, True): struct.Struct('<B'),
+    (16, False): struct.Struct('<h'),
+    (16, True): struct.Struct('<H'),
+    (32, False): struct.Struct('<i'),
+    (32, True): struct.Struct('<I'),
+    (64, False): struct.Struct('<q'),
+    (64, True): struct.Struct('<Q'),
+}
+_FLOAT32 = struct.Struct('<f')
+_FLOAT64 = struct.Struct('<d')
+_INT128 = struct.Struct('<Qq')
+_UUID = struct.Struct('<QQ')
+
+
+class RowBinaryError(Exception):
+    pass
+
+
+class ByteReader(object):
+    ''' Reads exact amount of bytes from iterable of chunks of any size '''
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = ''
+        self._pos = 0
+
+    def read(self, size):
+        end = self._pos + size
+        if end > len(self._buf):
+            self._fill(size)
+            end = size
+        data = self._buf[self._pos:end]
+        self._pos = end
+        return data
+
+    def at_end(self):
+        if self._pos < len(self._buf):
+            return False
+        for chunk in self._chunks:
+            if chunk:
+                self._buf, self._pos = chunk, 0
+                return False
+        return True
+
+    def _fill(self, size):
+        parts = [self._buf[self._pos:]]
+        available = len(parts[0])
+        while available < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                raise RowBinaryError("Unexpected end of data.")
+            parts.append(chunk)
+            available += len(chunk)
+        self._buf, self._pos = ''.join(parts), 0
+
+
+def write_varint(value):
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return str(out)
+
+def read_varint(reader):
+    shift = result = 0
+    while True:
+        byte = ord(reader.read(1))
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result
+        shift += 7
+
+
+def _struct_codec(packer):
+    size = packer.size
+    return (packer.pack,
+            lambda reader: packer.unpack(reader.read(size))[0])
+
+def _string_encode(value):
+    if type(value) is not str:
+        value = unicode(value).encode('utf-8')
+    return write_varint(len(value)) + value
+
+def _string_decode(reader):
+    return reader.read(read_varint(reader))
+
+def _idx_encode(value):
+    if value is None:
+        value = -1
+    elif type(value) is not int:
+        value = getattr(value, '_idx')
+    return _INTEGERS[(64, False)].pack(value)
+
+def _decimal_width(type_factory):
+    if isinstance(type_factory, Type.Decimal32):
+        return 32
+    elif isinstance(type_factory, Type.Decimal64):
+        return 64
+    elif isinstance(type_factory, Type.Decimal128):
+        return 128
+    elif type_factory.precision <= 9:
+        return 32
+    elif type_factory.precision <= 18:
+        return 64
+    return 128
+
+def _decimal_codec(type_factory):
+    scale = type_factory.scale
+    width = _decimal_width(type_factory)
+
+    if width == 128:
+        pack = lambda n: _INT128.pack(n & _UINT64_MASK, n >> 64)
+        def unpack(reader):
+            low, high = _INT128.unpack(reader.read(16))
+            return (high << 64) | low
+    else:
+        pack, unpack = _struct_codec(_INTEGERS[(width, False)])
+
+    encode = lambda value: pack(int(Decimal(value).scaleb(scale, context=_DECIMAL_CONTEXT).to_integral_value(context=_DECIMAL_CONTEXT)))
+    decode = lambda reader: Decimal(unpack(reader)).scaleb(-scale, context=_DECIMAL_CONTEXT)
+    return encode, decode
+
+def _money_codec(type_factory):
+    encode, decode = _decimal_codec(type_factory)
+    return (lambda value: encode((value or type_factory.default_py_value())[0]),
+            lambda reader: (decode(reader), 'Unknown'))
+
+def _date_codec():
+    pack, unpack = _struct_codec(_INTEGERS[(16, True)])
+    def encode(value):
+        if isinstance(value, datetime):
+            value = value.date()
+        return pack((value - EPOCH_DATE).days)
+    return encode, lambda reader: EPOCH + timedelta(days=unpack(reader))
+
+def _datetime_codec():
+    pack, unpack = _struct_codec(_INTEGERS[(32, True)])
+    return (lambda value: pack(calendar.timegm(value.utctimetuple())),
+            lambda reader: datetime.utcfromtimestamp(unpack(reader)))
+
+def _uuid_codec():
+    def encode(value):
+        n = value.int
+        return _UUID.pack(n >> 64, n & _UINT64_MASK)
+    def decode(reader):
+        high, low = _UUID.unpack(reader.read(16))
+        return UUID(int=(high << 64) | low)
+    return encode, decode
+
+def _array_codec(type_factory):
+    encode_item, decode_item = codec(type_factory._items_type)
+    def encode(value):
+        return write_varint(len(value)) + ''.join(map(encode_item, value))
+    def decode(reader):
+        return [decode_item(reader) for _ in xrange(read_varint(reader))]
+    return encode, decode
+
+def codec(type_factory):
+    ''' Returns (encode, decode) pair of functions for values of `type_factory` '''
+    if isinstance(type_factory, Type.Bool):
+        pack, unpack = _struct_codec(_INTEGERS[(8, True)])
+        return (lambda value: pack(1 if value is True else 0),
+                lambda reader: unpack(reader) == 1)
+    elif isinstance(type_factory, Type.Idx):
+        return _idx_encode, _struct_codec(_INTEGERS[(64, False)])[1]
+    elif isinstance(type_factory, Type.Integer):
+        return _struct_codec(_INTEGERS[(type_factory.bits, type_factory.unsigned)])
+    elif isinstance(type_factory, Type.Float32):
+        return _struct_codec(_FLOAT32)
+    elif isinstance(type_factory, Type.Float64):
+        return _struct_codec(_FLOAT64)
+    elif isinstance(type_factory, Type.Money):
+        return _money_codec(type_factory)
+    elif isinstance(type_factory, Type.Decimal):
+        return _decimal_codec(type_factory)
+    elif isinstance(type_factory, Type.Date):
+        return _date_codec()
+    elif isinstance(type_factory, Type.DateTime):
+        return _datetime_codec()
+    elif isinstance(type_factory, Type.UUID):
+        return _uuid_codec()
+    elif isinstance(type_factory, Type.Array):
+        return _array_codec(type_factory)
+    elif isinstance(type_factory, Type.LowCardinality):
+        # dictionary encoding is internal to Clickhouse, values are sent as is
+        return codec(type_factory._items_type)
+    elif isinstance(type_factory, Type.IPAddress):
+        return _string_encode, lambda reader: IPAddress(_string_decode(reader))
+    elif isinstance(type_factory, (Type.Enum8, Type.Enum16)):
+        raise RowBinaryError("Type `{t}` is not supported by RowBinary codec.".format(t=type_factory.into_db_type()))
+    elif type_factory.into_db_type() == 'String':
+        return _string_encode, _string_decode
+
+    raise RowBinaryError("Type `{t}` is not supported by RowBinary codec.".format(t=type_factory.into_db_type()))
+
+
+class RowBinary(object):
+    ''' Encodes and decodes rows of values for given `columns` definition '''
+    def __init__(self, columns):
+        self.column_names = ColumnsDef.column_names(columns)
+        codecs = map(codec, ColumnsDef.column_type_factories(columns))
+        self._encoders = [encode for encode, decode in codecs]
+        self._decoders = [decode for encode, decode in codecs]
+
+    def encode_row(self, values):
+        if len(values) != len(self._encoders):
+            raise Exception("Dimensions of `values` and `columns` definition should match.")
+        return ''.join([encode(value) for encode, value in zip(self._encoders, values)])
+
+    def encode_rows(self, rows):
+        for values in rows:
+            yield self.encode_row(values)
+
+    def decode_rows(self, chunks):
+        ''' Lazily decodes lists of values from iterable of bytes chunks '''
+        reader = ByteReader(chunks)
+        decoders = self._decoders
+        while not reader.at_end():
+            yield [decode(reader) for decode in decoders]
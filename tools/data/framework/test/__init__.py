@@ -2,3 +2,4 @@ from bus import *
 from utils import *
 from reporting import *
 from types import *
+from rowbinary import *
@@ -4,7 +4,7 @@ import sys
 import os
 
 
-from ..bus import Connection
+from ..bus import Connection, IdentityMap
 from ..base import *
 
 from fixtures.redis_fixture import fixture_data
@@ -96,6 +96,20 @@ class DatabusTestCase(unittest.TestCase):
         hits = list(self.bus.multiread('Hits', start=some_random_index, end=some_random_index + 100))
         self.assertEqual(len(hits), 101, "Should load all entries.")
 
+    def test_multiread_batched(self):
+        some_random_index = 153
+
+        for batch_size in (1, 7, 100, 1000):
+            hits = list(self.bus.multiread('Hits', start=some_random_index, end=some_random_index + 100, batch_size=batch_size))
+            self.assertEqual(len(hits), 101, "Should load all entries.")
+            self.assertEqual(map(lambda hit: hit._idx, hits), range(some_random_index, some_random_index + 101), "Should keep the order of entries.")
+            self.assertEqual(hits[0].click_id, '121427560658636800')
+
+        self.assertEqual(len(list(self.bus.multiread('Offer', batch_size=5))), 12)
+
+        with self.assertRaises(Exception):
+            list(self.bus.multiread('Offer', batch_size=0))
+
     def test_readonly_pipe(self):
         offer1, offer2 = self.bus.readonly().by_id('Offer:[0]').by_id('Offer:[1]').execute()
 
@@ -104,3 +118,200 @@ class DatabusTestCase(unittest.TestCase):
 
         self.assertEqual(offer1.url_template, 'https://jaunithuw.com/?h=9dad9c9097a736ce162988dc28d0dda60810115f&pci={external_id}&ppi={zone}')
         self.assertEqual(offer2.url_template, 'https://jaunithuw.com/?h=0c6a4ddb2e8336632cf8de86770852dbb3a32560&pci={external_id}&ppi={zone}')
+
+    def test_linked_objects_are_cached(self):
+        hits = list(self.bus.multiread('Hits', start=153, end=253))
+
+        self.assertIsNot(hits[0].destination, hits[0].destination, "should read from storage outside of session")
+        self.assertEqual(len(self.bus._identity_map), 0)
+
+        with self.bus.session():
+            self.assertIs(hits[0].destination, hits[0].destination, "should return the same object from identity map")
+            self.assertEqual(hits[0].destination._idx, 7)
+
+            same_destination = filter(lambda hit: hit.destination_id == hits[0].destination_id, hits)
+            self.assertTrue(all(hit.destination is hits[0].destination for hit in same_destination))
+            self.assertEqual(len(self.bus._identity_map), 1)
+
+            with self.bus.session():
+                self.assertEqual(len(self.bus._identity_map), 1, "should share cache with outer session")
+            self.assertEqual(len(self.bus._identity_map), 1)
+        self.assertEqual(len(self.bus._identity_map), 0, "should clear cache after session")
+
+    def test_prefetch(self):
+        hits = list(self.bus.multiread('Hits', start=153, end=253))
+
+        with self.bus.session():
+            self.bus.prefetch(hits + [None], 'campaign', 'destination')
+
+            distinct_ids = set(map(lambda hit: hit.campaign_id, hits)) | set(map(lambda hit: hit.destination_id, hits))
+            self.assertEqual(len(self.bus._identity_map), len(distinct_ids))
+            self.assertTrue(all('%s' % hit.destination_id in self.bus._identity_map for hit in hits))
+
+            self.assertEqual(hits[0].destination.url_template, 'https://jaunithuw.com/?h=f1b5821ac37e8e5104ede686ae9e3263edcfc6e6&pci={external_id}&ppi={zone}')
+
+    def test_multiread_compact(self):
+        hits = list(self.bus.multiread('Hits', start=153, end=253))
+        compact_hits = list(self.bus.multiread('Hits', start=153, end=253, batch_size=10, compact=True))
+
+        self.assertEqual(len(compact_hits), 101)
+        self.assertTrue(all(isinstance(hit, CompactRecord) for hit in compact_hits))
+        self.assertEqual(map(lambda hit: hit._idx, compact_hits), map(lambda hit: hit._idx, hits))
+        self.assertEqual(compact_hits[0].click_id, '121427560658636800')
+
+        with self.bus.session():
+            self.assertIs(compact_hits[0].destination, hits[0].destination)
+
+            self.bus.prefetch(compact_hits, 'campaign', 'destination')
+            self.assertTrue(all('%s' % hit.destination_id in self.bus._identity_map for hit in compact_hits))
+
+    def test_missing_linked_objects_are_not_cached(self):
+        with self.bus.session():
+            first, missing = self.bus.readonly().by_id('Offer:[0]').by_id('Offer:[100500]').by_id('Offer:[0]').execute()
+            self.assertIsNone(missing)
+            self.assertEqual(first._idx, 0)
+            self.assertEqual(len(self.bus._identity_map), 1)
+            self.assertNotIn('Offer:[100500]', self.bus._identity_map)
+
+
+class BulkWriterTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if not os.environ.get('TEST_REDIS_URL', None):
+            raise Exception("\n\nFor safety reason, framework tests are running "
+                            "only on test database instance.\nSet the"
+                            "'TEST_REDIS_URL' environmental variable to proper Redis URL.\n")
+        cls._redis = Redis.from_url(os.environ['TEST_REDIS_URL'])
+
+    def setUp(self):
+        self.redis = BulkWriterTestCase._redis
+        self.redis.flushdb()
+        self.bus = Connection(redis=self.redis, entities_meta=_ENTITIES)
+
+    def tearDown(self):
+        self.redis.flushdb()
+
+    def test_appends_after_existing_objects(self):
+        self.redis.set('Offer:[0]', '{"url_template":"http://existing/"}')
+        self.redis.set('Offer:_counter', 1)
+
+        with self.bus.bulk_writer(batch_size=3) as writer:
+            indexes = [writer.append('Offer', {'url_template': 'http://new/%s' % i}) for i in range(10)]
+            self.assertEqual(writer.extend('Offer', ['{"url_template":"http://json/"}']), 1)
+
+        self.assertEqual(indexes, range(1, 11))
+        self.assertEqual(self.bus.count('Offer'), 12)
+
+        offers = list(self.bus.multiread('Offer', batch_size=5))
+        self.assertEqual(offers[0].url_template, 'http://existing/')
+        self.assertEqual(offers[10].url_template, 'http://new/9')
+        self.assertEqual(offers[11].url_template, 'http://json/')
+
+    def test_counters_are_written_on_flush(self):
+        writer = self.bus.bulk_writer()
+        writer.append('Hits', {'campaign_id': 'Campaign:[0]'})
+        self.assertEqual(self.bus.count('Hits'), 0)
+
+        writer.flush()
+        self.assertEqual(self.bus.count('Hits'), 1)
+
+        self.redis.set('Hits:_counter', 5)  # objects appended by someone else between flushes
+        self.assertEqual(writer.append('Hits', {'campaign_id': 'Campaign:[0]'}), 5)
+
+    def test_unknown_entity(self):
+        with self.assertRaises(Exception):
+            self.bus.bulk_writer().append('Campaign', {})
+
+
+class FakeEntity3(DataObject):
+    @property
+    @money('cost')
+    def cost(self):
+        pass
+
+    @property
+    @time('time')
+    def time(self):
+        pass
+
+    @property
+    def zone(self):
+        return self._raw('dimensions').get('zone', '')
+
+    @classmethod
+    def entity_name(cls):
+        return cls.__name__
+
+
+class CompactRecordTestCase(unittest.TestCase):
+    FIELDS = {u'click_id': u'121427560658636800',
+              u'campaign_id': u'Campaign:[0]',
+              u'offers': [u'Offer:[0]', u'Offer:[1]'],
+              u'cost': {u'value': 85, u'currency': u'USD'},
+              u'time': {u'secs_since_epoch': 1550533112, u'nanos_since_epoch': 207362916},
+              u'dimensions': {u'zone': u'847358', u'language': u'\u0440\u0443\u0441'}}
+
+    def test_same_as_data_object(self):
+        obj = FakeEntity3(None, 'Hits:[153]', **self.FIELDS)
+        record = compact_class(FakeEntity3)(None, 'Hits:[153]', **self.FIELDS)
+
+        for attr in ('_id', '_entity', '_idx', 'id', 'cost', 'time', 'zone', 'click_id', 'campaign_id'):
+            self.assertEqual(getattr(record, attr), getattr(obj, attr))
+        self.assertEqual(list(record.offers), obj.offers)
+        self.assertEqual(sorted(record.dimensions.items()), sorted(obj.dimensions.items()))
+        self.assertEqual(record.dimensions['language'], u'\u0440\u0443\u0441')
+        self.assertIsNone(record._raw('external_id', None))
+        self.assertEqual(record.entity_name(), 'FakeEntity3')
+
+        with self.assertRaises(AttributeError):
+            record.external_id
+        with self.assertRaises(AttributeError):
+            record.some_attribute = 1
+
+    def test_compact_layout(self):
+        cls = compact_class(FakeEntity3)
+        self.assertIs(compact_class(FakeEntity3), cls)
+        self.assertEqual(cls._money_fields, frozenset(['cost']))
+        self.assertEqual(cls._time_fields, frozenset(['time']))
+
+        first, second = cls(None, 'Hits:[0]', **self.FIELDS), cls(None, 'Hits:[1]', **self.FIELDS)
+        self.assertFalse(hasattr(first, '__dict__'))
+        self.assertIs(first._schema, second._schema, "records of the same layout should share keys")
+        self.assertIs(first.dimensions._schema, second.dimensions._schema)
+        self.assertEqual(first._raw('cost'), (85, 'USD'))
+        self.assertEqual(first._raw('time'), 1550533112)
+        self.assertIs(type(first.dimensions['zone']), str)
+
+    def test_linked_properties(self):
+        self.assertEqual(linked_properties(compact_class(FakeEntity2)), ['campaign', 'destination'])
+
+
+class IdentityMapTestCase(unittest.TestCase):
+    def test_lru_eviction(self):
+        identity_map = IdentityMap(size=2)
+        identity_map.put('Offer:[0]', 0)
+        identity_map.put('Offer:[1]', 1)
+        self.assertEqual(identity_map.get('Offer:[0]'), 0)
+
+        identity_map.put('Offer:[2]', 2)
+        self.assertIn('Offer:[0]', identity_map)
+        self.assertNotIn('Offer:[1]', identity_map, "should evict least recently used object")
+        self.assertIn('Offer:[2]', identity_map)
+        self.assertEqual(len(identity_map), 2)
+
+    def test_cached_none(self):
+        identity_map = IdentityMap()
+        identity_map.put('Offer:[0]', None)
+        self.assertIn('Offer:[0]', identity_map)
+        self.assertIsNone(identity_map.get('Offer:[0]', 'default'))
+        self.assertEqual(identity_map.get('Offer:[1]', 'default'), 'default')
+
+        identity_map.clear()
+        self.assertEqual(len(identity_map), 0)
+
+
+class LinkedPropertiesTestCase(unittest.TestCase):
+    def test_linked_properties(self):
+        self.assertEqual(linked_properties(FakeEntity2), ['campaign', 'destination'])
+        self.assertEqual(linked_properties(FakeEntity1), [])
+        self.assertEqual(FakeEntity2.destination.fget.linked_field, 'destination_id')
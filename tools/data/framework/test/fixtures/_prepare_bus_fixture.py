@@ -2,6 +2,9 @@
 Generate fixture from Redis data
 
 Usage example: TEST_REDIS_URL=redis://localhost:6379/0 python data/framework/test/fixtures/_prepare_bus_fixture.py  > framework/test/redis_fixture.py
+
+Whole keyspace is kept in memory here and in the generated module, for big keyspaces
+use `dump_redis_snapshot.py` and `testtools.snapshots` instead.
 '''
 import os
 import sys
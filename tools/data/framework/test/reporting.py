@@ -7,8 +7,8 @@ from datetime import datetime, timedelta
 from ipaddr import IPAddress, IPv4Address
 from decimal import Decimal
 
-from ..reporting import Database, SQLGenerator, DbError, ConnectionError
-from ..tsv import TabSeparated, TabSeparatedError
+from ..reporting import Database, SQLGenerator, Rollup, DbError, ConnectionError
+from ..tsv import TabSeparated, TabSeparatedError, iter_tab_separated
 from ..base import ReportingObject
 from ..types import *
 from asserts import create_fake_entity
@@ -69,6 +69,22 @@ class ReportingDbTestCase(unittest.TestCase):
         with self.assertRaises(DbError):
             db.write(sql=write_query)
 
+    def test_pooled_connection_from_threads(self):
+        from multiprocessing.pool import ThreadPool
+
+        db = Database(url=os.environ['TEST_CLICKHOUSE_URL'], db='test', pool_size=4, retries=2)
+        query = lambda n: list(db.read(sql="SELECT {n} * 2 AS result;".format(n=n), columns=(('result', Type.Int32()),)))[0][0]['result']
+
+        pool = ThreadPool(4)
+        self.assertEqual(pool.map(query, range(100)), [n * 2 for n in range(100)])
+        pool.close()
+
+        no_keep_alive = Database(url=os.environ['TEST_CLICKHOUSE_URL'], db='test', keep_alive=False)
+        for n in range(3):
+            self.assertTrue(no_keep_alive.read(sql="SELECT 1;", simple=True))
+
+        db.close()
+
     def test_read_simple_result(self):
         db = self.report_db.connected()
         self.assertTrue(db.read(sql="SELECT 2+2;", columns=(('result', Type.Int32()),), simple=True))
@@ -92,6 +108,38 @@ class ReportingDbTestCase(unittest.TestCase):
             self.assertEqual(row['result'], 12)
             self.assertEqual(row['foo'], '4')
 
+    def test_read_stream(self):
+        db = self.report_db.connected()
+        rows = db.read(sql="SELECT number, toString(number) AS s FROM system.numbers LIMIT 100000;",
+                       columns=(('number', Type.UInt64()), ('s', Type.String())), stream=True)
+
+        count = 0
+        for row, i, total in rows:
+            self.assertIsNone(total)
+            self.assertEqual(row['number'], i)
+            self.assertEqual(row['s'], str(i))
+            count += 1
+        self.assertEqual(count, 100000)
+
+        self.assertEqual(list(db.read(sql="SELECT 2 + 2 AS foo, 'bar' AS baz;", stream=True)), [(['4', 'bar'], 0, None)])
+
+        with self.assertRaises(DbError):
+            db.read(sql="invalid select * from system.processes;", stream=True)
+
+    def test_read_columns(self):
+        db = self.report_db.connected()
+        columns = db.read_columns(sql="SELECT number, toFloat64(number) / 2 AS half, toString(number) AS s FROM system.numbers LIMIT 1000;",
+                                  columns=(('number', Type.UInt64()), ('half', Type.Float64()), ('s', Type.String())))
+
+        self.assertEqual(columns.keys(), ['number', 'half', 's'])
+        self.assertEqual(columns['number'].typecode, 'L')
+        self.assertEqual(columns['number'].tolist(), range(1000))
+        self.assertEqual(sum(columns['half']), sum(range(1000)) / 2.0)
+        self.assertEqual(columns['s'][:3], ['0', '1', '2'])
+
+        empty = db.read_columns(sql="SELECT number FROM system.numbers LIMIT 0;", columns=('number',))
+        self.assertEqual(empty.items(), [('number', [])])
+
     def test_read_with_type_factories(self):
         db = self.report_db.connected()
         for row, i, total in db.read(sql="SELECT user, address, elapsed, memory_usage FROM system.processes;",
@@ -207,6 +255,32 @@ class ReportingDbTestCase(unittest.TestCase):
         self.assertEqual(len(columns), 1)
         self.assertTrue(type(d['result']) is Type.UInt16)
 
+    def test_read_typed(self):
+        db = self.report_db.connected()
+        columns, rows = db.read_typed("SELECT 2+2 AS result, toDecimal64(1.5, 5) AS amount, [1, 2] AS list;")
+
+        self.assertEqual([name for name, type_factory in columns], ['result', 'amount', 'list'])
+        self.assertTrue(type(dict(columns)['result']) is Type.UInt16)
+        self.assertEqual(list(rows), [({'result': 4, 'amount': Decimal('1.5'), 'list': [1, 2]}, 0, 1)])
+
+        columns, rows = db.read_typed("SELECT number FROM system.numbers LIMIT 3;", stream=True)
+        self.assertEqual([row['number'] for row, i, total in rows], [0, 1, 2])
+
+        columns, rows = db.read_typed("SELECT number FROM system.numbers LIMIT 0;")
+        self.assertEqual(len(columns), 1)
+        self.assertEqual(list(rows), [])
+
+        with self.assertRaises(DbError):
+            db.read_typed("SELECT unknown_column FROM system.numbers LIMIT 1;")
+
+    def test_read_columns_without_columns(self):
+        db = self.report_db.connected()
+        columns = db.read_columns(sql="SELECT number, toString(number) AS s FROM system.numbers LIMIT 1000;")
+
+        self.assertEqual(columns.keys(), ['number', 's'])
+        self.assertEqual(columns['number'].tolist(), range(1000))
+        self.assertEqual(columns['s'][:3], ['0', '1', '2'])
+
     def test_use_describe_for_typed_reading_from_table_with_unknown_schema(self):
         db = self.report_db.connected()
 
@@ -360,6 +434,74 @@ class ReportingDbTestCase(unittest.TestCase):
         self.assertEqual(len(list(db.read(sql='SELECT * FROM test.testtable_insert_with_simple_column_declaration'))), 3, "should not alter data in table")
 
 
+    def test_data_create_and_write_stream(self):
+        now = datetime.now()
+
+        columns = (('name', Type.String()),
+                   ('date_added', Type.Date()),
+                   ('value', Type.Int32()))
+
+        db = self.report_db.connected()
+
+        self.assertTrue(db.write(db.sql.create_table(table='testtable_write_stream',
+                                                     date_column='date_added',
+                                                     index=('name',),
+                                                     columns=columns)))
+
+        rows = ((u'row %s' % i, now, i) for i in xrange(1000))
+        self.assertTrue(db.write_stream(table='testtable_write_stream', values=rows, columns=columns, max_rows=300))
+
+        rows = ((u'row %s' % i, now, i) for i in xrange(1000, 1500))
+        self.assertTrue(db.write_stream(table='testtable_write_stream', values=rows, columns=columns, max_bytes=1024))
+
+        self.assertTrue(db.write_stream(table='testtable_write_stream', values=(), columns=columns), "should accept empty data")
+
+        from_db = list(db.read(sql="SELECT SUM(value) AS total, COUNT(*) AS count FROM test.testtable_write_stream",
+                               columns=(('total', Type.Int64()), ('count', Type.UInt64()))))
+        self.assertEqual(from_db[0][0]['count'], 1500)
+        self.assertEqual(from_db[0][0]['total'], sum(xrange(1500)))
+
+    def test_row_binary_write_and_read(self):
+        db = Database(url=os.environ['TEST_CLICKHOUSE_URL'], db='test', data_format='RowBinary').connected()
+
+        columns = (('name', Type.String()),
+                   ('date_added', Type.Date()),
+                   ('time', Type.DateTime()),
+                   ('value', Type.Int32()),
+                   ('cost', Type.Decimal64(5)),
+                   ('set', Type.Array(items=Type.Int32())))
+
+        rows = [[u'Строка\twith tab', datetime(2019, 2, 28), datetime(2019, 2, 28, 13, 45, 10), -123, Decimal('0.00085'), [1, 2, 3]],
+                ['bar', datetime(2019, 3, 1), datetime(2019, 3, 1, 0, 0, 1), 666, Decimal('10.5'), []]]
+
+        self.assertTrue(db.write(db.sql.create_table(table='testtable_row_binary',
+                                                     date_column='date_added',
+                                                     index=('name',),
+                                                     columns=columns)))
+        self.assertTrue(db.write_stream(table='testtable_row_binary', values=rows, columns=columns))
+
+        from_db = list(db.read(sql="SELECT * FROM test.testtable_row_binary ORDER BY value", columns=columns))
+        self.assertEqual(len(from_db), 2)
+        self.assertEqual(from_db[0][2], 2)
+        self.assertEqual(from_db[0][0]['name'], u'Строка\twith tab'.encode('utf-8'))
+        self.assertEqual([from_db[1][0][name] for name, t in columns[1:]], rows[1][1:])
+
+        from_db = list(db.read(sql="SELECT * FROM test.testtable_row_binary ORDER BY value;", columns=columns, stream=True))
+        self.assertEqual(from_db[0][0]['value'], -123)
+        self.assertIsNone(from_db[0][2])
+
+        tab_separated = list(db.read(sql="SELECT value FROM test.testtable_row_binary ORDER BY value", columns=(('value', Type.Int32()),), data_format='TabSeparated'))
+        self.assertEqual(map(lambda (row, i, total): row['value'], tab_separated), [-123, 666])
+
+        values = db.read_columns(sql="SELECT value, cost FROM test.testtable_row_binary ORDER BY value", columns=(('value', Type.Int32()), ('cost', Type.Decimal64(5))))
+        self.assertEqual(values['value'].tolist(), [-123, 666])
+        self.assertEqual(values['cost'], [Decimal('0.00085'), Decimal('10.5')])
+
+        self.assertEqual(sorted(dict(db.describe('testtable_row_binary')).keys()), sorted(dict(columns).keys()))
+
+        with self.assertRaises(Exception):
+            Database(url=os.environ['TEST_CLICKHOUSE_URL'], db='test', data_format='CSV')
+
 
 class TabSeparatedTestCase(unittest.TestCase):
     def test_trivial(self):
@@ -383,6 +525,16 @@ class TabSeparatedTestCase(unittest.TestCase):
 
         self.assertIn("dimensions for every row should match", context.exception.message)
 
+    def test_iter(self):
+        lines = iter_tab_separated(iter((('Petya', 22), ('Masha', 19), (u'Василий', 34))))
+        self.assertEqual(list(lines), [u"Petya\t22\n", u"Masha\t19\n", u"Василий\t34\n"])
+        self.assertEqual(list(iter_tab_separated(())), [])
+
+        with self.assertRaises(TabSeparatedError) as context:
+            list(iter_tab_separated((('Petya', 22), ('Hacker',))))
+
+        self.assertIn("dimensions for every row should match", context.exception.message)
+
 
 
 class SQLGeneratorTestCase(unittest.TestCase):
@@ -401,6 +553,61 @@ class SQLGeneratorTestCase(unittest.TestCase):
         self.assertEqual(gen.describe_query("SELECT 2*2 as result"), "DESCRIBE (SELECT 2*2 as result);")
         self.assertEqual(gen.describe_query("SELECT 2*2 as result;"), "DESCRIBE (SELECT 2*2 as result);")
 
+    def test_tables_manipulation(self):
+        gen = SQLGenerator(db_name='test')
+        self.assertEqual(gen.drop_table('sometable'), "DROP TABLE IF EXISTS test.sometable;")
+        self.assertEqual(gen.drop_table('sometable', if_exists=False), "DROP TABLE test.sometable;")
+        self.assertEqual(gen.create_table_as('copy', 'sometable'), "CREATE TABLE IF NOT EXISTS test.copy AS test.sometable;")
+        self.assertEqual(gen.insert_select('sometable', 'copy', ('id', 'name')), "INSERT INTO test.sometable (id, name) SELECT id, name FROM test.copy;")
+
+    def test_rollups(self):
+        gen = SQLGenerator(db_name='test')
+        rollup = Rollup(table='hits_daily', source='{db}.hits', date_column='day',
+                        keys=[('day', Type.Date(), 'toDate(time)'), ('zone', Type.String(), 'dim_zone')],
+                        sums=[('clicks', Type.UInt64(), 'count()')],
+                        where="dim_zone != ''")
+
+        self.assertEqual(rollup.view, 'hits_daily_view')
+        self.assertEqual(rollup.key_names(), ['day', 'zone'])
+        self.assertEqual(rollup.sum_names(), ['clicks'])
+
+        self.assertEqual(gen.rollup_select(rollup),
+                         "SELECT toDate(time) AS day, dim_zone AS zone, count() AS clicks FROM test.hits "
+                         "WHERE (dim_zone != '') GROUP BY day, zone")
+        self.assertEqual(gen.insert_rollup(rollup, table='hits_daily_new', where='id <= 10'),
+                         "INSERT INTO test.hits_daily_new (day, zone, clicks) SELECT toDate(time) AS day, dim_zone AS zone, count() AS clicks "
+                         "FROM test.hits WHERE (dim_zone != '') AND (id <= 10) GROUP BY day, zone;")
+        self.assertEqual(gen.create_rollup_view(rollup),
+                         "CREATE MATERIALIZED VIEW IF NOT EXISTS test.hits_daily_view TO test.hits_daily AS "
+                         "SELECT toDate(time) AS day, dim_zone AS zone, count() AS clicks FROM test.hits "
+                         "WHERE (dim_zone != '') GROUP BY day, zone;")
+        self.assertTrue(gen.create_rollup_table(rollup).endswith("ENGINE = SummingMergeTree(day, (day, zone), 8192, (clicks))"))
+
+        joined = Rollup(table='conversions_daily', source='(SELECT * FROM {db}.hits{source_where}) AS hits', date_column='day',
+                        keys=[('day', Type.Date(), 'toDate(time)')],
+                        sums=[('conversions', Type.UInt64(), 'count()')])
+        self.assertEqual(gen.rollup_select(joined),
+                         "SELECT toDate(time) AS day, count() AS conversions FROM (SELECT * FROM test.hits) AS hits GROUP BY day")
+        self.assertEqual(gen.insert_rollup(joined, table='conversions_daily_new', source_where='toYYYYMM(time) = 201902'),
+                         "INSERT INTO test.conversions_daily_new (day, conversions) SELECT toDate(time) AS day, count() AS conversions "
+                         "FROM (SELECT * FROM test.hits WHERE toYYYYMM(time) = 201902) AS hits GROUP BY day;")
+        self.assertEqual(gen.replace_partition('conversions_daily', 201902, 'conversions_daily_new'),
+                         "ALTER TABLE test.conversions_daily REPLACE PARTITION 201902 FROM test.conversions_daily_new;")
+        self.assertEqual(gen.create_log_table('rollup_marks', [('rollup', Type.String()), ('last_idx', Type.Int64())]),
+                         "CREATE TABLE IF NOT EXISTS test.rollup_marks (rollup String, last_idx Int64) ENGINE = Log;")
+
+        self.assertEqual(gen.rename_tables([('a', 'a_old'), ('a_new', 'a')]), "RENAME TABLE test.a TO test.a_old, test.a_new TO test.a;")
+        self.assertEqual(gen.list_tables(), "SELECT name FROM system.tables WHERE database = 'test';")
+
+    def test_columns_manipulation(self):
+        gen = SQLGenerator(db_name='test')
+        self.assertEqual(gen.add_column('sometable', 'dim_os', Type.LowCardinality(items=Type.String()), after='time'),
+                         "ALTER TABLE test.sometable ADD COLUMN dim_os LowCardinality(String) AFTER time;")
+        self.assertEqual(gen.add_column('sometable', 'dim_zone', Type.String()),
+                         "ALTER TABLE test.sometable ADD COLUMN dim_zone String;")
+        self.assertEqual(gen.modify_column('sometable', 'dim_os', Type.LowCardinality(items=Type.String())),
+                         "ALTER TABLE test.sometable MODIFY COLUMN dim_os LowCardinality(String);")
+
     def test_create_database(self):
         gen = SQLGenerator(db_name='test')
         self.assertEqual(gen.create_database(), "CREATE DATABASE IF NOT EXISTS \"test\";")
@@ -438,6 +645,28 @@ bar\t666\t[6,6,6]
 baz\t321\t[3,2,1]"""
         self.assertMultiLineEqual(sql, expected)
 
+    def test_insert_values_stream(self):
+        gen = SQLGenerator(db_name='test')
+
+        rows = iter([
+            [u'фу', 123, [1,2,3]],
+            ['bar', 666, [6,6,6]]
+        ])
+
+        columns = (('name', Type.String()),
+                   ('value', Type.Int64()),
+                   ('set', Type.Array(items=Type.Int32())))
+
+        self.assertEqual(gen.insert_statement('sometable', ('name', 'value', 'set')),
+                         "INSERT INTO test.sometable (name, value, set) FORMAT TabSeparated")
+        self.assertEqual(list(gen.insert_values_stream(values=rows, columns=columns)),
+                         [u"фу\t123\t[1,2,3]\n".encode('utf-8'), "bar\t666\t[6,6,6]\n"])
+
+        with self.assertRaises(Exception) as context:
+            list(gen.insert_values_stream(values=[['foo', 123]], columns=columns))
+
+        self.assertIn('Dimensions of `values` and `columns` definition should match', context.exception.message)
+
     def test_create_table_for_entity(self):
         gen = SQLGenerator(db_name='test')
 
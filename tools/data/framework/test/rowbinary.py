@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from datetime import datetime
+from decimal import Decimal
+from uuid import UUID
+from ipaddr import IPAddress
+
+from ..rowbinary import *
+from ..types import *
+
+
+def _chunked(data, size):
+    return [data[i:i + size] for i in xrange(0, len(data), size)]
+
+
+class RowBinaryTestCase(unittest.TestCase):
+    def assertRoundTrip(self, type_factory, value, expected=None):
+        encode, decode = codec(type_factory)
+        decoded = decode(ByteReader([encode(value)]))
+        self.assertEqual(decoded, value if expected is None else expected)
+        if not isinstance(decoded, (int, long)):
+            self.assertEqual(type(decoded), type(value if expected is None else expected))
+
+    def test_varint(self):
+        for value in (0, 1, 127, 128, 300, 16384, 2 ** 40):
+            self.assertEqual(read_varint(ByteReader([write_varint(value)])), value)
+        self.assertEqual(write_varint(1), '\x01')
+        self.assertEqual(write_varint(300), '\xac\x02')
+
+    def test_integers(self):
+        for type_factory, value in ((Type.Int8(), -128), (Type.UInt8(), 255),
+                                    (Type.Int16(), -32768), (Type.UInt16(), 65535),
+                                    (Type.Int32(), -2 ** 31), (Type.UInt32(), 2 ** 32 - 1),
+                                    (Type.Int64(), -2 ** 63), (Type.UInt64(), 2 ** 64 - 1)):
+            self.assertRoundTrip(type_factory, value)
+        self.assertEqual(codec(Type.UInt16())[0](1), '\x01\x00')
+        self.assertEqual(codec(Type.Int32())[0](-2), '\xfe\xff\xff\xff')
+
+    def test_idx(self):
+        obj = type('Linked', (object,), {'_idx': 12})()
+        self.assertRoundTrip(Type.Idx(), obj, expected=12)
+        self.assertRoundTrip(Type.Idx(), None, expected=-1)
+        self.assertRoundTrip(Type.Idx(), 7)
+
+    def test_floats(self):
+        self.assertRoundTrip(Type.Float32(), 0.5)
+        self.assertRoundTrip(Type.Float64(), 1.0 / 3)
+
+    def test_decimals(self):
+        self.assertRoundTrip(Type.Decimal32(4), Decimal('3.5555'))
+        self.assertRoundTrip(Type.Decimal64(5), Decimal('-1234567.12345'))
+        self.assertRoundTrip(Type.Decimal128(19), Decimal('-12345678901234567.1234567890123456789'))
+        self.assertRoundTrip(Type.Decimal(precision=12, scale=2), Decimal('1.50'))
+        self.assertEqual(codec(Type.Decimal32(2))[0](Decimal('1.5')), '\x96\x00\x00\x00')
+        self.assertRoundTrip(Type.Money(), (Decimal('0.00085'), 'USD'), expected=(Decimal('0.00085'), 'Unknown'))
+
+    def test_dates(self):
+        self.assertRoundTrip(Type.Date(), datetime(2019, 2, 28))
+        self.assertRoundTrip(Type.Date(), datetime(2019, 2, 28, 13, 45), expected=datetime(2019, 2, 28))
+        self.assertEqual(codec(Type.Date())[0](datetime(1970, 1, 2)), '\x01\x00')
+        self.assertRoundTrip(Type.DateTime(), datetime(2019, 2, 18, 23, 38, 32))
+        self.assertEqual(codec(Type.DateTime())[0](datetime(1970, 1, 1, 0, 0, 1)), '\x01\x00\x00\x00')
+
+    def test_strings(self):
+        self.assertRoundTrip(Type.String(), 'somestring')
+        self.assertRoundTrip(Type.String(), u'Строка', expected=u'Строка'.encode('utf-8'))
+        self.assertRoundTrip(Type.String(), 'with\ttab\nand newline')
+        self.assertRoundTrip(Type.String(), '')
+        self.assertEqual(codec(Type.String())[0]('abc'), '\x03abc')
+        self.assertRoundTrip(Type.IPAddress(), IPAddress('192.168.9.40'))
+
+    def test_uuid_and_bool(self):
+        self.assertRoundTrip(Type.UUID(), UUID('61f0c404-5cb3-11e7-907b-a6006ad3dba0'))
+        self.assertEqual(codec(Type.UUID())[0](UUID(int=1)), '\x00' * 8 + '\x01' + '\x00' * 7)
+        self.assertRoundTrip(Type.Bool(), True)
+        self.assertRoundTrip(Type.Bool(), False)
+
+    def test_arrays(self):
+        self.assertRoundTrip(Type.Array(items=Type.Int32()), [1, -2, 3])
+        self.assertRoundTrip(Type.Array(items=Type.String()), ['some', 'other'])
+        self.assertRoundTrip(Type.Array(items=Type.Array(items=Type.UInt8())), [[], [1, 2]])
+        self.assertEqual(codec(Type.Array(items=Type.UInt8()))[0]([1, 2]), '\x02\x01\x02')
+
+    def test_low_cardinality(self):
+        self.assertRoundTrip(Type.LowCardinality(items=Type.String()), 'Android')
+        self.assertEqual(codec(Type.LowCardinality(items=Type.String()))[0]('abc'), '\x03abc')
+
+    def test_unsupported(self):
+        with self.assertRaises(RowBinaryError):
+            codec(Type.Enum8())
+
+    def test_rows(self):
+        columns = (('name', Type.String()),
+                   ('date_added', Type.Date()),
+                   ('value', Type.Int32()),
+                   ('set', Type.Array(items=Type.Int32())))
+        rows = [['foo', datetime(2019, 2, 28), 123, [1, 2, 3]],
+                ['bar', datetime(2019, 3, 1), 666, []]]
+
+        row_binary = RowBinary(columns)
+        data = ''.join(row_binary.encode_rows(rows))
+
+        for chunk_size in (1, 3, 1000):
+            self.assertEqual(list(row_binary.decode_rows(_chunked(data, chunk_size))), rows)
+        self.assertEqual(list(row_binary.decode_rows([])), [])
+
+        with self.assertRaises(RowBinaryError):
+            list(row_binary.decode_rows([data[:-1]]))
+
+        with self.assertRaises(Exception):
+            row_binary.encode_row(['foo'])
@@ -100,6 +100,17 @@ class TypesTestCase(unittest.TestCase):
         arr_str_type = factory_from_db_type('StrangeUnknownType')
         self.assertTrue(type(arr_str_type) is Type.Default)
 
+    def test_type_low_cardinality(self):
+        type_factory = factory_from_db_type('LowCardinality(String)')
+        self.assertTrue(type(type_factory) is Type.LowCardinality)
+        self.assertTrue(type(type_factory._items_type) is Type.String)
+        self.assertEqual(type_factory.into_db_type(), 'LowCardinality(String)')
+        self.assertEqual(type_factory.into_db_value(py_value=u'Android'), u'Android')
+        self.assertEqual(type_factory.from_db_value('Android'), 'Android')
+        self.assertEqual(type_factory.default_py_value(), '')
+
+        self.assertEqual(factory_from_db_type('LowCardinality(UInt32)').into_db_type(), 'LowCardinality(UInt32)')
+
     def test_type_ipaddress(self):
         type_factory = Type.IPAddress()
         self.assertEqual(type_factory.into_db_type(), 'String')
@@ -109,3 +120,19 @@ class TypesTestCase(unittest.TestCase):
     def test_type_array_of_strings_doesnt_eat_value(self):
         type_factory = Type.Array(items=Type.String())
         self.assertEqual(type_factory.into_db_value(py_value=['some', 'other']), "['some','other']")
+
+    def test_columns_containers(self):
+        self.assertEqual(array_typecode(Type.Int8()), 'b')
+        self.assertEqual(array_typecode(Type.UInt16()), 'H')
+        self.assertEqual(array_typecode(Type.Int32()), 'i')
+        self.assertEqual(array_typecode(Type.UInt64()), 'L')
+        self.assertEqual(array_typecode(Type.Idx()), 'l')
+        self.assertEqual(array_typecode(Type.Float32()), 'f')
+        self.assertEqual(array_typecode(Type.Float64()), 'd')
+        self.assertIsNone(array_typecode(Type.String()))
+        self.assertIsNone(array_typecode(Type.Decimal64(5)))
+
+        column = new_column(Type.UInt64())
+        column.append(Type.UInt64().from_db_value('18446744073709551615'))
+        self.assertEqual(column.tolist(), [18446744073709551615L])
+        self.assertEqual(new_column(Type.Date()), [])
@@ -1,5 +1,5 @@
 import unittest
-from ..utils import diff, diff_apply
+from ..utils import diff, diff_apply, split_stream, counted
 
 
 class DiffTestCase(unittest.TestCase):
@@ -158,3 +158,26 @@ class DiffApplyCustomObjectTestCase(unittest.TestCase):
             return sorted(columns, key=lambda i: i.name, reverse=True)
 
         self.assertEqual(diff([c1, c2], [c1, c2, c3], custom_sorted=custom_sorted), ((c3, c2),))
+
+
+class SplitStreamTestCase(unittest.TestCase):
+    def chunks(self, items, **kwargs):
+        return [list(chunk) for chunk in split_stream(iter(items), **kwargs)]
+
+    def test_no_limits(self):
+        self.assertEqual(self.chunks(['a', 'b', 'c']), [['a', 'b', 'c']])
+        self.assertEqual(self.chunks([]), [])
+
+    def test_max_items(self):
+        self.assertEqual(self.chunks(['a', 'b', 'c', 'd', 'e'], max_items=2), [['a', 'b'], ['c', 'd'], ['e']])
+        self.assertEqual(self.chunks(['a', 'b'], max_items=2), [['a', 'b']])
+
+    def test_max_bytes(self):
+        self.assertEqual(self.chunks(['aa', 'b', 'cc', 'ddd', 'e'], max_bytes=3), [['aa', 'b'], ['cc', 'ddd'], ['e']])
+        self.assertEqual(self.chunks(['aaaa', 'b'], max_bytes=3), [['aaaa'], ['b']], "should not split an item")
+        self.assertEqual(self.chunks(['a', 'b', 'c', 'd'], max_items=3, max_bytes=2), [['a', 'b'], ['c', 'd']])
+
+    def test_counted(self):
+        counter = [0]
+        self.assertEqual(self.chunks(counted(['a', 'b', 'c'], counter), max_items=2), [['a', 'b'], ['c']])
+        self.assertEqual(counter, [3])
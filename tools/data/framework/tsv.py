@@ -64,3 +64,15 @@ class TabSeparated(object):
         dims = len(self.data[0])
 
         return u'\n'.join(map(_tab_separated_row_func(dims), enumerate(self.data)))
+
+
+def iter_tab_separated(data):
+    '''
+    Lazily generates tab separated lines from iterable of rows.
+    Every line ends with newline, so lines could be streamed as is.
+    '''
+    row_func = None
+    for enumeration in enumerate(data):
+        if row_func is None:
+            row_func = _tab_separated_row_func(len(enumeration[1]))
+        yield row_func(enumeration) + u'\n'
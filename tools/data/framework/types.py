@@ -1,3 +1,4 @@
+from array import array
 from decimal import Decimal
 from uuid import UUID
 from datetime import datetime
@@ -35,7 +36,7 @@ class Type(object):
 
     class Default(Typecast):
         def into_db_value(self, context=None, py_value=None, column_name=None):
-            return u"{v}".format(v=unicode(py_value))
+            return unicode(py_value)
         def into_db_type(self): return 'String'
         def from_db_value(self, db_value, column_name=None):
             return str(db_value)
@@ -74,7 +75,7 @@ class Type(object):
             self.unsigned = unsigned
 
         def into_db_value(self, context=None, py_value=None, column_name=None):
-            return '{val}'.format(val=int(py_value))
+            return str(int(py_value))
 
         def into_db_type(self):
             if self.unsigned:
@@ -151,7 +152,7 @@ class Type(object):
     class String(Default):
         def into_db_type(self): return 'String'
         def into_db_value(self, context=None, py_value=None, column_name=None):
-            return u"{v}".format(v=unicode(py_value))
+            return unicode(py_value)
         def from_db_value(self, db_value, column_name=None):
             return str(db_value)
 
@@ -201,6 +202,26 @@ class Type(object):
         def default_db_value(self):
             return None
 
+    class LowCardinality(Typecast):
+        ''' Dictionary-encoded column of `items` type '''
+        def __init__(self, items):
+            self._items_type = items
+
+        def into_db_value(self, context=None, py_value=None, column_name=None):
+            return self._items_type.into_db_value(context=context, py_value=py_value, column_name=column_name)
+
+        def into_db_type(self):
+            return 'LowCardinality({items_type})'.format(items_type=self._items_type.into_db_type())
+
+        def from_db_value(self, db_value, column_name=None):
+            return self._items_type.from_db_value(db_value, column_name=column_name)
+
+        def default_py_value(self):
+            return self._items_type.default_py_value()
+
+        def default_db_value(self):
+            return self._items_type.default_db_value()
+
     class LinkedObjects(Typecast):
         def into_db_value(self, context=None, py_value=None, column_name=None):
             if (type(py_value) is not list) and (type(py_value) is not tuple):
@@ -336,7 +357,9 @@ def factory_from_db_type(db_type):
         return supported_type(db_type)
 
 def supported_type(db_type):
-    if 'Array' in db_type:
+    if db_type.startswith('LowCardinality('):
+        return Type.LowCardinality(items=factory_from_db_type(db_type[len('LowCardinality('):-1]))
+    elif 'Array' in db_type:
         type_param = db_type.split('Array(')[1].split(')')[0]
         return Type.Array(items=factory_from_db_type(type_param))
     elif 'Decimal32' in db_type:
@@ -358,6 +381,26 @@ def supported_type(db_type):
         return Type.Default()
 
 
+def array_typecode(type_factory):
+    ''' Returns `array.array` typecode suitable for values of `type_factory` or None '''
+    if isinstance(type_factory, Type.Float32):
+        return 'f'
+    elif isinstance(type_factory, Type.Float64):
+        return 'd'
+    elif isinstance(type_factory, Type.Integer):
+        bits, unsigned = getattr(type_factory, 'bits', 64), getattr(type_factory, 'unsigned', False)
+        typecode = {8: 'b', 16: 'h', 32: 'i', 64: 'l'}[bits]
+        return typecode.upper() if unsigned else typecode
+    return None
+
+def new_column(type_factory):
+    ''' Returns empty container for values of column with `type_factory` '''
+    typecode = array_typecode(type_factory)
+    if typecode is None:
+        return []
+    return array(typecode)
+
+
 KNOWN_DB_TYPES = {
     'UInt8': Type.UInt8(),
     'UInt16': Type.UInt16(),
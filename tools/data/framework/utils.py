@@ -37,3 +37,33 @@ def diff_apply(source, diff):
         index = result.index(after)
         result = result[0:index + 1] + [item] + result[index + 1:]
     return tuple(result)
+
+
+def split_stream(items, max_items=None, max_bytes=None):
+    '''
+    Splits iterable of strings into consecutive chunks, so that every chunk
+    contains no more than `max_items` items and stops once it reached `max_bytes`.
+    Chunks are generators themselves, so nothing is held in memory,
+    but every chunk should be exhausted before requesting the next one.
+    '''
+    items = iter(items)
+    for first in items:
+        yield _stream_chunk(first, items, max_items, max_bytes)
+
+def _stream_chunk(first, items, max_items, max_bytes):
+    count, size = 1, len(first)
+    yield first
+
+    while (max_items is None or count < max_items) and (max_bytes is None or size < max_bytes):
+        try:
+            item = next(items)
+        except StopIteration:
+            return
+        count, size = count + 1, size + len(item)
+        yield item
+
+def counted(items, counter):
+    ''' Passes `items` through, counting them in `counter[0]` '''
+    for item in items:
+        counter[0] += 1
+        yield item
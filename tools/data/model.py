@@ -1,6 +1,8 @@
 import logging
+from multiprocessing import Pool
 
 from framework.base import *
+from framework.bus import Connection as BusConnection
 from framework.reporting import *
 from framework.types import *
 from framework.utils import diff, diff_apply
@@ -43,11 +45,11 @@ class Offer(DataObject, ReportingObject):
 
     @property
     def name(self):
-        return self.__dict__['name']
+        return self._raw('name')
 
     @property
     def url_template(self):
-        return self.__dict__['url_template']
+        return self._raw('url_template')
 
 
 class Conversion(DataObject, ReportingObject):
@@ -74,19 +76,35 @@ class Conversion(DataObject, ReportingObject):
 
 class Hit(DataObject, ReportingObject):
     class Dimension(Typecast):
+        def __init__(self, type_factory=None):
+            self.type_factory = type_factory or Type.String()
         def _dimension_name_from_column_name(self, column_name):
             return column_name.split("dim_")[1]
         def into_db_value(self, context=None, py_value=None, column_name=None):
             dim_name = self._dimension_name_from_column_name(column_name)
-            return u"{v}".format(v=unicode(context.__dict__['dimensions'].get(dim_name, "")))
-        def into_db_type(self): return 'String'  # todo: typed dimensions
+            return unicode(context._raw('dimensions').get(dim_name, ""))
+        def into_db_type(self): return self.type_factory.into_db_type()
         def from_db_value(self, db_value, column_name=None):
-            return str(db_value)
+            return self.type_factory.from_db_value(db_value, column_name=column_name)
         def default_py_value(self): return ''
         def default_db_value(self): return None
 
     TABLE_NAME = 'hits'
 
+    # dimensions with a few distinct but repetitive values are dictionary-encoded,
+    # all the others are stored as plain strings
+    DIMENSION_TYPES = {
+        'useragent': Type.LowCardinality(items=Type.String()),
+        'os': Type.LowCardinality(items=Type.String()),
+        'os_version': Type.LowCardinality(items=Type.String()),
+        'connection_type': Type.LowCardinality(items=Type.String()),
+        'langcode': Type.LowCardinality(items=Type.String()),
+        'ua_category': Type.LowCardinality(items=Type.String()),
+        'ua_type': Type.LowCardinality(items=Type.String()),
+        'ua_vendor': Type.LowCardinality(items=Type.String()),
+        'ua_name': Type.LowCardinality(items=Type.String()),
+    }
+
     @property
     @linked('campaign_id')
     def campaign(self):
@@ -109,11 +127,23 @@ class Hit(DataObject, ReportingObject):
 
     @property
     def external_id(self):
-        return self.__dict__.get('external_id')
+        return self._raw('external_id', None)
 
     def into_db_columns(self):
-        return self.static_columns() + \
-         list(map(lambda dim: ("dim_%s" % dim, Hit.Dimension()) , self.__dict__['dimensions'].keys()))
+        return self.static_columns() + self.dimension_columns(self._raw('dimensions').keys())
+
+    @classmethod
+    def dimension_columns(cls, dimensions):
+        return list(map(lambda dim: ("dim_%s" % dim, Hit.Dimension(cls.dimension_type(dim))), dimensions))
+
+    @classmethod
+    def dimension_type(cls, dimension):
+        return cls.DIMENSION_TYPES.get(dimension, Type.String())
+
+    @classmethod
+    def encoder_columns(cls):
+        # dimensions differ from hit to hit, they are encoded by `Hit.Dimension` with hit as a context
+        return cls.static_columns()
 
     @classmethod
     def static_columns(cls):
@@ -134,6 +164,50 @@ ENTITIES = {
 }
 
 
+# Rollups of hits and conversions for slice reports, keyed by day of click, campaign, zone, connection type and offer.
+# Hits of load testing tools are excluded.
+ROLLUP_KEYS = [('day', Type.Date(), 'toDate(time)'),
+               ('campaign', Type.Int64(), 'campaign'),
+               ('zone', Type.String(), 'dim_zone'),
+               ('connection_type', Type.String(), 'dim_connection_type'),
+               ('destination', Type.Int64(), 'destination')]
+
+ROLLUP_WHERE = "dim_useragent != 'ApacheBench/2.3'"
+
+ROLLUP_REQUIRED_COLUMNS = ('dim_zone', 'dim_connection_type', 'dim_useragent', 'dim_external_id')
+
+# populated by materialized view on every insert into hits
+HITS_ROLLUP = Rollup(table='hits_daily',
+                     source='{db}.hits',
+                     date_column='day',
+                     keys=ROLLUP_KEYS,
+                     sums=[('clicks', Type.UInt64(), 'count()'),
+                           ('cost', Type.Decimal64(5), 'toDecimal64(sum(cost), 5)')],
+                     where=ROLLUP_WHERE)
+
+# conversions are attributed to hits with the same external id, so the rollup is updated
+# by `DataImport.update_rollups` for months of hits which got new conversions
+CONVERSIONS_ROLLUP = Rollup(table='conversions_daily',
+                            source='(SELECT * FROM {db}.hits{source_where}) ALL INNER JOIN (SELECT external_id AS dim_external_id, revenue FROM {db}.conversions) USING dim_external_id',
+                            date_column='day',
+                            keys=ROLLUP_KEYS,
+                            sums=[('conversions', Type.UInt64(), 'count()'),
+                                  ('revenue', Type.Decimal64(5), 'toDecimal64(sum(revenue), 5)')],
+                            where=ROLLUP_WHERE)
+
+
+# indexes of hits and conversions every rollup built by `DataImport.update_rollups` is up to date with
+ROLLUP_MARKS_TABLE = 'rollup_marks'
+ROLLUP_MARKS_COLUMNS = [('rollup', Type.String()),
+                        ('entity', Type.String()),
+                        ('last_idx', Type.Int64())]
+
+# months of hits with conversions imported after `conversions` index, or imported after `hits` index and converted
+TOUCHED_MONTHS_SQL = '''SELECT DISTINCT toYYYYMM(time) AS month FROM {db}.hits
+WHERE dim_external_id IN (SELECT external_id FROM {db}.conversions WHERE id > {conversions})
+   OR (id > {hits} AND dim_external_id IN (SELECT external_id FROM {db}.conversions))'''
+
+
 # _custom_diff_sorting maintains a stable order to keep 'diff' working and to build correct schema update
 def _custom_diff_sorting(comparable_columns):
 
@@ -188,6 +262,36 @@ class ComparableColumn(object):
         return "{name}".format(name=self.name)
 
 
+class SchemaAccumulator(object):
+    '''
+    Collects distinct dimensions of a batch of hits in one pass.
+
+    Hits are keyed by the frozen set of their dimension keys,
+    so every unique layout of dimensions costs a single set union.
+    '''
+    def __init__(self):
+        self._layouts = set()
+        self._dimensions = set()
+
+    def add(self, hit):
+        self._add_layout(frozenset(hit._raw('dimensions').keys()))
+
+    def add_columns(self, columns):
+        self._add_layout(frozenset(name.split('dim_', 1)[1] for name, type in columns if name.startswith('dim_')))
+
+    def _add_layout(self, layout):
+        if layout not in self._layouts:
+            self._layouts.add(layout)
+            self._dimensions |= layout
+
+    @property
+    def layouts_count(self):
+        return len(self._layouts)
+
+    def columns(self):
+        return Hit.static_columns() + Hit.dimension_columns(sorted(self._dimensions))
+
+
 def wrap_comparable(columns):
     return [ComparableColumn(name=name, type=type) for name, type in columns]
 
@@ -195,17 +299,85 @@ def unwrap_comparable_into_raw_columns(comparable):
     return [(c.name, c.type) for c in comparable]
 
 def safe_dynamic_fields(columns):
-    return [(c[0], Hit.Dimension() if 'dim_' in c[0] else c[1]) for c in columns]
+    return [(c[0], _dimension(c[1]) if 'dim_' in c[0] else c[1]) for c in columns]
+
+def _dimension(type_factory):
+    # keeps type of dimension column as it's declared in reporting storage
+    return type_factory if isinstance(type_factory, Hit.Dimension) else Hit.Dimension(type_factory)
 
 class DataImport(object):
     LOGGER = 'dataimport'
 
-    def __init__(self, bus, report_db, logger=logging.getLogger(LOGGER)):
+    def __init__(self, bus, report_db, logger=logging.getLogger(LOGGER), insert_max_rows=100000, checkpoint=None, query_cache=None):
         self.log = logger
         self.bus = bus
         self.reporting = report_db
+        self.insert_max_rows = insert_max_rows
+        self.checkpoint = checkpoint
+        self.query_cache = query_cache
 
     def get_idx_of_latest_saved_entity(self, name, entity):
+        if self.checkpoint is None:
+            return self.scan_idx_of_latest_saved_entity(name, entity)
+
+        saved = self.checkpoint.get(name)
+        if saved is not None:
+            self.log.info("Checkpoint: we have {count} `{entities}` in reporting storage. The last one has index id={id}".format(
+                id=saved[0],
+                count=saved[1],
+                entities=name
+            ))
+            return saved
+
+        # there is no checkpoint yet, so we start it from the state of reporting storage
+        last_idx, count = self.scan_idx_of_latest_saved_entity(name, entity)
+        self.checkpoint.commit(name, entity.TABLE_NAME, last_idx, count)
+        return last_idx, count
+
+    def verify_checkpoint(self, names=tuple(ENTITIES.keys())):
+        '''
+        Compares checkpoint with the state of reporting storage (full table scan).
+        Mismatched entities are reset to the state of reporting storage.
+        Returns names of mismatched entities.
+        '''
+        mismatched = []
+        for name in names:
+            saved = self.checkpoint.get(name)
+            if saved is None:
+                continue
+
+            entity = ENTITIES[name]
+            last_idx, count = self.scan_idx_of_latest_saved_entity(name, entity)
+            if count != saved[1]:
+                self.log.warn("Checkpoint for `{name}` doesn't match reporting storage: {saved} imported according to checkpoint, "
+                              "{count} found in storage. Resetting checkpoint.".format(name=name, saved=saved[1], count=count))
+                self.checkpoint.commit(name, entity.TABLE_NAME, last_idx, count)
+                mismatched.append(name)
+        return mismatched
+
+    def commit_checkpoint(self, name, entity, objs):
+        ''' Saves into checkpoint that `objs` are committed into reporting storage '''
+        if len(objs) == 0:
+            return
+        self.advance_checkpoint(name, entity, max(map(lambda o: o.id, objs)), len(objs))
+
+    def advance_checkpoint(self, name, entity, last_idx, imported_count):
+        self.invalidate_queries([entity.TABLE_NAME])
+        if self.checkpoint is None:
+            return
+        saved_last_idx, saved_count = self.checkpoint.get(name) or (0, 0)
+        self.checkpoint.commit(name, entity.TABLE_NAME, max(saved_last_idx, last_idx), saved_count + imported_count)
+
+    def invalidate_queries(self, tables):
+        ''' Makes cached results of reports which read `tables` stale '''
+        if self.query_cache is None:
+            return
+        tables = list(tables)
+        if Hit.TABLE_NAME in tables:  # rolled up by materialized view on every insert
+            tables.append(HITS_ROLLUP.table)
+        self.query_cache.invalidate(tables)
+
+    def scan_idx_of_latest_saved_entity(self, name, entity):
         db_name = self.reporting.name
         table_name = entity.TABLE_NAME
 
@@ -234,18 +406,38 @@ class DataImport(object):
             self.init_entity(name, entity)
 
         if count == 0:
-            return list(self.bus.multiread(name, start=0))
+            return list(self.bus.multiread(name, start=0, compact=True))
         else:
-            return list(self.bus.multiread(name, start=last_id+1))
+            return list(self.bus.multiread(name, start=last_id+1, compact=True))
 
-    def import_entity(self, name, table_name, objs, columns):
+    def import_entity(self, name, table_name, objs, columns, entity=None):
+        '''
+        Inserts `objs` into `table_name`. If `entity` is set, the checkpoint is moved past every INSERT
+        right after it's committed, so objects of a failed INSERT are the only ones imported again.
+        '''
         column_names = zip(*columns)[0]
-        objects_as_db_values = map(lambda o: o.into_db_values(columns=columns), objs)
-        sql = self.reporting.sql.insert_values(table=table_name,
-                                               values=objects_as_db_values,
-                                               columns=column_names)
 
-        result = self.reporting.connected().write(sql=sql)
+        on_chunk = None
+        if entity is not None:
+            committed = [0]
+            def on_chunk(rows):
+                self.commit_checkpoint(name, entity, objs[committed[0]:committed[0] + rows])
+                committed[0] += rows
+
+        with self.bus.session():
+            # linked objects of the whole batch are read with a single round-trip
+            if objs:
+                self.bus.prefetch(objs, *linked_properties(objs[0].__class__))
+
+            # objects are already encoded into text values, so they're always sent as TabSeparated
+            objects_as_db_values = (o.into_db_values(columns=columns) for o in objs)
+
+            result = self.reporting.connected().write_stream(table=table_name,
+                                                             values=objects_as_db_values,
+                                                             columns=column_names,
+                                                             max_rows=self.insert_max_rows,
+                                                             data_format=TAB_SEPARATED,
+                                                             on_chunk=on_chunk)
         if not result:
             raise Exception("Unable to import entity `{name}`".format(name=name))
         self.log.info("Entity `{name}` has been imported succesfully".format(name=name))
@@ -275,7 +467,8 @@ class DataImport(object):
 
             objects_to_import_without_missed = filter(lambda i: i is not None, objects_to_import)
             self.import_entity(name=name, table_name=entity.TABLE_NAME,
-                               objs=objects_to_import_without_missed, columns=objects_to_import_without_missed[0].into_db_columns())
+                               objs=objects_to_import_without_missed, columns=objects_to_import_without_missed[0].into_db_columns(),
+                               entity=entity)
 
     def do_we_need_to_import(self, name, objs):
         if len(objs) > 0:
@@ -296,13 +489,24 @@ class DataImport(object):
         if not self.do_we_need_to_import(name, objects_to_import):
             return
 
-        self.log.info("Calculating migration...")
+        self.migrate_hits(table_name, objects_to_import)
 
-        # todo: we need one mutable and one immutable variables for computing diff
-        existing_columns = wrap_comparable(safe_dynamic_fields(self.reporting.connected().describe(table_name)))
-        source_columns = wrap_comparable(safe_dynamic_fields(self.reporting.connected().describe(table_name)))
+        columns = safe_dynamic_fields(self.reporting.connected().describe(table_name))
+
+        objects_to_import_without_missed = filter(lambda i: i is not None, objects_to_import)
+        self.import_entity(name=name, table_name=table_name,
+                           objs=objects_to_import_without_missed, columns=columns, entity=entity)
+
+        self.log.info("Successfully imported {count} new hits into table `{table_name}`".format(
+            count=len(objects_to_import),
+            table_name=table_name
+        ))
+
+    def migrate_hits(self, table_name, objects_to_import):
+        self.log.info("Calculating migration...")
 
         last_hit = None
+        schema = SchemaAccumulator()
         for i, o in enumerate(objects_to_import):
             if o is not None:
                 last_hit = o
@@ -311,11 +515,15 @@ class DataImport(object):
                               "It is a normal case, when data in Redis has been compacted, but could be a bad sign if it hasn't. "
                               "Missed hit appeared after hit with ID: {id} ".format(id=getattr(last_hit, 'id', "unknown")))
                 continue
-            delta = diff(existing_columns, wrap_comparable(o.into_db_columns()), custom_sorted=_custom_diff_sorting)
-            if delta is not None:
-                existing_columns = list(diff_apply(existing_columns, delta))
+            schema.add(o)
 
-        new_after_list = diff(source_columns, existing_columns, custom_sorted=_custom_diff_sorting)
+        self.migrate_hits_table(table_name, schema)
+
+    def migrate_hits_table(self, table_name, schema):
+        source_columns = wrap_comparable(safe_dynamic_fields(self.reporting.connected().describe(table_name)))
+
+        # the whole batch is merged in a single diff, since the union of dimensions is already known
+        new_after_list = diff(source_columns, wrap_comparable(schema.columns()), custom_sorted=_custom_diff_sorting)
 
         if new_after_list is not None and len(new_after_list) > 0:
             self.log.info("We need to add {count} more columns.".format(count=len(new_after_list)))
@@ -327,12 +535,7 @@ class DataImport(object):
             self.log.info("Applying new scheme")
 
             for new, after in new_after_list:
-                sql = "ALTER TABLE {db}.{table} ADD COLUMN {new_name} {new_type} AFTER {after_name};".format(
-                    db=self.reporting.name,
-                    table=table_name,
-                    new_name=new.name,
-                    new_type=new.type.into_db_type(),
-                    after_name=after.name)
+                sql = self.reporting.sql.add_column(table=table_name, column=new.name, type_factory=new.type, after=after.name)
 
                 self.log.info("\t Creating a column `{column}` with type `{type}` after `{after}`".format(
                     column=new.name,
@@ -346,13 +549,282 @@ class DataImport(object):
         else:
             self.log.info("\t We don't need any migrations! Just loading objects into storage.")
 
-        columns = safe_dynamic_fields(self.reporting.connected().describe(table_name))
+    def update_rollups(self):
+        '''
+        Creates rollups for reports if they don't exist yet and updates the rollup of conversions.
+        Returns False if there are no hits with dimensions required by rollups yet.
+        '''
+        tables = self.list_tables()
+        if Hit.TABLE_NAME not in tables or Conversion.TABLE_NAME not in tables:
+            self.log.info("There are no hits or conversions yet. Skipping rollups.")
+            return False
+
+        hits_columns = dict(self.reporting.connected().describe(Hit.TABLE_NAME))
+        missed = filter(lambda column: column not in hits_columns, ROLLUP_REQUIRED_COLUMNS)
+        if missed:
+            self.log.info("Hits have no columns {columns} yet. Skipping rollups.".format(columns=', '.join(missed)))
+            return False
+
+        if HITS_ROLLUP.view not in tables:
+            self.init_hits_rollup()
+
+        self.update_conversions_rollup(tables)
+        return True
+
+    def list_tables(self):
+        return [o['name'] for o, i, l in self.reporting.connected().read(sql=self.reporting.sql.list_tables(), columns=(('name', 'String'),))]
+
+    def init_hits_rollup(self):
+        '''
+        Creates rollup of hits, populated by materialized view, and backfills it with hits imported before the view.
+
+        Hits are imported in order of ids, so the ones imported before the view have ids up to `MAX(id)`
+        scanned before it's created. If `MAX(id)` has changed by the time the view is created, hits
+        are being imported by someone else and it's unknown which of them are rolled up by the view,
+        so the rollup is removed and initialisation is refused.
+        '''
+        self.log.info("Creating rollup `{table}`".format(table=HITS_ROLLUP.table))
+
+        last_id, count = self.scan_idx_of_latest_saved_entity('Hits', Hit)
+
+        for sql in (self.reporting.sql.drop_table(HITS_ROLLUP.table),
+                    self.reporting.sql.create_rollup_table(HITS_ROLLUP),
+                    self.reporting.sql.create_rollup_view(HITS_ROLLUP)):
+            if not self.reporting.connected().write(sql):
+                raise Exception("Unable to create rollup `{table}`".format(table=HITS_ROLLUP.table))
+
+        if self.scan_idx_of_latest_saved_entity('Hits', Hit) != (last_id, count):
+            for table in (HITS_ROLLUP.view, HITS_ROLLUP.table):
+                self.reporting.connected().write(self.reporting.sql.drop_table(table))
+            raise Exception("Hits have been imported while rollup `{table}` was created. "
+                            "Stop other importers and try again.".format(table=HITS_ROLLUP.table))
+
+        # hits imported after creation of the view are already rolled up by the view
+        if count > 0:
+            if not self.reporting.connected().write(self.reporting.sql.insert_rollup(HITS_ROLLUP, where='id <= %s' % last_id)):
+                raise Exception("Unable to backfill rollup `{table}`".format(table=HITS_ROLLUP.table))
+        self.invalidate_queries([HITS_ROLLUP.table])
+
+    def update_conversions_rollup(self, tables):
+        '''
+        Brings rollup of conversions up to date with hits and conversions imported since its previous update.
+        Only months of hits, which got new conversions or are new and converted, are rebuilt.
+        The rollup is built from scratch if it doesn't exist yet.
+        '''
+        rollup = CONVERSIONS_ROLLUP
+
+        # new objects are imported with greater ids, so they're picked by the next update
+        marks = {}
+        for name, entity in (('Hits', Hit), ('Conversions', Conversion)):
+            last_id, count = self.scan_idx_of_latest_saved_entity(name, entity)
+            marks[name] = last_id if count > 0 else -1
+
+        previous = self.read_rollup_marks(rollup, tables)
+        if rollup.table not in tables or set(previous.keys()) != set(marks.keys()):
+            self.rebuild_rollup(rollup, tables)
+        else:
+            sql = TOUCHED_MONTHS_SQL.format(db=self.reporting.name, hits=previous['Hits'], conversions=previous['Conversions'])
+            months = sorted([o['month'] for o, i, l in self.reporting.connected().read(sql=sql, columns=(('month', 'UInt32'),))])
+            for month in months:
+                self.rebuild_rollup_partition(rollup, month)
+            self.log.info("Rollup `{table}` has been updated for months: {months}".format(table=rollup.table, months=', '.join(map(str, months)) or 'none'))
+
+        self.save_rollup_marks(rollup, marks)
+
+    def read_rollup_marks(self, rollup, tables):
+        if ROLLUP_MARKS_TABLE not in tables:
+            return {}
+        sql = "SELECT entity, max(last_idx) AS last_idx FROM {db}.{table} WHERE rollup = '{rollup}' GROUP BY entity".format(db=self.reporting.name,
+                                                                                                              table=ROLLUP_MARKS_TABLE,
+                                                                                                              rollup=rollup.table)
+        return dict((o['entity'], o['last_idx']) for o, i, l in self.reporting.connected().read(sql=sql, columns=(('entity', 'String'), ('last_idx', 'Int64'))))
+
+    def save_rollup_marks(self, rollup, marks):
+        if not self.reporting.connected().write(self.reporting.sql.create_log_table(ROLLUP_MARKS_TABLE, ROLLUP_MARKS_COLUMNS)):
+            raise Exception("Unable to create table `{table}`".format(table=ROLLUP_MARKS_TABLE))
+        self.reporting.connected().write_stream(table=ROLLUP_MARKS_TABLE,
+                                                values=[[rollup.table, name, last_idx] for name, last_idx in sorted(marks.items())],
+                                                columns=ROLLUP_MARKS_COLUMNS)
+
+    def rebuild_rollup(self, rollup, tables):
+        ''' Builds `rollup` from scratch into a new table and atomically replaces the old one '''
+        new_table, old_table = '%s_new' % rollup.table, '%s_old' % rollup.table
+
+        for sql in (self.reporting.sql.drop_table(new_table),
+                    self.reporting.sql.create_rollup_table(rollup, table=new_table),
+                    self.reporting.sql.insert_rollup(rollup, table=new_table)):
+            if not self.reporting.connected().write(sql):
+                raise Exception("Unable to build rollup `{table}`".format(table=rollup.table))
+
+        if rollup.table in tables:
+            renames = [(rollup.table, old_table), (new_table, rollup.table)]
+        else:
+            renames = [(new_table, rollup.table)]
+
+        if not self.reporting.connected().write(self.reporting.sql.rename_tables(renames)):
+            raise Exception("Unable to replace rollup `{table}`".format(table=rollup.table))
+        self.reporting.connected().write(self.reporting.sql.drop_table(old_table))
+        self.invalidate_queries([rollup.table])
+
+        self.log.info("Rollup `{table}` has been rebuilt".format(table=rollup.table))
+
+    def rebuild_rollup_partition(self, rollup, month):
+        ''' Builds `rollup` of hits clicked in `month` (YYYYMM) into a new table and atomically replaces the month with it '''
+        new_table = '%s_new' % rollup.table
+
+        for sql in (self.reporting.sql.drop_table(new_table),
+                    self.reporting.sql.create_rollup_table(rollup, table=new_table),
+                    self.reporting.sql.insert_rollup(rollup, table=new_table, source_where='toYYYYMM(time) = %s' % month),
+                    self.reporting.sql.replace_partition(rollup.table, month, new_table)):
+            if not self.reporting.connected().write(sql):
+                raise Exception("Unable to rebuild month {month} of rollup `{table}`".format(month=month, table=rollup.table))
+
+        self.reporting.connected().write(self.reporting.sql.drop_table(new_table))
+        self.invalidate_queries([rollup.table])
+
+    def convert_dimension_columns(self, table_name=Hit.TABLE_NAME):
+        '''
+        Converts existing dimension columns into types declared in `Hit.DIMENSION_TYPES`.
+        Returns names of converted columns.
+        '''
+        converted = []
+        for column, type_factory in self.reporting.connected().describe(table_name):
+            if not column.startswith('dim_'):
+                continue
 
-        objects_to_import_without_missed = filter(lambda i: i is not None, objects_to_import)
-        self.import_entity(name=name, table_name=table_name,
-                           objs=objects_to_import_without_missed, columns=columns)
+            declared = Hit.dimension_type(column.split('dim_', 1)[1])
+            if declared.into_db_type() == type_factory.into_db_type():
+                continue
+
+            self.log.info("\t Converting a column `{column}` from `{source}` into `{type}`".format(
+                column=column,
+                source=type_factory.into_db_type(),
+                type=declared.into_db_type()
+            ))
+            result = self.reporting.connected().write(self.reporting.sql.modify_column(table=table_name, column=column, type_factory=declared))
+            if not result:
+                raise Exception("Unable to convert column `{column}`.".format(column=column))
+            converted.append(column)
+        return converted
+
+    def load_hits_sharded(self, redis_url, shards=4, batch_size=1000):
+        """
+        Imports new hits in `shards` worker processes.
+
+        The range of new hits `[last_id + 1, counter)` is split into disjoint slices.
+        Every worker reads its slice with its own bus connection and inserts it into
+        its own shard table. The shard tables are moved into the hits table only after
+        every shard succeeded, in order of ids, and the checkpoint is moved past every
+        shard right after it's committed, so a failure leaves a committed prefix of the
+        range behind the checkpoint and nothing after it.
+        """
+        self.log.info("Loading hits in {shards} shards...".format(shards=shards))
+
+        name = 'Hits'
+        entity = ENTITIES[name]
+        table_name = entity.TABLE_NAME
+
+        last_id, count = self.get_idx_of_latest_saved_entity(name, entity)
+        if last_id == 0 and count == 0: # Entity does not exist!
+            self.init_entity(name, entity)
+
+        start = 0 if count == 0 else last_id + 1
+        end = self.bus.count(name)
+
+        if start >= end:
+            self.log.info("All `{name}` are already imported! Skipping.".format(name=name))
+            return
+
+        tasks = [(redis_url, self.reporting.url, self.reporting.name, table_name,
+                  shard_table_name(table_name, n), shard_start, shard_end, batch_size)
+                 for n, (shard_start, shard_end) in enumerate(shard_ranges(start, end, shards))]
+
+        for task in tasks:
+            self.reporting.connected().write(self.reporting.sql.drop_table(task[4]))
+
+        try:
+            pool = Pool(processes=len(tasks))
+            try:
+                imported = pool.map(_import_hits_shard, tasks)
+            finally:
+                pool.close()
+                pool.join()
+
+            imported_count = sum([count for count, last_idx in imported])
+            shard_columns = [self.reporting.connected().describe(task[4]) for task in tasks]
+
+            self.log.info("All shards succeeded. Committing {count} hits into table `{table_name}`".format(
+                count=imported_count,
+                table_name=table_name
+            ))
+
+            schema = SchemaAccumulator()
+            for columns in shard_columns:
+                schema.add_columns(columns)
+            self.migrate_hits_table(table_name, schema)
+
+            for task, columns, (shard_count, shard_last_idx) in zip(tasks, shard_columns, imported):
+                sql = self.reporting.sql.insert_select(table=table_name,
+                                                       source_table=task[4],
+                                                       column_names=zip(*columns)[0])
+                if not self.reporting.connected().write(sql):
+                    raise Exception("Unable to commit shard `{shard}`".format(shard=task[4]))
+                if shard_count > 0:
+                    self.advance_checkpoint(name, entity, shard_last_idx, shard_count)
+        finally:
+            for task in tasks:
+                self.reporting.connected().write(self.reporting.sql.drop_table(task[4]))
 
         self.log.info("Successfully imported {count} new hits into table `{table_name}`".format(
-            count=len(objects_to_import),
+            count=imported_count,
             table_name=table_name
         ))
+
+    def import_hits_shard(self, table_name, shard_table, start, end, batch_size=None):
+        name = 'Hits'
+
+        result = self.reporting.connected().write(self.reporting.sql.create_table_as(shard_table, table_name))
+        if not result:
+            raise Exception("Unable to create shard table `{shard}`".format(shard=shard_table))
+
+        objects_to_import = list(self.bus.multiread(name, start=start, end=end - 1, batch_size=batch_size, compact=True))
+        objects_to_import_without_missed = filter(lambda i: i is not None, objects_to_import)
+
+        if len(objects_to_import_without_missed) == 0:
+            return 0, 0
+
+        self.migrate_hits(shard_table, objects_to_import)
+
+        columns = safe_dynamic_fields(self.reporting.connected().describe(shard_table))
+        self.import_entity(name=name, table_name=shard_table,
+                           objs=objects_to_import_without_missed, columns=columns)
+
+        return len(objects_to_import_without_missed), max(map(lambda o: o.id, objects_to_import_without_missed))
+
+
+def shard_ranges(start, end, shards):
+    """ Splits `[start, end)` into at most `shards` disjoint `[start, end)` slices of almost equal size """
+    total = end - start
+    shards = max(1, min(shards, total))
+    size, rest = divmod(total, shards)
+
+    ranges = []
+    shard_start = start
+    for n in range(shards):
+        shard_end = shard_start + size + (1 if n < rest else 0)
+        ranges.append((shard_start, shard_end))
+        shard_start = shard_end
+    return ranges
+
+def shard_table_name(table_name, n):
+    return "{table}_shard_{n}".format(table=table_name, n=n)
+
+def _import_hits_shard(task):
+    # runs in a worker process, so every shard has its own connections
+    redis_url, clickhouse_url, db_name, table_name, shard_table, start, end, batch_size = task
+
+    bus = BusConnection(entities_meta=ENTITIES, url=redis_url)
+    report_db = Database(url=clickhouse_url, db=db_name)
+
+    data_import = DataImport(bus=bus, report_db=report_db)
+    return data_import.import_hits_shard(table_name, shard_table, start, end, batch_size=batch_size)
@@ -0,0 +1,157 @@
+import time
+import logging
+
+from model import ENTITIES, SchemaAccumulator, safe_dynamic_fields
+
+
+class TailImport(object):
+    '''
+    Continuously imports new objects of `entities` into reporting storage.
+
+    Counters of entities are polled every `poll_interval` seconds and new objects are
+    read into a buffer. The buffer is flushed into reporting storage as soon as it has
+    `batch_size` objects or the oldest of them has waited for `flush_interval` seconds.
+
+    Positions of entities are read once at start and then kept in memory, and columns
+    of the hits table are described only when a batch brings new dimensions.
+    Rollups for reports are updated every `rollup_interval` seconds.
+    '''
+    LOGGER = 'majorka.tail'
+
+    def __init__(self, data_import, entities=('Hits', 'Conversions'), batch_size=1000,
+                 flush_interval=1.0, poll_interval=0.2, rollup_interval=60.0, logger=logging.getLogger(LOGGER)):
+        if batch_size < 1:
+            raise Exception("Batch size couldn't be less than 1.")
+
+        self.log = logger
+        self.data_import = data_import
+        self.bus = data_import.bus
+        self.reporting = data_import.reporting
+        self.entities = entities
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self.rollup_interval = rollup_interval
+
+        self._next_idx = {}
+        self._buffers = dict((name, []) for name in entities)
+        self._buffered_since = {}
+        self._read_idx = {}
+        self._columns = {}
+
+    def start(self):
+        ''' Reads positions of entities in reporting storage and creates missing tables '''
+        for name in self.entities:
+            entity = ENTITIES[name]
+            last_id, count = self.data_import.get_idx_of_latest_saved_entity(name, entity)
+            if last_id == 0 and count == 0:  # Entity does not exist!
+                self.data_import.init_entity(name, entity)
+
+            self._next_idx[name] = self._read_idx[name] = 0 if count == 0 else last_id + 1
+
+    def lag(self, name):
+        ''' Number of objects of `name` which are created, but not imported yet (counter minus imported index) '''
+        return max(self.bus.count(name) - self._next_idx[name], 0)
+
+    def metrics(self):
+        metrics = {}
+        for name in self.entities:
+            counter = self.bus.count(name)
+            metrics[name] = {'counter': counter,
+                             'imported': self._next_idx[name],
+                             'lag': max(counter - self._next_idx[name], 0)}
+        return metrics
+
+    def poll(self, now=None):
+        ''' Reads new objects and flushes full or expired buffers. Returns count of imported objects. '''
+        if not self._next_idx:
+            self.start()
+        now = time.time() if now is None else now
+
+        imported = 0
+        for name in self.entities:
+            self._read_new(name, now)
+            if self._should_flush(name, now):
+                imported += self.flush(name)
+        return imported
+
+    def run(self, metrics_interval=60.0):
+        self.start()
+        self.log.info("Tailing {entities}...".format(entities=', '.join(self.entities)))
+
+        last_metrics = last_rollup = time.time()
+        while True:
+            imported = self.poll()
+
+            if time.time() - last_rollup >= self.rollup_interval:
+                last_rollup = time.time()
+                try:
+                    self.data_import.update_rollups()
+                except Exception:
+                    # rollups are updated again on the next interval, import goes on
+                    self.log.exception("Unable to update rollups")
+
+            if time.time() - last_metrics >= metrics_interval:
+                last_metrics = time.time()
+                for name, metric in sorted(self.metrics().items()):
+                    self.log.info("Lag of `{name}`: {lag} (counter: {counter}, imported: {imported})".format(name=name, **metric))
+
+            if imported == 0:
+                time.sleep(self.poll_interval)
+
+    def flush(self, name):
+        objs = self._buffers[name]
+        if not objs:
+            return 0
+
+        entity = ENTITIES[name]
+        if name == 'Hits':
+            columns = self._hits_columns(entity, objs)
+        else:
+            columns = objs[0].into_db_columns()
+
+        self.data_import.import_entity(name=name, table_name=entity.TABLE_NAME, objs=objs, columns=columns, entity=entity)
+
+        self._next_idx[name] = self._read_idx[name]
+        self._buffers[name] = []
+        self._buffered_since.pop(name, None)
+
+        self.log.info("Imported {count} `{name}`, lag is {lag}".format(count=len(objs), name=name, lag=self.lag(name)))
+        return len(objs)
+
+    def _read_new(self, name, now):
+        start = self._read_idx[name]
+        end = min(self.bus.count(name), start + self.batch_size - len(self._buffers[name]))
+        if start >= end:
+            return
+
+        objs = list(self.bus.multiread(name, start=start, end=end - 1, batch_size=self.batch_size, compact=True))
+
+        # counter is incremented before the object is saved, so missed objects
+        # at the tail could still be in flight and are read again on the next poll
+        while objs and objs[-1] is None:
+            objs.pop()
+        if not objs:
+            return
+
+        if len(self._buffers[name]) == 0:
+            self._buffered_since[name] = now
+        self._buffers[name].extend(o for o in objs if o is not None)
+        self._read_idx[name] = start + len(objs)
+
+    def _should_flush(self, name, now):
+        if not self._buffers[name]:
+            return False
+        return len(self._buffers[name]) >= self.batch_size or \
+            now - self._buffered_since[name] >= self.flush_interval
+
+    def _hits_columns(self, entity, hits):
+        schema = SchemaAccumulator()
+        for hit in hits:
+            schema.add(hit)
+
+        known = self._columns.get(entity.TABLE_NAME, None)
+        if known is None or set(name for name, type in schema.columns()) - set(name for name, type in known):
+            self.data_import.migrate_hits_table(entity.TABLE_NAME, schema)
+            known = self._columns[entity.TABLE_NAME] = safe_dynamic_fields(self.reporting.connected().describe(entity.TABLE_NAME))
+        return known
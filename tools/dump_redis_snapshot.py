@@ -0,0 +1,26 @@
+import sys
+
+import click
+
+from redis import Redis
+
+from testtools.snapshots import open_snapshot, dump_keyspace
+
+
+@click.command()
+@click.option('--redis-url', envvar='TEST_REDIS_URL', required=True, help='Redis URL, i.e. redis://localhost:6379/0. You can use TEST_REDIS_URL environmental variable to set this parameter.')
+@click.option('--match', default=None, help='Pattern of keys to dump, i.e. Hits:*')
+@click.option('--batch-size', default=1000, type=click.IntRange(min=1, max=100000), help='Number of keys scanned and read at once')
+@click.argument('output', type=click.Path(), required=True)
+def execute(redis_url, match, batch_size, output):
+    """Dumps Redis keyspace into OUTPUT snapshot, line-delimited JSON, gzipped if OUTPUT ends with .gz"""
+    connection = Redis.from_url(redis_url)
+
+    with open_snapshot(output, 'wb') as f:
+        written = dump_keyspace(connection, f, match=match, batch_size=batch_size)
+
+    sys.stderr.write("Saved {count} keys into {output}\n".format(count=written, output=output))
+
+
+if __name__ == '__main__':
+    execute()
@@ -7,14 +7,14 @@ hits_table = [['id', 'cost', 'time', 'destination', 'campaign', 'external_id']]
 conversions_table = [['id', 'revenue', 'time', 'external_id']]
 
 c = 0
-for hit in bus.multiread('Hits'):
+for hit in bus.multiread('Hits', batch_size=1000, compact=True):
     c +=1
     print c
     cost = hit.cost
     hits_table += [[hit._idx, str(float(cost[0])), hit.time, hit.destination_id, hit.campaign_id, hit.dimensions[u'external_id'],]]
 
 c = 0
-for conversion in bus.multiread('Conversions'):
+for conversion in bus.multiread('Conversions', batch_size=1000, compact=True):
     c +=1
     print c
     conversions_table += [[conversion._idx, str(conversion.revenue[0]), conversion.time, conversion.external_id]]
@@ -5,6 +5,9 @@ import logging
 from data.framework.bus import Connection as BusConnection
 from data.framework.reporting import Database
 from data.model import ENTITIES, REPORTING_DB, DataImport
+from data.checkpoint import ImportCheckpoint
+from data.cache import QueryCache, server_of, DEFAULT_DIRECTORY as DEFAULT_CACHE_DIRECTORY
+from data.tail import TailImport
 
 from ipaddr import IPAddress
 from decimal import Decimal
@@ -13,6 +16,15 @@ from decimal import Decimal
 if __name__ == '__main__':
     redis_url = os.environ.get('REDIS_URL', None)
     clickhouse_url = os.environ.get('CLICKHOUSE_URL', None)
+    import_shards = int(os.environ.get('IMPORT_SHARDS', 1))
+    checkpoint_path = os.environ.get('IMPORT_CHECKPOINT', None)
+    verify_checkpoint = os.environ.get('IMPORT_CHECKPOINT_VERIFY', '0') == '1'
+    convert_dimensions = os.environ.get('IMPORT_CONVERT_DIMENSIONS', '0') == '1'
+    rollups = os.environ.get('IMPORT_ROLLUPS', '1') == '1'
+    tail = os.environ.get('IMPORT_TAIL', '0') == '1'
+    tail_batch_size = int(os.environ.get('IMPORT_TAIL_BATCH_SIZE', 1000))
+    tail_flush_interval = float(os.environ.get('IMPORT_TAIL_FLUSH_INTERVAL', 1.0))
+    query_cache_dir = os.environ.get('QUERY_CACHE', DEFAULT_CACHE_DIRECTORY)
 
     if not redis_url:
         raise Exception("\n\nSet the 'REDIS_URL' environmental variable to the URL of Redis instance/slave. Example: redis://127.0.0.1:6379/1\n")
@@ -38,8 +50,42 @@ if __name__ == '__main__':
 
     logger.info("[ Starting import ]")
 
-    data_import = DataImport(bus=bus, report_db=report_db, logger=logger)
+    checkpoint = None
+    if checkpoint_path:
+        checkpoint = ImportCheckpoint(checkpoint_path)
+        logger.info("Resuming from checkpoint `{path}`.".format(path=checkpoint_path))
+
+    # results of reports cached by `pysql` are invalidated when new objects are imported
+    query_cache = QueryCache(directory=query_cache_dir, server=server_of(clickhouse_url)) if query_cache_dir else None
+
+    data_import = DataImport(bus=bus, report_db=report_db, logger=logger, checkpoint=checkpoint, query_cache=query_cache)
+    if checkpoint is not None and verify_checkpoint:
+        data_import.verify_checkpoint()
+
     data_import.load_simple_entities()
-    data_import.load_hits()
+
+    if import_shards > 1:
+        data_import.load_hits_sharded(redis_url=redis_url, shards=import_shards)
+    else:
+        data_import.load_hits()
+
+    if convert_dimensions:
+        logger.info("[ Converting dimension columns into declared types ]")
+        data_import.convert_dimension_columns()
+
+    if rollups:
+        logger.info("[ Updating rollups for reports ]")
+        data_import.update_rollups()
+
+    if tail:
+        logger.info("[ Tailing new hits and conversions ]")
+        tail_import = TailImport(data_import=data_import,
+                                 batch_size=tail_batch_size,
+                                 flush_interval=tail_flush_interval,
+                                 logger=logger)
+        try:
+            tail_import.run()
+        except KeyboardInterrupt:
+            logger.info("Tailing has been stopped.")
 
     logger.info("Good bye.")
@@ -2,6 +2,7 @@
 import sys
 import os
 from data.framework.reporting import Database
+from data.cache import QueryCache, server_of, DEFAULT_DIRECTORY as DEFAULT_CACHE_DIRECTORY
 
 from prettytable import PrettyTable
 def bold_white(s): return '\33[1m\33[37m %s \33[0m' % s
@@ -125,13 +126,15 @@ You can provide the parameters using the following syntax:
 @click.option('--info', help='Show info about SQL query from file')
 @click.option('--show', help='Do not execute, just output final SQL')
 @click.option('--pretty-print', help='Output source SQL without parameters substitution with syntax highlighting')
+@click.option('--cache-dir', envvar='QUERY_CACHE', default=DEFAULT_CACHE_DIRECTORY, help='Directory of query result cache. Results are cached by default for --cache-ttl seconds (300), use --no-cache to disable it. Results of every Clickhouse server are kept separately. The same directory should be set for data import to invalidate results on import. You can use QUERY_CACHE environmental variable to set this parameter.')
+@click.option('--cache-ttl', type=int, default=300, help='Seconds to keep query results in cache')
+@click.option('--cache-size', type=int, default=256, help='Size limit of query result cache, MB')
+@click.option('--no-cache', is_flag=True, help='Always execute query on Clickhouse server')
 @click.argument('file', type=click.File(), required=True)
 @click.argument('query-param', required=False, nargs=-1)
-def execute(ch_url, info, show, pretty_print, file, query_param):
+def execute(ch_url, info, show, pretty_print, cache_dir, cache_ttl, cache_size, no_cache, file, query_param):
     """Executes .py.sql file on Clickhouse server and prints result.
     """
-    d = connection(ch_url=ch_url)
-
     kvs = zip(query_param[0::2], query_param[1::2])
 
     query = parse_from_lines(lines=file.readlines())
@@ -155,17 +158,28 @@ def execute(ch_url, info, show, pretty_print, file, query_param):
         print final_sql
         sys.exit()
     else:
-        columns = d.describe_query(sql)
-        col_names = zip(*columns)[0]
-        col_names_capitalized = list(map(str.capitalize, col_names))
+        cache = None if no_cache else QueryCache(directory=cache_dir, server=server_of(ch_url), ttl=cache_ttl, max_size=cache_size * 1024 * 1024)
+        cached = cache.get(sql) if cache else None
+
+        if cached:
+            col_names, rows = cached
+        else:
+            snapshot = cache.snapshot(sql) if cache else None
+
+            d = connection(ch_url=ch_url)
+            columns, items = d.read_typed(sql)
+            col_names = zip(*columns)[0]
+
+            rows = [map(lambda field: o[field], col_names) for o, i, l in items]
+
+            if cache:
+                cache.put(sql, col_names, rows, snapshot)
 
         t = PrettyTable()
         t.field_names = map(bold_white, col_names)
 
-        items = d.read(sql=sql, columns=columns)
-
-        for o, i, l in items:
-            t.add_row(map(lambda field: o[field], col_names))
+        for row in rows:
+            t.add_row(row)
 
         print t
 
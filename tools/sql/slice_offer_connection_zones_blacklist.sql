@@ -1,36 +1,37 @@
-select Site, Min(Clicks), MAX(ROI_ALL) FROM
+select {campaign_column}Site, Min(Clicks), MAX(ROI_ALL) FROM
 (select
-    dim_zone as Site,
-    dim_connection_type as Connection_Type,
-    name as Offer,
-    count(Site) as Clicks,
-    countIf(hits_conversions.external_id, hits_conversions.external_id != '') as Conversions,
+{campaign_alias}    zone as Site,
+    connection_type as Connection_Type,
+    destination as Offer,
+    Clicks,
+    Conversions,
     if(toFloat64(Clicks) > toFloat64(0.0), toFloat64(Conversions) / toFloat64(Clicks) * 100.0, -100.0) as CR,
-    sum(cost) as Cost,
-    sum(revenue) as Revenue_all,
+    Cost,
+    Revenue_all,
     Revenue_all - Cost as Profit_Loss_All,
     if(toFloat64(Cost) > toFloat64(0.0), toFloat64(Profit_Loss_All) / toFloat64(Cost) * 100.0, -100.0) as ROI_ALL,
     (Revenue_all - Cost) / Clicks * 1000 as RPM
-from majorka.offers as offers
-inner join
+from
     (
-    select *
-    from
-    majorka.hits AS hits
-    left join majorka.conversions AS leads
-    ON hits.dim_external_id == leads.external_id
+    select {campaign_key}zone, connection_type, destination, sum(clicks) as Clicks, sum(cost) as Cost
+    from majorka.hits_daily
     WHERE
-        dim_zone != 'AB_TEST'
+        zone != 'AB_TEST'
         AND
-        dim_zone != '{zoneid}'
-        AND dim_zone !=''
-        AND campaign = {campaign_id}
-        AND dim_useragent != 'ApacheBench/2.3'
+        zone != '{zoneid}'
+        AND zone !=''{hits_filter}
+    group by {campaign_key}zone, connection_type, destination
     )
-as hits_conversions
-ON hits_conversions.destination == offers.id
-GROUP BY Site, Connection_Type, Offer
+as clicks
+any left join
+    (
+    select {campaign_key}zone, connection_type, destination, sum(conversions) as Conversions, sum(revenue) as Revenue_all
+    from majorka.conversions_daily{conversions_filter}
+    group by {campaign_key}zone, connection_type, destination
+    )
+as leads
+using {campaign_key}zone, connection_type, destination
 ) as report
-GROUP BY Site
+GROUP BY {campaign_column}Site
 HAVING MIN(Clicks) >= {min_clicks} AND MAX(ROI_ALL) <= {acceptable_roi}
-order by Site
+order by {campaign_column}Site
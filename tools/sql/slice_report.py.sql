@@ -5,34 +5,42 @@
 --
 -- $campaign: ID кампании
 select
-    dim_zone as Site,
-    dim_connection_type as Connection_Type,
+    zone as Site,
+    connection_type as Connection_Type,
     name as Offer,
-    count(Site) as Clicks,
-    countIf(hits_conversions.external_id, hits_conversions.external_id != '') as Conversions,
+    Clicks,
+    Conversions,
     if(toFloat64(Clicks) > toFloat64(0.0), toFloat64(Conversions) / toFloat64(Clicks) * 100.0, -100.0) as CR,
-    sum(cost) as Cost,
-    sum(revenue) as Revenue_all,
+    Cost,
+    Revenue_all,
     Revenue_all - Cost as Profit_Loss_All,
     if(toFloat64(Cost) > toFloat64(0.0), toFloat64(Profit_Loss_All) / toFloat64(Cost) * 100.0, -100.0) as ROI_ALL,
     (Revenue_all - Cost) / Clicks * 1000 as RPM
-from majorka.offers as offers
-inner join
+from
     (
     select *
     from
-    majorka.hits AS hits
-    left join majorka.conversions AS leads
-    ON hits.dim_external_id == leads.external_id
-    WHERE
-        dim_zone != 'AB_TEST'
-        AND
-        dim_zone != '{zoneid}'
-        AND dim_zone !=''
-        AND campaign = $campaign
-        AND dim_useragent != 'ApacheBench/2.3'
+        (
+        select zone, connection_type, destination, sum(clicks) as Clicks, sum(cost) as Cost
+        from majorka.hits_daily
+        WHERE
+            zone != 'AB_TEST'
+            AND
+            zone != '{zoneid}'
+            AND zone !=''
+            AND campaign = $campaign
+        group by zone, connection_type, destination
+        ) as clicks
+    any left join
+        (
+        select zone, connection_type, destination, sum(conversions) as Conversions, sum(revenue) as Revenue_all
+        from majorka.conversions_daily
+        WHERE campaign = $campaign
+        group by zone, connection_type, destination
+        ) as leads
+    using zone, connection_type, destination
     )
-as hits_conversions
-ON hits_conversions.destination == offers.id
-GROUP BY Site, Connection_Type, Offer
+as slices
+any inner join (select id as destination, name from majorka.offers) as offers
+using destination
 order by Profit_Loss_All DESC, Clicks
@@ -15,37 +15,30 @@ select
 from
     (
         select
-            hit.dim_zone as zone,
-            sum(hit.cost) as cost,
-            sum(lead.revenue) as revenue,
-            count(*) as clicks
+            zone,
+            sum(cost) as cost,
+            sum(clicks) as clicks
         from
-            majorka.hits as hit
-        left outer join
-            majorka.conversions as lead
-        on
-            lead.external_id == hit.dim_external_id
+            majorka.hits_daily
         where
-            hit.campaign = toInt64($campaign)
+            campaign = toInt64($campaign)
         group by
             zone
     ) as hit_stat
 
-left outer join
+any left join
 
 (
     select
-        hits_stat.dim_zone as zone,
-        count(*) as leads
+        zone,
+        sum(conversions) as leads,
+        sum(revenue) as revenue
     from
-        majorka.conversions as stat
-    inner join
-        majorka.hits as hits_stat
-    on
-        hits_stat.dim_external_id == stat.external_id
-        and hits_stat.campaign = toInt64($campaign)
+        majorka.conversions_daily
+    where
+        campaign = toInt64($campaign)
     group by
-        hits_stat.dim_zone
+        zone
 ) as leads_stat
 
-on leads_stat.zone == hit_stat.zone
+using zone
@@ -1,34 +1,58 @@
-import subprocess
+import os
 import requests
 import unittest
-from unittest import skip
 
 import json
 
 import testtools
 from testtools import EnvironmentTestCase, hang, main
-from testtools.simulator import BasicTrafficSampler, samples_from_fixture, with_cost, filter_dimension, flat_items
-
-from testtools.fixtures.hit_samples import fixture_data as hit_samples
-from testtools.models import MultiDimensionDistribution
-
-
-@skip
-class AbTest(EnvironmentTestCase):
-    def _get_ab_args(self, url):
-        return [
-            'ab',
-            '-c',
-            str(10),
-            '-n',
-            str(10000),
-            str(url)
-        ]
+from testtools.simulator import BasicTrafficSampler, TrafficReplay, LazySamples, samples_from_fixture, samples_from_snapshot, with_cost, filter_dimension, flat_items
+from testtools.load import LoadGenerator
+
+from testtools.models import OfferModels, train_offer_models_from_fixture, train_offer_models_from_snapshot
+
+
+OFFER_MODEL_DIMENSIONS = ['zone', 'connection_type', 'langcode']
+
+
+def load_hit_samples():
+    '''
+    Hits with fixed cost to send to campaign, excluding ones of load testing tools.
+    They are streamed from snapshot of Redis saved by `dump_redis_snapshot.py` into the file
+    set by TEST_REDIS_SNAPSHOT environmental variable, or taken from `hit_samples` fixture if it isn't set.
+    '''
+    path = os.environ.get('TEST_REDIS_SNAPSHOT', None)
+    if path:
+        return LazySamples(lambda: with_cost(filter_dimension(samples_from_snapshot(path), 'zone', ('', 'AB_TEST',)), value='0.005'))
+
+    from testtools.fixtures.hit_samples import fixture_data as hit_samples
+    return with_cost(filter_dimension(samples_from_fixture(hit_samples), 'zone', ('', 'AB_TEST',)), value='0.005')
 
+
+def load_offer_models():
+    '''
+    Models of offers saved by `train_offer_models.py` into the file set by TEST_OFFER_MODELS
+    environmental variable, or trained on Redis snapshot (see `load_hit_samples`) or fixture if it isn't set.
+    '''
+    path = os.environ.get('TEST_OFFER_MODELS', None)
+    if path:
+        return OfferModels.load(path)
+
+    snapshot = os.environ.get('TEST_REDIS_SNAPSHOT', None)
+    if snapshot:
+        return train_offer_models_from_snapshot(snapshot, OFFER_MODEL_DIMENSIONS)
+
+    from testtools.fixtures.redis_fixture import fixture_data as rfix
+    return train_offer_models_from_fixture(rfix, OFFER_MODEL_DIMENSIONS)
+
+
+class LoadTest(EnvironmentTestCase):
     @hang
     def test_majorka_doesnt_miss_hits_under_load(self):
-        logged_hits = list(self.bus.multiread('Hits', start=0))
-        self.assertEqual(len(logged_hits), 0)
+        requests_count = int(os.environ.get('TEST_LOAD_REQUESTS', 10000))
+        concurrency = int(os.environ.get('TEST_LOAD_CONCURRENCY', 10))
+
+        self.assertEqual(self.bus.count('Hits'), 0)
 
         offers = [
             self.fixture.create_offer(name='simple test offer', url='http://test-url-1.com/?external_id={external_id}'),
@@ -36,10 +60,44 @@ class AbTest(EnvironmentTestCase):
         ]
         self.fixture.create_campaign(name='test campaign', alias='alias', offer_ids=offers)
 
-        result = subprocess.check_output(self._get_ab_args(url=self.majorka.campaign_url(campaign='alias')))
+        base_url = self.majorka.campaign_url(campaign='alias').add({
+            'connection_type': '{connection_type}'
+        })
+
+        sampler = BasicTrafficSampler(base_url=base_url, samples=load_hit_samples())
 
-        logged_hits = list(self.bus.multiread('Hits', start=0))
-        self.assertEqual(len(logged_hits), 10000)
+        result = LoadGenerator(sampler, concurrency=concurrency, requests=requests_count).run()
+        self.logger.info(result.summary())
+
+        self.assertEqual(result.errors, 0)
+        self.assertEqual(result.sent, requests_count)
+        self.assertEqual(self.bus.count('Hits'), result.sent)
+
+
+class ReplayTest(EnvironmentTestCase):
+    @hang
+    def test_replay_with_conversions(self):
+        workers = int(os.environ.get('TEST_REPLAY_WORKERS', 8))
+        rate = float(os.environ.get('TEST_REPLAY_RATE', 0)) or None
+
+        offer_models = load_offer_models()
+        offer_ids = offer_models.offers()
+
+        self.seed.create_campaign(name='test campaign', alias='alias', offer_ids=[self.seed.create_offer(name='test offer {i}'.format(i=i), url='http://test-url-{i}.com/?external_id={external_id}'.format(i=i, external_id='{external_id}')) for i, offer_id in enumerate(offer_ids)])
+        self.seed.flush()
+
+        base_url = self.majorka.campaign_url(campaign='alias').add({
+            'connection_type': '{connection_type}'
+        })
+
+        replay = TrafficReplay(base_url, load_hit_samples(), workers=workers, rate=rate,
+                               offer_models=offer_models, offer_ids=offer_ids, majorka=self.majorka)
+        result = replay.run()
+        self.logger.info(result.summary())
+
+        self.assertEqual(result.errors, 0)
+        self.assertEqual(self.bus.count('Hits'), result.sent)
+        self.assertEqual(self.bus.count('Conversions'), result.conversions)
 
 
 class RedirectsTest(EnvironmentTestCase):
@@ -75,10 +133,7 @@ class TrafficTest(EnvironmentTestCase):
             'currency': '{currency}'
         })
 
-        filtered_samples = filter(lambda hit: hit[u'dimensions'][u'zone'] != '' and hit[u'dimensions'][u'zone'] != 'AB_TEST', samples_from_fixture(hit_samples))
-
-
-        sampler = BasicTrafficSampler(base_url=base_url, samples=with_cost(filtered_samples, value='0.005'))
+        sampler = BasicTrafficSampler(base_url=base_url, samples=load_hit_samples())
 
         offers = [
             self.fixture.create_offer(name='simple test offer', url='http://test-url-1.com/?external_id={external_id}'),
@@ -118,9 +173,7 @@ class TrafficSamplerTest(EnvironmentTestCase):
             'connection_type': '{connection_type}'
         })
 
-        filtered_samples = filter_dimension(samples_from_fixture(hit_samples), 'zone', ('', 'AB_TEST',))
-
-        sampler = BasicTrafficSampler(base_url=base_url, samples=with_cost(filtered_samples, value='0.005'))
+        sampler = BasicTrafficSampler(base_url=base_url, samples=load_hit_samples())
 
         for i in range(100):
             request, _ = sampler.next()
@@ -137,46 +190,22 @@ class PartialParametersInPostback(EnvironmentTestCase):
         import random
         import json
         from furl import furl
-        from testtools.fixtures.redis_fixture import fixture_data as rfix
-
-
-        all_hits = [dict(flat_items(json.loads(rfix[k]))) for k in rfix.keys() if k.startswith('Hits') and '_counter' not in k]
-        all_conversions = [dict(flat_items(json.loads(rfix[k]))) for k in rfix.keys() if k.startswith('Conversion') and '_counter' not in k]
-
-
-        # build 'join table' by external_id
-        external_id_to_hit = { item['dimensions.external_id']: item for item in all_hits }
-        external_id_to_conversion = { item['external_id']: item for item in all_conversions }
 
-        print len(list(all_hits))
-        print len(list(all_conversions))
-
-        # create offer models from hit fixture
-        offer_ids = list(sorted(set([hit['destination_id'] for hit in all_hits])))
-        offer_models = {offer_id: MultiDimensionDistribution()  for offer_id in offer_ids}
+        # create offer models from saved traffic
+        offer_models = load_offer_models()
+        offer_ids = offer_models.offers()
 
         print offer_ids
 
-        # train offer models on saved traffic
-        dimensions = [u'dimensions.zone', u'dimensions.connection_type', u'dimensions.langcode']
-        for hit in all_hits:
-            external_id = hit['dimensions.external_id']
-            conv = external_id in external_id_to_conversion.keys()
-            vec = [hit.get(d, None) for d in dimensions] + ['conv' if conv else 'noconv']
-            offer_models[hit['destination_id']].eat(vec)
-
-        # offer_models[offer_ids[1]].print_graph()
-
-        self.fixture.create_campaign(name='test campaign', alias='alias', offer_ids=[self.fixture.create_offer(name='test offer {i}'.format(i=i), url='http://test-url-{i}.com/?external_id={external_id}'.format(i=i, external_id='{external_id}')) for i, offer_id in enumerate(offer_ids)])
+        self.seed.create_campaign(name='test campaign', alias='alias', offer_ids=[self.seed.create_offer(name='test offer {i}'.format(i=i), url='http://test-url-{i}.com/?external_id={external_id}'.format(i=i, external_id='{external_id}')) for i, offer_id in enumerate(offer_ids)])
+        self.seed.flush()
 
         # create url template for campaign, that accepts connection type as a parameter
         base_url = self.majorka.campaign_url(campaign='alias').add({
             'connection_type': '{connection_type}'
         })
 
-        filtered_samples = filter_dimension(samples_from_fixture(hit_samples), 'zone', ('', 'AB_TEST',))
-
-        sampler = BasicTrafficSampler(base_url=base_url, samples=with_cost(filtered_samples, value='0.005'))
+        sampler = BasicTrafficSampler(base_url=base_url, samples=load_hit_samples())
 
         logged_conversions = list(self.bus.multiread('Conversions', start=0))
         self.assertEqual(len(logged_conversions), 0)
@@ -193,9 +222,7 @@ class PartialParametersInPostback(EnvironmentTestCase):
             external_id = loc.args['external_id']
 
             self.assertIn('http://test-url', str(loc))
-            vec = [sample.get(d, None) for d in dimensions] + ['conv']
-            # print vec
-            prob = offer_models[offer_ids[offer_num]].probability(vec)
+            prob = offer_models.probability(offer_ids[offer_num], sample)
             # print prob
 
             if random.random() <= prob:
@@ -221,46 +248,22 @@ class ZoneSampleModelTest(EnvironmentTestCase):
         import random
         import json
         from furl import furl
-        from testtools.fixtures.redis_fixture import fixture_data as rfix
-
-
-        all_hits = [dict(flat_items(json.loads(rfix[k]))) for k in rfix.keys() if k.startswith('Hits') and '_counter' not in k]
-        all_conversions = [dict(flat_items(json.loads(rfix[k]))) for k in rfix.keys() if k.startswith('Conversion') and '_counter' not in k]
 
-
-        # build 'join table' by external_id
-        external_id_to_hit = { item['dimensions.external_id']: item for item in all_hits }
-        external_id_to_conversion = { item['external_id']: item for item in all_conversions }
-
-        print len(list(all_hits))
-        print len(list(all_conversions))
-
-        # create offer models from hit fixture
-        offer_ids = list(sorted(set([hit['destination_id'] for hit in all_hits])))
-        offer_models = {offer_id: MultiDimensionDistribution()  for offer_id in offer_ids}
+        # create offer models from saved traffic
+        offer_models = load_offer_models()
+        offer_ids = offer_models.offers()
 
         print offer_ids
 
-        # train offer models on saved traffic
-        dimensions = [u'dimensions.zone', u'dimensions.connection_type', u'dimensions.langcode']
-        for hit in all_hits:
-            external_id = hit['dimensions.external_id']
-            conv = external_id in external_id_to_conversion.keys()
-            vec = [hit.get(d, None) for d in dimensions] + ['conv' if conv else 'noconv']
-            offer_models[hit['destination_id']].eat(vec)
-
-        # offer_models[offer_ids[1]].print_graph()
-
-        self.fixture.create_campaign(name='test campaign', alias='alias', offer_ids=[self.fixture.create_offer(name='test offer {i}'.format(i=i), url='http://test-url-{i}.com/?external_id={external_id}'.format(i=i, external_id='{external_id}')) for i, offer_id in enumerate(offer_ids)])
+        self.seed.create_campaign(name='test campaign', alias='alias', offer_ids=[self.seed.create_offer(name='test offer {i}'.format(i=i), url='http://test-url-{i}.com/?external_id={external_id}'.format(i=i, external_id='{external_id}')) for i, offer_id in enumerate(offer_ids)])
+        self.seed.flush()
 
         # create url template for campaign, that accepts connection type as a parameter
         base_url = self.majorka.campaign_url(campaign='alias').add({
             'connection_type': '{connection_type}'
         })
 
-        filtered_samples = filter_dimension(samples_from_fixture(hit_samples), 'zone', ('', 'AB_TEST',))
-
-        sampler = BasicTrafficSampler(base_url=base_url, samples=with_cost(filtered_samples, value='0.005'))
+        sampler = BasicTrafficSampler(base_url=base_url, samples=load_hit_samples())
 
         logged_conversions = list(self.bus.multiread('Conversions', start=0))
         self.assertEqual(len(logged_conversions), 0)
@@ -277,9 +280,7 @@ class ZoneSampleModelTest(EnvironmentTestCase):
             external_id = loc.args['external_id']
 
             self.assertIn('http://test-url', str(loc))
-            vec = [sample.get(d, None) for d in dimensions] + ['conv']
-            # print vec
-            prob = offer_models[offer_ids[offer_num]].probability(vec)
+            prob = offer_models.probability(offer_ids[offer_num], sample)
             # print prob
 
             if random.random() <= prob:
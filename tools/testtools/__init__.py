@@ -11,9 +11,11 @@ from majorka import Majorka
 
 from proc import Multiprocess
 
-from data.framework.bus import Connection as BusConnection
+from data.framework.bus import Connection as BusConnection, DEFAULT_BULK_BATCH_SIZE
 from data.model import ENTITIES
 
+from testtools.seeding import Seed
+
 
 DEFAULT_REDIS_PORT = 8399
 DEFAULT_MAJORKA_PORT = 8008
@@ -97,6 +99,8 @@ class EnvironmentTestCase(unittest.TestCase):
     def setupConnections(self):
         self.redis = Redis.from_url(self.redis_url)
         self.bus = BusConnection(redis=self.redis, entities_meta=ENTITIES)
+        # creates offers and campaigns in a single pipeline, instead of `self.fixture` calling `majorka-cli` for every object
+        self.seed = Seed(self.bus.bulk_writer())
 
     def setupServers(self):
         servers = (
@@ -206,6 +210,11 @@ class MajorkaFixture(Majorka):
     def __init__(self, *args, **kwargs):
         super(MajorkaFixture, self).__init__(*args, **kwargs)
 
+    def seed(self, batch_size=DEFAULT_BULK_BATCH_SIZE):
+        ''' Returns `Seed` writing objects straight into Redis of this fixture '''
+        bus = BusConnection(url=self.redis_url, entities_meta=ENTITIES)
+        return Seed(bus.bulk_writer(batch_size=batch_size))
+
 
 if __name__ == '__main__':
     # Run doctests of the module
@@ -0,0 +1,137 @@
+import time
+import threading
+from collections import Counter
+
+from requests import Session
+from requests.adapters import HTTPAdapter
+
+
+class LoadResult(object):
+    '''
+    Outcome of a load test: number of sent requests, failed ones, response statuses,
+    wall time and sorted latencies of every request in seconds.
+    '''
+    def __init__(self, sent, errors, statuses, elapsed, latencies):
+        self.sent = sent
+        self.errors = errors
+        self.statuses = statuses
+        self.elapsed = elapsed
+        self.latencies = sorted(latencies)
+
+    def rps(self):
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def percentile(self, p):
+        return percentile(self.latencies, p)
+
+    def summary(self):
+        return "{sent} requests in {elapsed:.3f} sec, {rps:.1f} requests/sec, {errors} errors; " \
+               "latency p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms".format(
+                   sent=self.sent, elapsed=self.elapsed, rps=self.rps(), errors=self.errors,
+                   p50=self.percentile(50) * 1000, p95=self.percentile(95) * 1000, p99=self.percentile(99) * 1000)
+
+
+class LoadGenerator(object):
+    '''
+    Sends `requests` samples of `sampler` (see `simulator.BasicTrafficSampler`) by `concurrency` threads.
+
+    Requests are prepared from samples before the test starts, so the sampler isn't
+    shared between threads and its cost isn't measured. Every thread has its own
+    session with kept alive connection. Responses with status other than `expected_status`
+    and failed requests are counted as errors.
+    '''
+    def __init__(self, sampler, concurrency=10, requests=10000, expected_status=302, timeout=5):
+        if concurrency < 1:
+            raise Exception("Concurrency couldn't be less than 1.")
+
+        self.sampler = sampler
+        self.concurrency = concurrency
+        self.requests = requests
+        self.expected_status = expected_status
+        self.timeout = timeout
+
+    def prepare(self):
+        prepared = []
+        for i in xrange(self.requests):
+            request, sample = self.sampler.next()
+            prepared.append(self.sampler.session.prepare_request(request))
+        return prepared
+
+    def run(self):
+        prepared = self.prepare()
+        workers = [_Worker(prepared[n::self.concurrency], self.expected_status, self.timeout)
+                   for n in xrange(min(self.concurrency, len(prepared)))]
+
+        started = time.time()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.time() - started
+
+        statuses = Counter()
+        latencies = []
+        for worker in workers:
+            statuses.update(worker.statuses)
+            latencies.extend(worker.latencies)
+
+        return LoadResult(sent=len(prepared),
+                          errors=sum([worker.errors for worker in workers]),
+                          statuses=statuses,
+                          elapsed=elapsed,
+                          latencies=latencies)
+
+
+class _Worker(threading.Thread):
+    def __init__(self, prepared, expected_status, timeout):
+        super(_Worker, self).__init__()
+        self.daemon = True
+        self.prepared = prepared
+        self.expected_status = expected_status
+        self.timeout = timeout
+
+        self.session = Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+        self.errors = 0
+        self.statuses = Counter()
+        self.latencies = []
+
+    def run(self):
+        for request in self.prepared:
+            started = time.time()
+            try:
+                response = self.session.send(request, allow_redirects=False, timeout=self.timeout)
+                response.content  # the connection is released only when the body is read
+            except Exception:
+                self.errors += 1
+                self.statuses['failed'] += 1
+                continue
+            finally:
+                self.latencies.append(time.time() - started)
+
+            self.statuses[response.status_code] += 1
+            if response.status_code != self.expected_status:
+                self.errors += 1
+
+
+def percentile(sorted_values, p):
+    """
+    Nearest-rank percentile of sorted values
+
+    >>> values = range(1, 101)
+    >>> assert percentile(values, 50) == 50
+    >>> assert percentile(values, 95) == 95
+    >>> assert percentile(values, 99) == 99
+    >>> assert percentile([0.2], 99) == 0.2
+    >>> assert percentile([], 50) == 0.0
+    """
+    if not sorted_values:
+        return 0.0
+    rank = int(-(-p * len(sorted_values) // 100))  # ceil
+    return sorted_values[max(rank, 1) - 1]
+
+
+if __name__ == '__main__':
+    import doctest
+    doctest.testmod()
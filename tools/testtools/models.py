@@ -1,5 +1,12 @@
+import zlib
+import json
 import random
-from testtools.simulator import flat_items
+import cPickle as pickle
+from array import array
+from bisect import bisect_right
+from itertools import izip, repeat
+
+from testtools.simulator import flat_items, samples_from_snapshot
 
 
 # class OfferModel(object):
@@ -211,6 +218,416 @@ class MultiDimensionDistribution(object):
         return _idx, node_name
 
 
+class ArrayDistribution(object):
+    """
+    The same distribution as `MultiDimensionDistribution`, stored in flat arrays.
+
+    Values of every dimension are encoded into integer codes. Every distinct prefix of
+    eaten vectors is a node with its count in `counts` array, children of nodes are
+    looked up by (node, code) key in a single dict, so no objects are created per value.
+    Children of a node are sampled by binary search over cumulative sums of their counts,
+    which are built on first sampling and dropped when new vectors are eaten.
+
+    All vectors should have the same number of dimensions.
+    """
+    CODE_BITS = 32
+
+    def __init__(self):
+        self.dimensions = None
+        self.codes = []
+        self.values = []
+        self.counts = array('L', [0])
+        self.children = {}
+        self._depths = array('B', [0])
+        self._cumulative = {}
+
+    @property
+    def counter(self):
+        return self.counts[0]
+
+    def eat(self, vec, weight=1):
+        """
+        >>> samples = [['a', 'b'], ['a', 'b'], ['a', 'a'], ['c', 'a'], ['c', 'b'], ['b', 'c'], ['b', 'a'], ['a', 'b'], ['a', 'b'], ['a', 'a'], ['a', 'a'], ['a', 'a']]
+        >>> ad = ArrayDistribution()
+        >>> for sample in samples:
+        ...     ad.eat(sample)
+        >>> assert ad.counter == 12
+        >>> assert len(ad.counts) == 1 + 3 + 6
+        >>> ad.eat(['a'])
+        Traceback (most recent call last):
+        ...
+        Exception: Expected vector with 2 dimensions, got: ['a']
+        """
+        self.eat_many((vec,), weights=(weight,))
+
+    def eat_many(self, vectors, weights=None):
+        """
+        Eats every vector of `vectors`, `weights` are numbers of times every vector is eaten
+
+        >>> ad = ArrayDistribution()
+        >>> ad.eat_many([['zone1', 'dsl'], ['zone1', '3g'], ['zone2', 'dsl']])
+        >>> assert ad.probability(['zone1']) == 2.0 / 3.0
+        >>> ad.eat_many([['zone2', 'dsl']], weights=[3])
+        >>> assert ad.probability(['zone2', 'dsl']) == 4.0 / 6.0
+        """
+        self._cumulative = {}
+        counts, children, depths = self.counts, self.children, self._depths
+
+        for vec, weight in izip(vectors, repeat(1) if weights is None else weights):
+            if self.dimensions is None:
+                self._set_dimensions(len(vec))
+            if len(vec) != self.dimensions:
+                raise Exception("Expected vector with {n} dimensions, got: {vec}".format(n=self.dimensions, vec=vec))
+
+            node = 0
+            counts[0] += weight
+            for d, value in enumerate(vec):
+                key = (node << self.CODE_BITS) | self._encode(d, value)
+                child = children.get(key, None)
+                if child is None:
+                    child = children[key] = len(counts)
+                    counts.append(0)
+                    depths.append(d + 1)
+                counts[child] += weight
+                node = child
+
+    def items(self):
+        """
+        Generates (vector, count) for every distinct eaten vector
+
+        >>> ad = ArrayDistribution()
+        >>> ad.eat_many([['zone1', 'dsl'], ['zone1', '3g'], ['zone1', 'dsl']])
+        >>> assert sorted(ad.items()) == [(['zone1', '3g'], 1), (['zone1', 'dsl'], 2)]
+        """
+        mask = (1 << self.CODE_BITS) - 1
+        parents = {}
+        for key, child in self.children.iteritems():
+            parents[child] = (key >> self.CODE_BITS, key & mask)
+
+        for node, depth in enumerate(self._depths):
+            if depth != self.dimensions or node == 0:
+                continue
+            vec = [None] * depth
+            child = node
+            for d in xrange(depth - 1, -1, -1):
+                child, code = parents[child]
+                vec[d] = self.values[d][code]
+            yield vec, self.counts[node]
+
+    def merge(self, other):
+        """
+        Adds counts of `other` distribution, e.g. trained on another day
+
+        >>> day1, day2 = ArrayDistribution(), ArrayDistribution()
+        >>> day1.eat_many([['zone1', 'dsl'], ['zone2', 'dsl']])
+        >>> day2.eat_many([['zone2', 'dsl'], ['zone3', '3g']])
+        >>> day1.merge(day2)
+        >>> assert day1.counter == 4
+        >>> assert day1.probability(['zone2']) == 0.5
+        >>> assert day1.probability(['zone3', '3g']) == 0.25
+        """
+        pairs = list(other.items())
+        if pairs:
+            vectors, weights = zip(*pairs)
+            self.eat_many(vectors, weights=weights)
+
+    def dump(self):
+        """
+        Compact binary representation of the distribution, see `load`
+
+        >>> ad = ArrayDistribution()
+        >>> ad.eat_many([['zone1', 'dsl'], ['zone1', '3g'], ['zone2', None]])
+        >>> loaded = ArrayDistribution.load(ad.dump())
+        >>> assert sorted(loaded.items()) == sorted(ad.items())
+        >>> assert loaded.probability(['zone1', '3g']) == ad.probability(['zone1', '3g'])
+        """
+        keys, nodes = array('L', self.children.iterkeys()), array('L', self.children.itervalues())
+        return zlib.compress(pickle.dumps((self.dimensions, self.values, self.counts.tostring(), self._depths.tostring(),
+                                           keys.tostring(), nodes.tostring()), pickle.HIGHEST_PROTOCOL))
+
+    @classmethod
+    def load(cls, data):
+        dimensions, values, counts, depths, keys, nodes = pickle.loads(zlib.decompress(data))
+
+        distribution = cls()
+        if dimensions is not None:
+            distribution._set_dimensions(dimensions)
+            distribution.values = values
+            distribution.codes = [dict((value, code) for code, value in enumerate(dimension_values)) for dimension_values in values]
+        distribution.counts = array('L', counts)
+        distribution._depths = array('B', depths)
+        distribution.children = dict(izip(array('L', keys), array('L', nodes)))
+        return distribution
+
+    def random_vec(self):
+        """
+        Generates random vector from given distribution
+
+        >>> ad = ArrayDistribution()
+        >>> assert ad.random_vec() == []
+        >>> ad.eat_many([['a', 'b'], ['a', 'b'], ['a', 'a'], ['c', 'a'], ['c', 'b'], ['b', 'c']])
+        >>> v1 = ad.random_vec()
+        >>> assert len(v1) == 2
+        >>> assert tuple(v1) in [('a', 'b'), ('a', 'a'), ('c', 'a'), ('c', 'b'), ('b', 'c')]
+        """
+        vec = []
+        node = 0
+        for d in xrange(self.dimensions or 0):
+            if self.counts[node] == 0:
+                break
+            codes, cumulative, nodes = self._children_of(node, d)
+            i = bisect_right(cumulative, random.randint(0, cumulative[-1] - 1))
+            vec.append(self.values[d][codes[i]])
+            node = nodes[i]
+        return vec
+
+    def probability(self, vec):
+        """
+        Absolute probability of the `vec` or of its longest prefix found in the distribution
+        (see `MultiDimensionDistribution.probability`).
+
+        >>> ad = ArrayDistribution()
+        >>> ad.eat_many([['a', 'b'], ['a', 'b'], ['a', 'a'], ['c', 'a'], ['c', 'b'], ['b', 'c'], ['b', 'a'], ['a', 'b'], ['a', 'b'], ['a', 'a'], ['a', 'a'], ['a', 'a']])
+        >>> assert ad.probability(['a']) == 8.0 / 12.0
+        >>> assert ad.probability(['a', 'a']) == 4.0 / 12.0
+        >>> assert ad.probability(['b', 'c']) == 1.0 / 12.0
+        >>> assert ad.probability(['e']) == 0
+        >>> assert ad.probability(['a', 'd']) == 8.0 / 12.0
+        """
+        return self.probabilities((vec,))[0]
+
+    def probabilities(self, vectors):
+        """
+        Probabilities of every vector of `vectors` as `array` of doubles
+
+        >>> ad = ArrayDistribution()
+        >>> ad.eat_many([['zone1', 'dsl'], ['zone1', '3g'], ['zone2', 'dsl'], ['zone2', 'dsl']])
+        >>> assert list(ad.probabilities([['zone1', 'dsl'], ['zone2', 'dsl'], ['zone3', 'dsl'], ['zone2', '3g']])) == [0.25, 0.5, 0.0, 0.5]
+        """
+        result = array('d')
+        total = float(self.counts[0])
+        if total == 0:
+            result.extend([0.0] * len(vectors))
+            return result
+
+        counts, children, codes = self.counts, self.children, self.codes
+        for vec in vectors:
+            node = 0
+            for d, value in enumerate(vec[:self.dimensions]):
+                code = codes[d].get(value, None)
+                child = None if code is None else children.get((node << self.CODE_BITS) | code, None)
+                if child is None:
+                    break
+                node = child
+            result.append(counts[node] / total if node else 0.0)
+        return result
+
+    def _set_dimensions(self, dimensions):
+        self.dimensions = dimensions
+        self.codes = [{} for d in xrange(dimensions)]
+        self.values = [[] for d in xrange(dimensions)]
+
+    def _encode(self, d, value):
+        code = self.codes[d].get(value, None)
+        if code is None:
+            code = self.codes[d][value] = len(self.values[d])
+            self.values[d].append(value)
+        return code
+
+    def _children_of(self, node, d):
+        cached = self._cumulative.get(node, None)
+        if cached is not None:
+            return cached
+
+        # one pass over all edges builds children of every node of the same depth
+        by_parent = {}
+        mask = (1 << self.CODE_BITS) - 1
+        for key, child in self.children.iteritems():
+            if self._depths[child] == d + 1:
+                by_parent.setdefault(key >> self.CODE_BITS, []).append((key & mask, child))
+
+        for parent, edges in by_parent.iteritems():
+            edges.sort()
+            codes, cumulative, nodes = array('L'), array('L'), array('L')
+            acc = 0
+            for code, child in edges:
+                acc += self.counts[child]
+                codes.append(code)
+                cumulative.append(acc)
+                nodes.append(child)
+            self._cumulative[parent] = (codes, cumulative, nodes)
+
+        return self._cumulative[node]
+
+
+
+CONVERSION = 'conv'
+NO_CONVERSION = 'noconv'
+
+# hits are joined with conversions by external id and grouped by offer, dimensions and outcome
+OFFER_MODELS_SQL = """
+SELECT destination, {dimension_columns}, if(converted = 1, '{conversion}', '{no_conversion}') AS outcome, count() AS weight
+FROM {db}.hits
+ANY LEFT JOIN (SELECT external_id AS dim_external_id, toUInt8(1) AS converted FROM {db}.conversions) USING dim_external_id
+{where}
+GROUP BY destination, {dimension_columns}, outcome
+"""
+
+
+class OfferModels(object):
+    """
+    Distributions of hits per offer: values of `dimensions` followed by the outcome
+    of a hit (`conv` or `noconv`), stored in `ArrayDistribution`s.
+
+    Models are trained from reporting storage with `train_offer_models` or from Redis fixture
+    with `train_offer_models_from_fixture`, saved into a compact binary file and merged,
+    e.g. to combine models trained on different days.
+
+    >>> models = OfferModels(dimensions=['zone', 'connection_type'])
+    >>> models.eat(1, ['847358', 'MOBILE', CONVERSION])
+    >>> models.eat(1, ['847358', 'MOBILE', NO_CONVERSION], weight=3)
+    >>> models.eat(2, ['813021', 'BROADBAND', NO_CONVERSION])
+    >>> assert models.offers() == [1, 2]
+    >>> assert models.probability(1, {'dimensions.zone': '847358', 'dimensions.connection_type': 'MOBILE'}) == 0.25
+    >>> assert models.probability(2, {'dimensions.zone': '847358'}) == 0.0
+    """
+    def __init__(self, dimensions):
+        self.dimensions = list(dimensions)
+        self.models = {}
+
+    def offers(self):
+        return sorted(self.models.keys())
+
+    def model(self, offer):
+        model = self.models.get(offer, None)
+        if model is None:
+            model = self.models[offer] = ArrayDistribution()
+        return model
+
+    def eat(self, offer, vec, weight=1):
+        self.model(offer).eat(vec, weight=weight)
+
+    def vector(self, sample, outcome=CONVERSION):
+        """ Vector of flat sample (see `simulator.flat_items`) """
+        return [sample.get('dimensions.' + d, None) for d in self.dimensions] + [outcome]
+
+    def probability(self, offer, sample):
+        """ Probability of the hit described by flat `sample` to be converted by `offer` """
+        return self.model(offer).probability(self.vector(sample, CONVERSION))
+
+    def merge(self, other):
+        """
+        >>> day1, day2 = OfferModels(['zone']), OfferModels(['zone'])
+        >>> day1.eat(1, ['847358', NO_CONVERSION])
+        >>> day2.eat(1, ['847358', CONVERSION])
+        >>> day2.eat(2, ['813021', CONVERSION])
+        >>> day1.merge(day2)
+        >>> assert day1.offers() == [1, 2]
+        >>> assert day1.probability(1, {'dimensions.zone': '847358'}) == 0.5
+        """
+        if other.dimensions != self.dimensions:
+            raise Exception("Unable to merge models of different dimensions: {a} and {b}".format(a=self.dimensions, b=other.dimensions))
+        for offer, model in other.models.items():
+            self.model(offer).merge(model)
+
+    def save(self, path):
+        data = pickle.dumps((self.dimensions, dict((offer, model.dump()) for offer, model in self.models.items())),
+                            pickle.HIGHEST_PROTOCOL)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            dimensions, dumps = pickle.loads(f.read())
+
+        models = cls(dimensions)
+        models.models = dict((offer, ArrayDistribution.load(dump)) for offer, dump in dumps.items())
+        return models
+
+
+def train_offer_models(db, dimensions, date_from=None, date_to=None):
+    """
+    Trains models of offers from hits and conversions in reporting storage `db`
+    with a single aggregate query. Hits could be limited by dates of click, inclusive.
+    """
+    conditions = []
+    if date_from is not None:
+        conditions.append("toDate(time) >= '{date}'".format(date=date_from.strftime('%Y-%m-%d')))
+    if date_to is not None:
+        conditions.append("toDate(time) <= '{date}'".format(date=date_to.strftime('%Y-%m-%d')))
+
+    dimension_columns = ['dim_%s' % d for d in dimensions]
+    sql = OFFER_MODELS_SQL.format(db=db.name,
+                                  dimension_columns=', '.join(dimension_columns),
+                                  conversion=CONVERSION,
+                                  no_conversion=NO_CONVERSION,
+                                  where=('WHERE ' + ' AND '.join(conditions)) if conditions else '')
+
+    result = db.read_columns(sql=sql)
+
+    models = OfferModels(dimensions)
+    vectors = izip(*([result[column] for column in dimension_columns] + [result['outcome']]))
+    for offer, vec, weight in izip(result['destination'], vectors, result['weight']):
+        models.eat(offer, list(vec), weight=weight)
+    return models
+
+
+def train_offer_models_from_fixture(fixture_data, dimensions):
+    """
+    Trains models of offers from hits and conversions of Redis fixture
+
+    >>> fixture_data = {}
+    >>> fixture_data['Hits:[0]'] = '{"destination_id":"Offer:[2]","dimensions":{"zone":"847358","external_id":"c0xg"}}'
+    >>> fixture_data['Hits:[1]'] = '{"destination_id":"Offer:[2]","dimensions":{"zone":"847358","external_id":"c0xv"}}'
+    >>> fixture_data['Hits:_counter'] = '2'
+    >>> fixture_data['Conversions:[0]'] = '{"external_id":"c0xg","revenue":{"value":6000,"currency":"USD"}}'
+    >>> models = train_offer_models_from_fixture(fixture_data, ['zone'])
+    >>> assert models.offers() == [2]
+    >>> assert models.probability(2, {'dimensions.zone': '847358'}) == 0.5
+    """
+    hits = [json.loads(value) for key, value in fixture_data.items() if key.startswith('Hits') and '_counter' not in key]
+    converted = set([json.loads(value)['external_id'] for key, value in fixture_data.items() if key.startswith('Conversion') and '_counter' not in key])
+    return _train_offer_models(hits, converted, dimensions)
+
+
+def train_offer_models_from_snapshot(path, dimensions):
+    """
+    Trains models of offers from hits and conversions of Redis snapshot (see `testtools.snapshots`)
+    in two passes, so only external ids of conversions are kept in memory
+
+    >>> import os, tempfile
+    >>> fd, path = tempfile.mkstemp(suffix='.jsonl')
+    >>> for key, value in [('Hits:[0]', {'destination_id': 'Offer:[2]', 'dimensions': {'zone': '847358', 'external_id': 'c0xg'}}), \
+                           ('Hits:[1]', {'destination_id': 'Offer:[2]', 'dimensions': {'zone': '847358', 'external_id': 'c0xv'}}), \
+                           ('Hits:_counter', 2), \
+                           ('Conversions:[0]', {'external_id': 'c0xg', 'revenue': {'value': 6000, 'currency': 'USD'}})]:
+    ...     n = os.write(fd, json.dumps({'key': key, 'value': json.dumps(value)}) + '\\n')
+    >>> os.close(fd)
+    >>> models = train_offer_models_from_snapshot(path, ['zone'])
+    >>> assert models.offers() == [2]
+    >>> assert models.probability(2, {'dimensions.zone': '847358'}) == 0.5
+    >>> os.remove(path)
+    """
+    converted = set(conversion['external_id'] for conversion in samples_from_snapshot(path, entity='Conversions'))
+    return _train_offer_models(samples_from_snapshot(path, entity='Hits'), converted, dimensions)
+
+
+def _train_offer_models(hits, converted, dimensions):
+    models = OfferModels(dimensions)
+    for hit in hits:
+        hit = dict(flat_items(hit))
+        outcome = CONVERSION if hit.get('dimensions.external_id', None) in converted else NO_CONVERSION
+        models.eat(_offer_idx(hit['destination_id']), models.vector(hit, outcome))
+    return models
+
+
+def _offer_idx(key):
+    """
+    >>> assert _offer_idx('Offer:[12]') == 12
+    """
+    return int(key.split('[', 1)[1].rstrip(']'))
+
 if __name__ == '__main__':
     import doctest
     doctest.testmod()
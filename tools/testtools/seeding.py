@@ -0,0 +1,78 @@
+'''
+Fast seeding of Majorka storage for tests and benchmarks.
+
+`Seed` creates offers and campaigns like `MajorkaFixture` does, but writes them straight into Redis
+with a single pipeline instead of calling `majorka-cli` for every object. With `synthetic_hits`
+it loads millions of hits for import and report benchmarks in seconds.
+'''
+import random
+
+
+HIT_TEMPLATE = '{"time":{"secs_since_epoch":%d,"nanos_since_epoch":%d},"campaign_id":"Campaign:[%d]","destination_id":"Offer:[%d]","click_id":"%d","cost":{"value":%d,"currency":"USD"},"dimensions":{"useragent":"Mozilla/5.0 (Linux; Android 8.0.0; SM-A750FN) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/72.0.3626.105 Mobile Safari/537.36","ua_category":"smartphone","external_id":"s%x","os":"Android","os_version":"8.0.0","connection_type":"%s","langcode":"%s","ua_type":"browser","keywords":"","language":"en-GB,en-US;q=0.9,en;q=0.8","ua_vendor":"Google","zone":"%d","ip":"127.0.0.1","creative_id":"","ua_name":"Chrome","ua_version":"72.0.3626.105"}}'
+
+CONNECTION_TYPES = ('BROADBAND', 'MOBILE')
+LANGCODES = ('en-GB', 'en-US', 'ru-RU', 'el-GR', 'de-DE')
+
+
+class Seed(object):
+    '''
+    Creates objects of Majorka storage with `BulkWriter` (see `Connection.bulk_writer`).
+    Objects are written on `flush` or at the end of `with` block.
+    '''
+    def __init__(self, writer):
+        self.writer = writer
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_val, trace):
+        if exception_type is None:
+            self.flush()
+        return False
+
+    def create_offer(self, name, url):
+        return self.writer.append('Offer', {
+            'name': name,
+            'url_template': url
+        })
+
+    def create_campaign(self, name, alias, offer_ids, optimize=True, hit_limit=50, slice=('zone',)):
+        idx = self.writer.append('Campaign', {
+            'name': name,
+            'alias': alias,
+            'offers': ['Offer:[%s]' % offer_id for offer_id in offer_ids],
+            'paused_offers': [],
+            'optimize': optimize,
+            'optimization_paused': False,
+            'hit_limit_for_optimization': int(hit_limit),
+            'slicing_attrs': list(slice)
+        })
+        self.writer.set('Campaign:by_alias:%s' % alias, 'Campaign:[%s]' % idx)
+        return idx
+
+    def create_hits(self, hits):
+        ''' Appends `hits` (dictionaries or JSON strings, see `synthetic_hits`), returns the number of them '''
+        return self.writer.extend('Hits', hits)
+
+    def flush(self):
+        self.writer.flush()
+
+
+def synthetic_hits(count, campaign=0, offers=(0,), zones=1000, since=1550532553, rate=100, seed=0):
+    """
+    Generates JSON of `count` hits of `campaign` distributed over `offers` and `zones`,
+    `rate` hits per second since `since` seconds since epoch
+
+    >>> import json
+    >>> hits = [json.loads(hit) for hit in synthetic_hits(3, campaign=1, offers=(2,))]
+    >>> assert [hit['campaign_id'] for hit in hits] == ['Campaign:[1]'] * 3
+    >>> assert [hit['destination_id'] for hit in hits] == ['Offer:[2]'] * 3
+    >>> assert len(set(hit['click_id'] for hit in hits)) == 3
+    """
+    rng = random.Random(seed)
+    step = 1000000000 / rate
+    for i in xrange(count):
+        nanos = i * step
+        yield HIT_TEMPLATE % (since + nanos / 1000000000, nanos % 1000000000,
+                              campaign, rng.choice(offers), 121507283048865792 + i, rng.randint(50, 300), i,
+                              rng.choice(CONNECTION_TYPES), rng.choice(LANGCODES), 800000 + rng.randrange(zones))
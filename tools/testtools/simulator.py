@@ -1,11 +1,24 @@
 import json
+import random
+import threading
+from calendar import timegm
+from collections import Counter
 from itertools import cycle
+from Queue import Queue
 from requests import Request, Session
 import time
 
 from copy import deepcopy
+from furl import furl
 
 from testtools import MajorkaFixture
+from testtools.load import LoadResult
+from testtools.snapshots import read_snapshot
+
+
+SKIP_KEYS = ('time', 'campaign_id', 'destination_id', 'click_id', 'dimensions.external_id')
+
+_STOP = object()  # tells replay worker to exit
 
 
 class RequestFactory(object):
@@ -61,13 +74,18 @@ def replace_placeholders_in_url(url, values):
 
 
 class BasicTrafficSampler(object):
-    def __init__(self, base_url, samples, state=-1, req_factory=None,
-                 skip_keys=('time', 'campaign_id', 'destination_id', 'click_id', 'dimensions.external_id')):
-        self._provided_samples = list(samples)
+    def __init__(self, base_url, samples, state=-1, req_factory=None, skip_keys=SKIP_KEYS):
         self.skip_keys = skip_keys
         self.state = int(state)
 
-        self.samples_pool = cycle(self._provided_samples)
+        if iter(samples) is samples:
+            # one-shot iterator could be walked only once, so it is kept in memory
+            self._provided_samples = list(samples)
+            self.samples_pool = cycle(self._provided_samples)
+        else:
+            # lists and `LazySamples` are walked over again and again
+            self._provided_samples = samples
+            self.samples_pool = endless(samples)
 
         # RTFM: http://docs.python-requests.org/en/master/user/advanced/#request-and-response-objects
         self.session = Session()
@@ -100,60 +118,266 @@ class BasicTrafficSampler(object):
             raise ValueError("Cannot forward `back`. New state is < than current")
 
     def clean_sample(self, sample):
-        # return dict(filter(lambda (k, v): k not in self.skip_keys, flat_items(sample)))
-        return dict([(k,v) for k, v in flat_items(sample) if k not in self.skip_keys])
+        return clean_sample(sample, self.skip_keys)
 
     def get_state():
         return self.state
 
 
-# class Simulator(object):
-#     ALIAS = 'simulated-alias'
-#
-#     def __init__(self, majorka_fixture, offers_models, traffic_sampler):
-#         self.majorka = majorka_fixture
-#         self.offers = offers_models
-#         self.offer_ids = []
-#         self.offers_count = len(offers_models)
-#         self.sampler = traffic_sampler
-#
-#         self.hits_counter = 0
-#
-#     def setup(self):
-#         self._build_campaign()
-#         self._build_offers()
-#
-#     def run(self):
-#         req = hit = self.sampler.next()
-#         res = self.sampler.send(req)
-#
-#         loc = furl(res.headers['Location'])
-#         offer_num = int(loc.host.split('http://test-url-')[1].split('.com',1)[0])
-#         external_id = loc.args.get('external_id')
-#
-#         self.hits_counter += 1
-#
-#         offer_model = self.offers[offer_num]
-#
-#         if offer_model.convert_or_not(hit):
-#             self.postback()
-#
-#     def postback(self):
-#         pass
-#         # requests.send('POST', # todo
-#
-#         # ....
-#
-#     def _build_campaign(self):
-#         self.majorka.create_campaign(name='Simulated campaign',
-#                                      alias=Simulator.ALIAS,
-#                                      offer_ids=self.offer_ids)
-#     def _build_offers(self):
-#         for i in range(self.offers_count):
-#             self.offer_ids += [
-#                 self.majorka.create_offer(name='Simulated offer N{i}'.format(i=i),
-#                                           url=('http://test-url-{i}'.format(i=i)) + '.com/?external_id={external_id}')
-#             ]
+class ReplayResult(LoadResult):
+    def __init__(self, sent, errors, statuses, elapsed, latencies, conversions):
+        super(ReplayResult, self).__init__(sent, errors, statuses, elapsed, latencies)
+        self.conversions = conversions
+
+    def summary(self):
+        return "{load}; {conversions} conversions".format(load=super(ReplayResult, self).summary(), conversions=self.conversions)
+
+
+class TrafficReplay(object):
+    """
+    Replays `samples` (see `samples_from_fixture` and `samples_from_reporting`) against campaign `base_url`.
+
+    Requests are sent by a pool of `workers` threads, each with its own session, at a constant
+    `rate` per second or, with `speedup`, following original spacing of samples in time
+    divided by `speedup` (samples should be ordered by time, see `sample_time`). Without both
+    of them samples are sent as fast as workers manage.
+
+    If `offer_models` (see `models.OfferModels`) are provided, every click is converted with
+    probability given by the model of its offer through `majorka.postback_url`. Offer of a click
+    is `offer_ids[N]`, where N is the number of offer from its `http://test-url-N.com/` location.
+    Samples which can't be sent are counted as errors.
+
+    >>> samples = [{'dimensions': {'zone': '1'}}, 'garbage', None]
+    >>> result = TrafficReplay('http://127.0.0.1:1/alias?zone={zone}', samples, workers=1).run()
+    >>> assert (result.sent, result.errors, result.statuses['failed']) == (1, 3, 3)
+    """
+    def __init__(self, base_url, samples, workers=8, rate=None, speedup=None,
+                 offer_models=None, offer_ids=None, majorka=None, revenue='0.06', currency='usd',
+                 skip_keys=SKIP_KEYS, timeout=5):
+        if rate and speedup:
+            raise Exception("Either `rate` or `speedup` could be set, not both.")
+        if offer_models is not None and (offer_ids is None or majorka is None):
+            raise Exception("`offer_ids` and `majorka` are required to drive conversions by offer models.")
+
+        self.request_factory = RequestFactory(base_url=base_url)
+        self.samples = samples
+        self.workers = workers
+        self.rate = rate
+        self.speedup = speedup
+        self.offer_models = offer_models
+        self.offer_ids = offer_ids
+        self.majorka = majorka
+        self.revenue = revenue
+        self.currency = currency
+        self.skip_keys = skip_keys
+        self.timeout = timeout
+
+    def run(self):
+        tasks = Queue(maxsize=self.workers * 2)
+        workers = [_ReplayWorker(self, tasks) for n in xrange(self.workers)]
+        for worker in workers:
+            worker.start()
+
+        started = time.time()
+        try:
+            for offset, sample in schedule(self.samples, rate=self.rate, speedup=self.speedup):
+                delay = started + offset - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+                tasks.put(sample)
+        finally:
+            for worker in workers:
+                tasks.put(_STOP)
+            for worker in workers:
+                worker.join()
+        elapsed = time.time() - started
+
+        statuses = Counter()
+        latencies = []
+        for worker in workers:
+            statuses.update(worker.statuses)
+            latencies.extend(worker.latencies)
+
+        return ReplayResult(sent=sum([worker.sent for worker in workers]),
+                            errors=sum([worker.errors for worker in workers]),
+                            statuses=statuses,
+                            elapsed=elapsed,
+                            latencies=latencies,
+                            conversions=sum([worker.conversions for worker in workers]))
+
+    def convert_or_not(self, location, sample):
+        """ Returns external id of the click to convert or None """
+        if self.offer_models is None:
+            return None
+
+        loc = furl(location)
+        offer_num = int(str(loc).split('http://test-url-', 1)[1].split('.com', 1)[0])
+        if random.random() <= self.offer_models.probability(self.offer_ids[offer_num], sample):
+            return loc.args['external_id']
+        return None
+
+
+class _ReplayWorker(threading.Thread):
+    def __init__(self, replay, tasks):
+        super(_ReplayWorker, self).__init__()
+        self.daemon = True
+        self.replay = replay
+        self.tasks = tasks
+        self.session = Session()
+
+        self.sent = self.errors = self.conversions = 0
+        self.statuses = Counter()
+        self.latencies = []
+
+    def run(self):
+        while True:
+            sample = self.tasks.get()
+            if sample is _STOP:
+                return
+
+            # worker has to stay alive whatever the sample is, otherwise producer blocks on the full queue
+            try:
+                self.replay_sample(sample)
+            except Exception:
+                self.errors += 1
+                self.statuses['failed'] += 1
+
+    def replay_sample(self, sample):
+        replay = self.replay
+        sample = clean_sample(sample, replay.skip_keys)
+        request = self.session.prepare_request(replay.request_factory.create_request_from_sample(sample))
+
+        self.sent += 1
+        started = time.time()
+        try:
+            response = self.session.send(request, allow_redirects=False, timeout=replay.timeout)
+        finally:
+            self.latencies.append(time.time() - started)
+
+        self.statuses[response.status_code] += 1
+        if response.status_code != 302:
+            self.errors += 1
+            return
+
+        try:
+            external_id = replay.convert_or_not(response.headers['Location'], sample)
+            if external_id is not None:
+                postback_url = replay.majorka.postback_url(external_id, revenue=replay.revenue, currency=replay.currency)
+                if self.session.get(str(postback_url), timeout=replay.timeout).status_code == 200:
+                    self.conversions += 1
+                else:
+                    self.errors += 1
+        except Exception:
+            self.errors += 1
+
+
+def schedule(samples, rate=None, speedup=None):
+    """
+    Generates (offset in seconds since start, sample) for every sample
+
+    >>> samples = [{'time': {'secs_since_epoch': 1550532542, 'nanos_since_epoch': 0}}, \
+                   {'time': {'secs_since_epoch': 1550532544, 'nanos_since_epoch': 500000000}}, \
+                   {'time': {'secs_since_epoch': 1550532553, 'nanos_since_epoch': 0}}]
+    >>> assert [offset for offset, sample in schedule(samples, rate=4)] == [0.0, 0.25, 0.5]
+    >>> assert [offset for offset, sample in schedule(samples, speedup=2)] == [0.0, 1.25, 5.5]
+    >>> assert [offset for offset, sample in schedule(samples)] == [0.0, 0.0, 0.0]
+    """
+    first = None
+    for i, sample in enumerate(samples):
+        if rate:
+            offset = i / float(rate)
+        elif speedup:
+            t = sample_time(sample)
+            first = t if first is None else first
+            offset = max(t - first, 0.0) / speedup
+        else:
+            offset = 0.0
+        yield offset, sample
+
+
+def sample_time(sample):
+    """
+    Time of the click of sample, seconds since epoch
+
+    >>> assert sample_time({'time': {'secs_since_epoch': 1550532553, 'nanos_since_epoch': 500000000}}) == 1550532553.5
+    """
+    t = sample['time']
+    return t['secs_since_epoch'] + t.get('nanos_since_epoch', 0) / 1e9
+
+
+def samples_from_reporting(db, where=None, limit=None):
+    """
+    Generates samples of hits stored in reporting storage `db`, ordered by time of click.
+    Samples have the same structure as those of `samples_from_fixture`, `cost.value` is in
+    currency units as expected by campaign URL.
+    """
+    sql = "SELECT * FROM {db}.hits{where} ORDER BY time{limit}".format(db=db.name,
+                                                                       where=(' WHERE ' + where) if where else '',
+                                                                       limit=(' LIMIT %s' % limit) if limit else '')
+    columns, rows = db.read_typed(sql, stream=True)
+    dimensions = [name for name, type_factory in columns if name.startswith('dim_')]
+
+    for row, i, total in rows:
+        yield {
+            'time': {'secs_since_epoch': timegm(row['time'].timetuple()), 'nanos_since_epoch': 0},
+            'campaign_id': 'Campaign:[%s]' % row['campaign'],
+            'destination_id': 'Offer:[%s]' % row['destination'],
+            'click_id': row['click_id'],
+            'cost': {'value': str(row['cost']), 'currency': 'usd'},
+            'dimensions': dict((name[len('dim_'):], row[name]) for name in dimensions)
+        }
+
+
+class LazySamples(object):
+    """
+    Samples which could be walked over many times without keeping them in memory:
+    every iteration calls `factory` for a fresh generator of samples, i.e.
+
+        LazySamples(lambda: with_cost(filter_dimension(samples_from_snapshot(path), 'zone', ('', 'AB_TEST',)), value='0.005'))
+
+    >>> samples = LazySamples(lambda: (i * i for i in xrange(3)))
+    >>> assert list(samples) == [0, 1, 4]
+    >>> assert list(samples) == [0, 1, 4]
+    """
+    def __init__(self, factory):
+        self.factory = factory
+
+    def __iter__(self):
+        return iter(self.factory())
+
+
+def endless(samples):
+    """
+    Repeats samples walking over them again and again, stops if there are no samples
+
+    >>> pool = endless([1, 2])
+    >>> assert [next(pool) for i in xrange(5)] == [1, 2, 1, 2, 1]
+    >>> assert list(endless([])) == []
+    """
+    while True:
+        empty = True
+        for sample in samples:
+            empty = False
+            yield sample
+        if empty:
+            return
+
+
+def samples_from_snapshot(path, entity='Hits'):
+    """
+    Generates samples of `entity` from snapshot of Redis (see `testtools.snapshots`) one by one
+
+    >>> import os, tempfile
+    >>> fd, path = tempfile.mkstemp(suffix='.jsonl')
+    >>> os.write(fd, json.dumps({'key': 'Hits:[0]', 'value': json.dumps({'dimensions': {'zone': '847358'}})}) + '\\n')
+    73
+    >>> os.close(fd)
+    >>> assert list(samples_from_snapshot(path)) == [{'dimensions': {'zone': '847358'}}]
+    >>> os.remove(path)
+    """
+    for key, value in read_snapshot(path, prefix='%s:' % entity):
+        if '_counter' not in key:
+            yield json.loads(value)
 
 
 def flat_items(d, key_separator='.'):
@@ -171,6 +395,14 @@ def flat_items(d, key_separator='.'):
         else:
             yield k, v
 
+def clean_sample(sample, skip_keys=SKIP_KEYS):
+    """
+    Flat sample without `skip_keys`
+
+    >>> assert clean_sample({'click_id': 'a1ec6d5', 'dimensions': {'zone': '847358', 'external_id': 'c0xg'}}) == {'dimensions.zone': '847358'}
+    """
+    return dict([(k,v) for k, v in flat_items(sample) if k not in skip_keys])
+
 def samples_from_fixture(fixture_data):
     """
     >>> fixture_data = {}
@@ -232,12 +464,14 @@ def filter_dimension(hits, dimension, bad_values):
                 {"time":{"secs_since_epoch":1550580200,"nanos_since_epoch":716646242},"campaign_id":"Campaign:[0]","destination_id":"Offer:[2]","click_id":"121367091113627648","cost":{"value":103,"currency":"USD"},"dimensions":{"keywords":"","connection_type":"MOBILE","external_id":"cuvt","creative_id":"","zone":"AB_TEST","useragent":"ApacheBench/2.3","ip":"127.0.0.1"}} \
                 ]
     >>> assert len(hits) == 3
-    >>> filtered = filter_dimension(hits, 'connection_type', ('XDSL',))
+    >>> filtered = list(filter_dimension(hits, 'connection_type', ('XDSL',)))
     >>> assert len(filtered) == 3
-    >>> filtered = filter_dimension(hits, 'connection_type', ('MOBILE',))
+    >>> filtered = list(filter_dimension(hits, 'connection_type', ('MOBILE',)))
     >>> assert len(filtered) == 0
     """
-    return [hit for hit in hits if not hit[u'dimensions'][dimension] in bad_values]
+    for hit in hits:
+        if not hit[u'dimensions'][dimension] in bad_values:
+            yield hit
 
 
 if __name__ == "__main__":
@@ -0,0 +1,73 @@
+'''
+Snapshots of Redis keyspace for tests and traffic simulation.
+
+Snapshot is a line-delimited JSON file with `{"key": ..., "value": ...}` object on every line,
+compressed with gzip if the name of file ends with `.gz`. It is written key by key with
+`SCAN` and pipelined `MGET` and read back lazily, so neither side holds the keyspace in memory.
+'''
+import gzip
+import json
+from itertools import islice
+
+
+def open_snapshot(path, mode='rb'):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+def dump_keyspace(connection, output, match=None, batch_size=1000, pipeline_depth=10):
+    """
+    Writes string keys of Redis `connection` matching `match` pattern into file-like `output`.
+    Keys are scanned by `batch_size` and their values are read with one `MGET` per batch,
+    `pipeline_depth` of them per round trip. Keys of other types are skipped.
+    Returns the number of keys written.
+    """
+    keys = connection.scan_iter(match=match, count=batch_size)
+    written = 0
+    while True:
+        batches = [batch for batch in (list(islice(keys, batch_size)) for i in xrange(pipeline_depth)) if batch]
+        if not batches:
+            return written
+
+        pipe = connection.pipeline(transaction=False)
+        for batch in batches:
+            pipe.mget(batch)
+
+        for batch, values in zip(batches, pipe.execute()):
+            for key, value in zip(batch, values):
+                if value is None:
+                    continue
+                output.write(json.dumps({'key': key, 'value': value}))
+                output.write('\n')
+                written += 1
+
+
+def read_snapshot(path, prefix=None):
+    """
+    Generates (key, value) pairs of snapshot at `path`, only of keys starting with `prefix` if set
+
+    >>> import os, tempfile
+    >>> fd, path = tempfile.mkstemp(suffix='.jsonl.gz')
+    >>> os.close(fd)
+    >>> f = open_snapshot(path, 'wb')
+    >>> f.write('{"key": "Hits:[0]", "value": "{}"}\\n{"key": "Hits:_counter", "value": "1"}\\n{"key": "Offer:[0]", "value": "{}"}\\n')
+    110
+    >>> f.close()
+    >>> assert list(read_snapshot(path, prefix='Hits')) == [('Hits:[0]', '{}'), ('Hits:_counter', '1')]
+    >>> assert len(fixture_data_from_snapshot(path)) == 3
+    >>> os.remove(path)
+    """
+    with open_snapshot(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            key = item['key'].encode('utf-8')
+            if prefix is None or key.startswith(prefix):
+                yield key, item['value'].encode('utf-8')
+
+
+def fixture_data_from_snapshot(path, prefix=None):
+    ''' Snapshot as `fixture_data` dictionary of key values like those generated by `_prepare_bus_fixture.py` '''
+    return dict(read_snapshot(path, prefix=prefix))
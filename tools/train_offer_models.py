@@ -0,0 +1,35 @@
+from datetime import datetime
+
+import click
+
+from testtools.models import OfferModels, train_offer_models
+
+
+DEFAULT_DIMENSIONS = 'zone,connection_type,langcode'
+
+
+@click.command()
+@click.option('--ch-url', envvar='CH_URL', required=True, help='Clickhouse URL, i.e. http://192.168.9.39:8123/. You can use CH_URL environmental variable to set this parameter.')
+@click.option('--dimensions', default=DEFAULT_DIMENSIONS, help='Comma separated dimensions of hits to model')
+@click.option('--date-from', help='First day of clicks to train on, YYYY-MM-DD')
+@click.option('--date-to', help='Last day of clicks to train on, YYYY-MM-DD')
+@click.option('--merge', type=click.Path(exists=True), multiple=True, help='File with models to merge trained ones into, could be repeated')
+@click.argument('output', type=click.Path(), required=True)
+def execute(ch_url, dimensions, date_from, date_to, merge, output):
+    """Trains models of offers on hits and conversions in Clickhouse and saves them into OUTPUT file."""
+    from data.framework.reporting import Database
+
+    d = Database(url=ch_url, db='majorka', data_read_timeout=600)
+
+    parse = lambda day: datetime.strptime(day, '%Y-%m-%d') if day else None
+    models = train_offer_models(d, dimensions.split(','), date_from=parse(date_from), date_to=parse(date_to))
+
+    for path in merge:
+        models.merge(OfferModels.load(path))
+
+    models.save(output)
+    print "Saved models of {count} offers into {output}".format(count=len(models.offers()), output=output)
+
+
+if __name__ == '__main__':
+    execute()